@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""Benchmark GameDownloader end to end against local stand-ins.
+
+Everything the sync normally talks to is replaced by something on this box:
+a local HTTP server serves synthetic zip archives in place of
+downloads.scummvm.org and TSV fixtures in place of the Google Sheets, and the
+"remote" host is either a directory behind ssh/scp shims that run the commands
+locally or, with ``--ssh-target``, a real (e.g. local) sshd. Each configuration
+runs a full sync from an empty remote and reports wall time, bytes/s, the
+ssh/scp processes forked and the requests served by a persistent remote shell,
+so transfer changes can be compared on any Linux machine.
+"""
+
+import argparse
+import contextlib
+import http.server
+import importlib.util
+import json
+import os
+import random
+import shlex
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import helper_gsheet
+from helper_schedule import format_size
+from helper_ssh import SSHHelper
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+DOWNLOADS_HOST = "https://downloads.scummvm.org"
+ARCHIVE_PREFIX = "/frs/demos/bench"
+
+
+@dataclass
+class Profile:
+    """Shape of the synthetic archives: ``games`` zips of ``files`` files of ``file_size`` bytes."""
+
+    games: int
+    files: int
+    file_size: int
+
+
+PROFILES: Dict[str, Profile] = {
+    "many-small": Profile(games=8, files=400, file_size=4 * 1024),
+    "few-large": Profile(games=3, files=4, file_size=16 * 1024 * 1024),
+}
+
+# GameDownloader keyword arguments of each configuration. "default" is the
+# CLI defaults; "serial" approximates the sync before downloads overlapped and
+# small commands shared a remote shell.
+CONFIGS: Dict[str, Dict[str, object]] = {
+    "default": {},
+    "serial": {"download_workers": 1, "persistent_shell": False},
+    "fork-ssh": {"persistent_shell": False},
+    "workers": {"download_workers": 4, "extract_workers": 2, "upload_workers": 2, "ssh_connections": 2},
+    "segmented": {"download_connections": 4},
+    "batch": {"upload_batch": 8},
+    "stream": {"stream_uploads": True},
+    "remote-extract": {"remote_extract": True},
+    "bundle": {"bundle": True},
+    "precompress": {"precompress": True},
+}
+
+# Stand-ins for ssh and scp that run everything on this machine. Master
+# connection handling (-M/-O) is a no-op; commands run through sh with the
+# caller's stdin and stdout so tar streams work as they would over ssh.
+SSH_SHIM = """#!/usr/bin/env python3
+import subprocess, sys
+args = sys.argv[1:]
+i = 0
+while i < len(args) and args[i].startswith("-"):
+    if args[i] in ("-O", "-M", "-MNf"):
+        sys.exit(0)
+    i += 2 if args[i] in ("-p", "-o", "-i", "-S", "-l", "-F", "-E", "-c", "-J") else 1
+command = " ".join(args[i + 1:])
+sys.exit(subprocess.call(["sh", "-c", command]) if command else 0)
+"""
+
+SCP_SHIM = """#!/usr/bin/env python3
+import subprocess, sys
+args = sys.argv[1:]
+i = 0
+paths = []
+while i < len(args):
+    if args[i] in ("-P", "-o", "-i", "-S", "-l", "-F", "-c", "-J"):
+        i += 2
+        continue
+    if not args[i].startswith("-"):
+        paths.append(args[i].split(":", 1)[1] if ":" in args[i] and not args[i].startswith("/") else args[i])
+    i += 1
+sys.exit(subprocess.call(["cp", "-rp"] + paths))
+"""
+
+
+def load_sync_games():
+    """Import sync-games.py, whose file name is not a valid module name."""
+    spec = importlib.util.spec_from_file_location("sync_games", SCRIPTS_DIR / "sync-games.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)  # type: ignore[union-attr]
+    return module
+
+
+def _file_payload(rng: random.Random, size: int) -> bytes:
+    """Half random, half repetitive bytes, so deflate and precompression have realistic work."""
+    random_part = rng.randbytes(size // 2)
+    text = b"ScummVM benchmark line %d\n" % rng.randrange(1000)
+    return random_part + (text * (size // len(text) + 1))[: size - len(random_part)]
+
+
+def build_fixtures(www_dir: Path, profile_name: str, profile: Profile, seed: int = 0) -> Tuple[List[str], int]:
+    """Write the profile's archives under ``www_dir``; returns (game names, total archive bytes)."""
+    rng = random.Random(seed)
+    archive_dir = www_dir / ARCHIVE_PREFIX.lstrip("/")
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    names: List[str] = []
+    total = 0
+    for game in range(profile.games):
+        name = f"bench-{profile_name}-{game:03d}"
+        archive_path = archive_dir / f"{name}.zip"
+        with zipfile.ZipFile(archive_path, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as archive:
+            for index in range(profile.files):
+                archive.writestr(f"{name.upper()}/DATA{index % 8}/FILE{index:04d}.DAT", _file_payload(rng, profile.file_size))
+        names.append(name)
+        total += archive_path.stat().st_size
+    return names, total
+
+
+def sheet_fixtures(names: List[str]) -> Dict[str, str]:
+    """TSV bodies for every sheet ``fetch_sheet_rows`` reads, keyed by sheet id."""
+
+    def tsv(header: List[str], rows: List[List[str]]) -> str:
+        return "\r\n".join("\t".join(row) for row in [header] + rows)
+
+    ids = {name: f"bench:{name}" for name in names}
+    sheet_ids = helper_gsheet.SHEET_IDS
+    return {
+        sheet_ids["compatibility"]: tsv(["id"], [[ids[name]] for name in names]),
+        sheet_ids["platforms"]: tsv(["id", "name"], [["pc", "PC"]]),
+        sheet_ids["game_demos"]: tsv(
+            ["id", "url", "platform", "lang", "description"],
+            [[ids[name], f"{ARCHIVE_PREFIX}/{name}.zip", "pc", "en", f"Benchmark {name}"] for name in names],
+        ),
+        sheet_ids["director_demos"]: tsv(["id", "url"], []),
+        sheet_ids["game_downloads"]: tsv(["id", "url", "name", "category"], []),
+    }
+
+
+class FixtureServer:
+    """Threaded HTTP server for the archives (with Range/ETag support) and the sheets."""
+
+    def __init__(self, www_dir: Path):
+        self.www_dir = www_dir
+        self.sheets: Dict[str, str] = {}
+        self.requests = 0
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format: str, *args: object) -> None:
+                pass
+
+            def do_HEAD(self) -> None:
+                server._serve(self, head=True)
+
+            def do_GET(self) -> None:
+                server._serve(self)
+
+        self._httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fixture-server", daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self) -> "FixtureServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _serve(self, handler: http.server.BaseHTTPRequestHandler, head: bool = False) -> None:
+        self.requests += 1
+        parsed = urllib.parse.urlsplit(handler.path)
+        if parsed.path == "/sheet":
+            gid = urllib.parse.parse_qs(parsed.query).get("gid", [""])[0]
+            body = self.sheets.get(gid)
+            self._respond(handler, 200 if body is not None else 404, (body or "").encode("utf-8"), {}, head)
+            return
+        path = (self.www_dir / urllib.parse.unquote(parsed.path).lstrip("/")).resolve()
+        if self.www_dir.resolve() not in path.parents or not path.is_file():
+            self._respond(handler, 404, b"", {}, head)
+            return
+        info = path.stat()
+        size = info.st_size
+        headers = {"ETag": f'"{info.st_size:x}-{int(info.st_mtime):x}"', "Accept-Ranges": "bytes"}
+        if handler.headers.get("If-None-Match") == headers["ETag"]:
+            self._respond(handler, 304, b"", headers, head=True)
+            return
+        requested = handler.headers.get("Range")
+        if_range = handler.headers.get("If-Range")
+        if requested and requested.startswith("bytes=") and (not if_range or if_range == headers["ETag"]):
+            first, _, last = requested[len("bytes="):].split(",")[0].partition("-")
+            if first:
+                start, end = int(first), min(int(last) if last else size - 1, size - 1)
+            else:
+                start, end = max(0, size - int(last)), size - 1
+            if start >= size:
+                self._respond(handler, 416, b"", {"Content-Range": f"bytes */{size}"}, head)
+                return
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            # Read only the requested slice, so segmented downloads are not charged for the whole file.
+            with open(path, "rb") as handle:
+                handle.seek(start)
+                self._respond(handler, 206, handle.read(end + 1 - start), headers, head)
+            return
+        self._respond(handler, 200, path.read_bytes(), headers, head)
+
+    @staticmethod
+    def _respond(handler: http.server.BaseHTTPRequestHandler, status: int, body: bytes, headers: Dict[str, str], head: bool) -> None:
+        handler.send_response(status)
+        for key, value in headers.items():
+            handler.send_header(key, value)
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        if not head:
+            handler.wfile.write(body)
+
+
+class _RedirectDownloads(urllib.request.HTTPHandler):
+    """Send downloads.scummvm.org requests to the fixture server instead."""
+
+    handler_order = 100
+
+    def __init__(self, base_url: str):
+        super().__init__()
+        self.base_url = base_url
+
+    def https_open(self, req: urllib.request.Request):
+        if req.full_url.startswith(DOWNLOADS_HOST):
+            req.full_url = self.base_url + req.full_url[len(DOWNLOADS_HOST):]
+            return self.http_open(req)
+        return None
+
+
+@contextlib.contextmanager
+def local_stand_ins(server: FixtureServer, bin_dir: Optional[Path]) -> Iterator[None]:
+    """Point the sheets, the archive downloads and (unless ``bin_dir`` is None) ssh/scp at local stand-ins."""
+    saved_sheet_url = helper_gsheet.SHEET_URL
+    saved_path = os.environ.get("PATH", "")
+    helper_gsheet.SHEET_URL = f"{server.base_url}/sheet?output=tsv"
+    urllib.request.install_opener(urllib.request.build_opener(_RedirectDownloads(server.base_url)))
+    if bin_dir is not None:
+        bin_dir.mkdir(parents=True, exist_ok=True)
+        for name, source in (("ssh", SSH_SHIM), ("scp", SCP_SHIM)):
+            shim = bin_dir / name
+            shim.write_text(source, encoding="utf-8")
+            shim.chmod(shim.stat().st_mode | stat.S_IEXEC)
+        os.environ["PATH"] = f"{bin_dir}{os.pathsep}{saved_path}"
+    try:
+        yield
+    finally:
+        helper_gsheet.SHEET_URL = saved_sheet_url
+        urllib.request.install_opener(None)
+        os.environ["PATH"] = saved_path
+
+
+def run_config(sync_games, work_dir: Path, remote: Tuple[str, Optional[str], str, Optional[int]], options: Dict[str, object]) -> Dict[str, object]:
+    """Sync every fixture game into an empty remote with ``options`` and return the measurements."""
+    transport, server, remote_path, port = remote
+    download_dir = work_dir / "download"
+    shutil.rmtree(download_dir, ignore_errors=True)
+    if transport == "local":
+        shutil.rmtree(remote_path, ignore_errors=True)
+        Path(remote_path).mkdir(parents=True)
+    else:
+        # Empty the remote; through the shims this runs locally.
+        quoted = shlex.quote(remote_path)
+        command = SSHHelper(server, port).build_persistent_command()[0] + [str(server), f"rm -rf -- {quoted} && mkdir -p -- {quoted}"]
+        subprocess.run(command, check=True)
+
+    downloader = sync_games.GameDownloader(
+        download_dir=str(download_dir), scp_server=server, scp_path=remote_path, scp_port=port, transport=transport, **options
+    )
+    started = time.monotonic()
+    downloader.refresh_catalog(work_dir / "metadata.json")
+    downloader.open_connection()
+    try:
+        downloader.download_and_process_games([])
+    finally:
+        downloader.close_connection()
+    seconds = time.monotonic() - started
+
+    summary = downloader.metrics.summary()
+    stages = summary["stages"]
+    counters = summary["counters"]
+    downloaded = int(stages.get("download", {}).get("bytes", 0) or stages.get("stream", {}).get("bytes", 0))
+    uploaded = int(stages.get("upload", {}).get("bytes", 0) + stages.get("stream", {}).get("bytes", 0))
+    return {
+        "seconds": round(seconds, 3),
+        "download_bytes": downloaded,
+        "upload_bytes": uploaded,
+        "download_rate": round(downloaded / seconds) if seconds else None,
+        "upload_rate": round(uploaded / seconds) if seconds else None,
+        # Forked ssh/scp (or local) processes and requests answered by an already open remote shell cost very different amounts.
+        "processes": sum(value for name, value in counters.items() if name.endswith("_commands") and name != "shell_commands"),
+        "shell_requests": counters.get("shell_commands", 0),
+        "phases": {name: phase["seconds"] for name, phase in summary["phases"].items()},
+    }
+
+
+def _print_table(results: List[Dict[str, object]]) -> None:
+    header = f"{'profile':<12} {'config':<14} {'wall s':>8} {'down/s':>11} {'up/s':>11} {'processes':>9} {'shell reqs':>10}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        print(
+            f"{result['profile']:<12} {result['config']:<14} {result['seconds']:>8.2f} "
+            f"{format_size(result['download_rate'] or 0) + '/s':>11} {format_size(result['upload_rate'] or 0) + '/s':>11} "
+            f"{result['processes']:>9} {result['shell_requests']:>10}"
+        )
+
+
+def _split(value: str, known: Dict[str, object], kind: str) -> List[str]:
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = [name for name in names if name not in known]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown {kind}: {', '.join(unknown)} (choose from {', '.join(known)})")
+    return names
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark sync-games.py against local stand-ins for the download server, the sheets and the SSH host")
+    parser.add_argument("--profiles", default=",".join(PROFILES), type=lambda value: _split(value, PROFILES, "profile"), help=f"Comma-separated fixture profiles (default: all of {', '.join(PROFILES)})")
+    parser.add_argument("--configs", default=",".join(CONFIGS), type=lambda value: _split(value, CONFIGS, "config"), help=f"Comma-separated configurations (default: all of {', '.join(CONFIGS)})")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply the number of games of every profile")
+    parser.add_argument("--repeat", type=int, default=1, help="Run every configuration this many times and keep the fastest run")
+    parser.add_argument("--ssh-target", metavar="USER@HOST:PATH", help="Upload to a real sshd (e.g. one on localhost) instead of the local ssh/scp shims; everything under PATH is deleted before every run")
+    parser.add_argument("--ssh-port", type=int, help="Port of --ssh-target")
+    parser.add_argument("--transport", choices=["ssh", "local"], default="ssh", help="Publish over ssh (the shims or --ssh-target) or with the local-directory transport (default: ssh)")
+    parser.add_argument("--work-dir", help="Directory for fixtures, downloads and the shim remote (default: a temporary directory, removed afterwards)")
+    parser.add_argument("--json", metavar="FILE", help="Also write the results as JSON ('-' for stdout)")
+    args = parser.parse_args()
+
+    sync_games = load_sync_games()
+    work_dir = Path(args.work_dir) if args.work_dir else Path(tempfile.mkdtemp(prefix="scummvm-sync-bench-"))
+    work_dir.mkdir(parents=True, exist_ok=True)
+    previous_cwd = Path.cwd()
+    # generate_processed_games_json writes games.json into the working directory.
+    os.chdir(work_dir)
+    results: List[Dict[str, object]] = []
+    try:
+        www_dir = work_dir / "www"
+        shims = work_dir / "bin" if args.transport == "ssh" and not args.ssh_target else None
+        with FixtureServer(www_dir) as server, local_stand_ins(server, shims):
+            for profile_name in args.profiles:
+                profile = PROFILES[profile_name]
+                profile = Profile(max(1, round(profile.games * args.scale)), profile.files, profile.file_size)
+                shutil.rmtree(www_dir, ignore_errors=True)
+                names, archive_bytes = build_fixtures(www_dir, profile_name, profile)
+                server.sheets = sheet_fixtures(names)
+                print(f"Profile {profile_name}: {len(names)} games, {profile.files} files each, {format_size(archive_bytes)} of archives", file=sys.stderr)
+                if args.transport == "local":
+                    remote = ("local", None, str(work_dir / "remote"), None)
+                elif args.ssh_target:
+                    ssh_server, _, remote_path = args.ssh_target.partition(":")
+                    remote = ("ssh", ssh_server, remote_path, args.ssh_port)
+                else:
+                    remote = ("ssh", "bench@localhost", str(work_dir / "remote"), None)
+                for config_name in args.configs:
+                    runs = []
+                    for _ in range(max(1, args.repeat)):
+                        runs.append(run_config(sync_games, work_dir, remote, dict(CONFIGS[config_name])))
+                    best = min(runs, key=lambda run: run["seconds"])
+                    results.append({"profile": profile_name, "config": config_name, "games": len(names), "archive_bytes": archive_bytes, **best})
+    finally:
+        os.chdir(previous_cwd)
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    _print_table(results)
+    if args.json:
+        payload = json.dumps(results, indent=2)
+        if args.json == "-":
+            print(payload)
+        else:
+            Path(args.json).write_text(payload + "\n", encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
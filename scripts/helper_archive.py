@@ -0,0 +1,491 @@
+"""Archive helpers: re-emit a zip read from a forward-only stream as a tar stream, size a zip from its central directory, extract a local zip in parallel."""
+from __future__ import annotations
+
+import hashlib
+import re
+import struct
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+import zlib
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Optional, Set, Tuple
+
+CHUNK_SIZE = 256 * 1024
+# Members written with a trailing data descriptor have no size up front; tar
+# needs it, so those are spooled (in memory up to this size, then to disk).
+SPOOL_LIMIT = 64 * 1024 * 1024
+
+_LOCAL_HEADER = struct.Struct("<4sHHHHHIIIHH")
+_CENTRAL_HEADER = struct.Struct("<4sHHHHHHIIIHHHHHII")
+_END_RECORD = struct.Struct("<4sHHHHIIH")
+_ZIP64_END_LOCATOR = struct.Struct("<4sIQI")
+_ZIP64_END_RECORD = struct.Struct("<4sQHHIIQQQQ")
+_CENTRAL_SIGNATURE = b"PK\x01\x02"
+_END_SIGNATURE = b"PK\x05\x06"
+_ZIP64_END_SIGNATURE = b"PK\x06\x06"
+_ZIP64_LOCATOR_SIGNATURE = b"PK\x06\x07"
+# The end record sits in the last 22 bytes plus an archive comment of up to 64 KiB.
+END_SEARCH_SIZE = _END_RECORD.size + 0xFFFF + _ZIP64_END_LOCATOR.size
+_LOCAL_SIGNATURE = b"PK\x03\x04"
+_DESCRIPTOR_SIGNATURE = b"PK\x07\x08"
+_END_SIGNATURES = {b"PK\x01\x02", b"PK\x05\x06", b"PK\x06\x06", b"PK\x06\x07", b"PK\x06\x08"}
+_ZIP64_EXTRA_ID = 0x0001
+_FLAG_ENCRYPTED = 0x01
+_FLAG_DATA_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+_STORED = 0
+_DEFLATED = 8
+
+
+class ZipStreamUnsupported(ValueError):
+    """The zip uses a feature that cannot be decoded without seeking (caller should fall back)."""
+
+
+class ZipStreamCorrupt(ValueError):
+    """The zip is truncated, structurally broken or a member failed its CRC check."""
+
+
+@dataclass
+class ZipStreamMember:
+    name: str
+    method: int
+    flags: int
+    crc: int
+    compressed_size: Optional[int]
+    size: Optional[int]
+    mtime: float
+    zip64: bool
+
+    @property
+    def is_dir(self) -> bool:
+        return self.name.endswith("/")
+
+
+class _PushbackReader:
+    """Forward-only reader with exact reads and the ability to un-read bytes."""
+
+    def __init__(self, stream: BinaryIO):
+        self._stream = stream
+        self._buffer = b""
+        self.bytes_read = 0
+
+    def read(self, size: int) -> bytes:
+        if self._buffer:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+            if len(data) == size:
+                return data
+            more = self._stream.read(size - len(data))
+            self.bytes_read += len(more)
+            return data + more
+        data = self._stream.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def read_exact(self, size: int) -> bytes:
+        parts = []
+        remaining = size
+        while remaining:
+            chunk = self.read(remaining)
+            if not chunk:
+                raise ZipStreamCorrupt("Unexpected end of zip stream")
+            parts.append(chunk)
+            remaining -= len(chunk)
+        return b"".join(parts)
+
+    def unread(self, data: bytes) -> None:
+        if data:
+            self._buffer = data + self._buffer
+
+
+def safe_member_name(name: str) -> str:
+    """Return ``name`` as a relative path inside the extraction folder.
+
+    Like ``ZipFile.extractall``, unsafe parts are dropped instead of failing
+    the archive: leading ``/``, a drive prefix such as ``C:`` and every ``..``
+    component. A name with nothing left (e.g. ``../``) becomes ``""`` and the
+    callers skip that member.
+    """
+    normalized = name.replace("\\", "/")
+    parts = [part for part in normalized.split("/") if part not in ("", ".", "..")]
+    if parts and re.fullmatch(r"[A-Za-z]:", parts[0]):
+        parts = parts[1:]
+    cleaned = "/".join(parts)
+    return cleaned + "/" if normalized.endswith("/") and cleaned else cleaned
+
+
+def central_directory_span(tail: bytes, archive_size: int) -> Optional[Tuple[int, int]]:
+    """Locate the central directory from the last bytes of a zip.
+
+    ``tail`` holds the final ``len(tail)`` bytes of an archive of
+    ``archive_size`` bytes (``END_SEARCH_SIZE`` is always enough). Returns
+    ``(offset, size)`` of the central directory, or None if no end record is
+    found.
+    """
+    index = tail.rfind(_END_SIGNATURE)
+    if index < 0 or index + _END_RECORD.size > len(tail):
+        return None
+    _, _, _, _, entries, size, offset, _ = _END_RECORD.unpack_from(tail, index)
+    if entries == 0xFFFF or size == 0xFFFFFFFF or offset == 0xFFFFFFFF:
+        locator = index - _ZIP64_END_LOCATOR.size
+        if locator < 0 or tail[locator:locator + 4] != _ZIP64_LOCATOR_SIGNATURE:
+            return None
+        record_offset = _ZIP64_END_LOCATOR.unpack_from(tail, locator)[2] - (archive_size - len(tail))
+        if record_offset < 0 or tail[record_offset:record_offset + 4] != _ZIP64_END_SIGNATURE:
+            return None
+        size, offset = _ZIP64_END_RECORD.unpack_from(tail, record_offset)[8:10]
+    return offset, size
+
+
+def central_directory_extracted_size(directory: bytes) -> int:
+    """Sum the uncompressed sizes of all members listed in a raw central directory."""
+    total = 0
+    position = 0
+    while directory[position:position + 4] == _CENTRAL_SIGNATURE:
+        fields = _CENTRAL_HEADER.unpack_from(directory, position)
+        size, name_length, extra_length, comment_length = fields[9], fields[10], fields[11], fields[12]
+        if size == 0xFFFFFFFF:
+            extra_start = position + _CENTRAL_HEADER.size + name_length
+            extra = directory[extra_start:extra_start + extra_length]
+            offset = 0
+            while offset + 4 <= len(extra):
+                field_id, field_length = struct.unpack_from("<HH", extra, offset)
+                if field_id == _ZIP64_EXTRA_ID and field_length >= 8:
+                    # The uncompressed size is always the first zip64 field when present.
+                    size = struct.unpack_from("<Q", extra, offset + 4)[0]
+                    break
+                offset += 4 + field_length
+        total += size
+        position += _CENTRAL_HEADER.size + name_length + extra_length + comment_length
+    return total
+
+
+def _dos_time(date_value: int, time_value: int) -> float:
+    try:
+        return time.mktime((
+            ((date_value >> 9) & 0x7F) + 1980,
+            (date_value >> 5) & 0x0F,
+            date_value & 0x1F,
+            (time_value >> 11) & 0x1F,
+            (time_value >> 5) & 0x3F,
+            (time_value & 0x1F) * 2,
+            0, 0, -1,
+        ))
+    except (OverflowError, ValueError):
+        return 0.0
+
+
+def _read_member_header(reader: _PushbackReader) -> Optional[ZipStreamMember]:
+    signature = reader.read(4)
+    if not signature or signature in _END_SIGNATURES:
+        return None
+    if signature != _LOCAL_SIGNATURE:
+        raise ZipStreamCorrupt(f"Unexpected zip record signature {signature!r}")
+    header = _LOCAL_SIGNATURE + reader.read_exact(_LOCAL_HEADER.size - 4)
+    (_, _, flags, method, mod_time, mod_date, crc, compressed_size, size, name_length, extra_length) = _LOCAL_HEADER.unpack(header)
+    raw_name = reader.read_exact(name_length)
+    extra = reader.read_exact(extra_length)
+
+    if flags & _FLAG_ENCRYPTED:
+        raise ZipStreamUnsupported("Encrypted zip members are not supported")
+    if method not in (_STORED, _DEFLATED):
+        raise ZipStreamUnsupported(f"Unsupported zip compression method {method}")
+
+    zip64 = False
+    offset = 0
+    while offset + 4 <= len(extra):
+        field_id, field_length = struct.unpack_from("<HH", extra, offset)
+        if field_id == _ZIP64_EXTRA_ID:
+            zip64 = True
+            values = extra[offset + 4:offset + 4 + field_length]
+            position = 0
+            if size == 0xFFFFFFFF and position + 8 <= len(values):
+                size = struct.unpack_from("<Q", values, position)[0]
+                position += 8
+            if compressed_size == 0xFFFFFFFF and position + 8 <= len(values):
+                compressed_size = struct.unpack_from("<Q", values, position)[0]
+        offset += 4 + field_length
+
+    encoding = "utf-8" if flags & _FLAG_UTF8 else "cp437"
+    name = safe_member_name(raw_name.decode(encoding, errors="replace"))
+    has_descriptor = bool(flags & _FLAG_DATA_DESCRIPTOR)
+    return ZipStreamMember(
+        name=name,
+        method=method,
+        flags=flags,
+        crc=crc,
+        compressed_size=None if has_descriptor else compressed_size,
+        size=None if has_descriptor else size,
+        mtime=_dos_time(mod_date, mod_time),
+        zip64=zip64,
+    )
+
+
+def _iter_member_data(reader: _PushbackReader, member: ZipStreamMember) -> Iterator[bytes]:
+    """Yield the uncompressed bytes of ``member`` and verify its CRC."""
+    crc = 0
+    produced = 0
+    if member.method == _STORED:
+        if member.compressed_size is None:
+            raise ZipStreamUnsupported(f"Stored member {member.name} has no size in its local header")
+        remaining = member.compressed_size
+        while remaining:
+            chunk = reader.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                raise ZipStreamCorrupt(f"Zip stream ended inside {member.name}")
+            remaining -= len(chunk)
+            crc = zlib.crc32(chunk, crc)
+            produced += len(chunk)
+            yield chunk
+    else:
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        remaining = member.compressed_size
+        while not decompressor.eof:
+            to_read = CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining)
+            if remaining == 0:
+                break
+            chunk = reader.read(to_read)
+            if not chunk:
+                raise ZipStreamCorrupt(f"Zip stream ended inside {member.name}")
+            if remaining is not None:
+                remaining -= len(chunk)
+            data = decompressor.decompress(chunk)
+            if decompressor.eof and decompressor.unused_data:
+                reader.unread(decompressor.unused_data)
+                if remaining is not None:
+                    remaining += len(decompressor.unused_data)
+            if data:
+                crc = zlib.crc32(data, crc)
+                produced += len(data)
+                yield data
+        if not decompressor.eof:
+            raise ZipStreamCorrupt(f"Truncated deflate data in {member.name}")
+        if remaining:
+            reader.read_exact(remaining)
+
+    if member.flags & _FLAG_DATA_DESCRIPTOR:
+        first = reader.read_exact(4)
+        if first == _DESCRIPTOR_SIGNATURE:
+            first = reader.read_exact(4)
+        member.crc = struct.unpack("<I", first)[0]
+        size_format = "<QQ" if member.zip64 else "<II"
+        compressed_size, size = struct.unpack(size_format, reader.read_exact(struct.calcsize(size_format)))
+        member.compressed_size = compressed_size
+        if size != produced:
+            raise ZipStreamCorrupt(f"Size mismatch in {member.name}: {produced} != {size}")
+        member.size = size
+
+    if member.size is not None and produced != member.size:
+        raise ZipStreamCorrupt(f"Size mismatch in {member.name}: {produced} != {member.size}")
+    if crc != member.crc:
+        raise ZipStreamCorrupt(f"CRC mismatch in {member.name}")
+
+
+class _ChunkReader:
+    """Adapt a chunk iterator to the read(n) interface tarfile expects."""
+
+    def __init__(self, chunks: Iterator[bytes]):
+        self._chunks = chunks
+        self._pending = b""
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._pending) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._pending += chunk
+        if size < 0:
+            data, self._pending = self._pending, b""
+        else:
+            data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+    def drain(self) -> None:
+        """Consume the rest of the member so the CRC/size checks run."""
+        for _ in self._chunks:
+            pass
+
+
+@dataclass
+class StreamStats:
+    files: int = 0
+    directories: int = 0
+    bytes_uncompressed: int = 0
+    bytes_compressed: int = 0
+    # Relative member path -> [size, mtime, sha256], and explicit directory entries.
+    members: Dict[str, List[object]] = field(default_factory=dict)
+    member_dirs: Set[str] = field(default_factory=set)
+
+
+def _hashing(chunks: Iterator[bytes], digest) -> Iterator[bytes]:
+    for chunk in chunks:
+        digest.update(chunk)
+        yield chunk
+
+
+def zip_stream_to_tar(source: BinaryIO, destination: BinaryIO, prefix: str = "") -> StreamStats:
+    """Read a zip from the forward-only ``source`` and write its members to ``destination`` as tar.
+
+    Each member is decompressed and CRC-checked on the fly; a mismatch raises
+    :class:`ZipStreamCorrupt` after the bad member, so the consumer must not
+    commit what it received. Only the rare member without sizes in its local
+    header is buffered (see ``SPOOL_LIMIT``).
+    """
+    reader = _PushbackReader(source)
+    stats = StreamStats()
+    with tarfile.open(fileobj=destination, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+        while True:
+            member = _read_member_header(reader)
+            if member is None:
+                break
+            if not member.name:
+                # Nothing left of the name after sanitizing; skip the member's data.
+                for _ in _iter_member_data(reader, member):
+                    pass
+                continue
+            target_name = f"{prefix}{member.name}"
+
+            if member.is_dir:
+                info = tarfile.TarInfo(target_name.rstrip("/"))
+                info.type = tarfile.DIRTYPE
+                info.mode = 0o755
+                info.mtime = member.mtime
+                tar.addfile(info)
+                stats.directories += 1
+                stats.member_dirs.add(member.name.rstrip("/"))
+                for _ in _iter_member_data(reader, member):
+                    pass
+                continue
+
+            info = tarfile.TarInfo(target_name)
+            info.mode = 0o644
+            info.mtime = member.mtime
+            digest = hashlib.sha256()
+            chunks = _hashing(_iter_member_data(reader, member), digest)
+            if member.size is not None:
+                info.size = member.size
+                body = _ChunkReader(chunks)
+                tar.addfile(info, body)
+                body.drain()
+            else:
+                with tempfile.SpooledTemporaryFile(max_size=SPOOL_LIMIT) as spool:
+                    for chunk in chunks:
+                        spool.write(chunk)
+                    info.size = spool.tell()
+                    spool.seek(0)
+                    tar.addfile(info, spool)
+            stats.files += 1
+            stats.bytes_uncompressed += info.size
+            stats.members[member.name] = [info.size, int(info.mtime), digest.hexdigest()]
+    stats.bytes_compressed = reader.bytes_read
+    return stats
+
+
+def zip_member_sizes(zip_path: Path) -> Dict[str, int]:
+    """Return ``{safe member path: uncompressed size}`` for every file in a local zip."""
+    sizes: Dict[str, int] = {}
+    with zipfile.ZipFile(zip_path) as archive:
+        for info in archive.infolist():
+            name = safe_member_name(info.filename)
+            if name and not info.is_dir():
+                sizes[name] = info.file_size
+    return sizes
+
+
+@dataclass
+class ExtractStats:
+    files: int = 0
+    directories: int = 0
+    bytes_uncompressed: int = 0
+
+
+def _extract_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo, target: Path) -> int:
+    """Write one member to ``target``, checking the CRC-32 of exactly the bytes written."""
+    crc = 0
+    size = 0
+    try:
+        with archive.open(info) as source, open(target, "wb") as output:
+            while True:
+                chunk = source.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                crc = zlib.crc32(chunk, crc)
+                size += len(chunk)
+                output.write(chunk)
+    except (zipfile.BadZipFile, zlib.error, EOFError) as exc:
+        raise ZipStreamCorrupt(f"{info.filename}: {exc}") from exc
+    if crc != info.CRC or size != info.file_size:
+        raise ZipStreamCorrupt(f"CRC mismatch in {info.filename}")
+    return size
+
+
+def extract_zip_parallel(zip_path: Path, destination: Path, workers: int = 1) -> ExtractStats:
+    """Extract ``zip_path`` into ``destination`` with ``workers`` threads.
+
+    Every thread opens its own handle on the archive (a ``ZipFile`` is not safe
+    to share while reading) and zlib releases the GIL while inflating, so large
+    members decompress on separate cores; members are handed out largest first.
+    Names go through ``safe_member_name`` and each member's CRC is checked as it
+    is written. Raises ``ZipStreamCorrupt`` and leaves the partial output for the
+    caller to remove.
+    """
+    destination = Path(destination)
+    # A name listed twice keeps its last entry, as extractall would.
+    members: Dict[str, zipfile.ZipInfo] = {}
+    directories: Set[str] = set()
+    with zipfile.ZipFile(zip_path) as archive:
+        for info in archive.infolist():
+            name = safe_member_name(info.filename)
+            if not name:
+                continue
+            if info.is_dir():
+                directories.add(name.rstrip("/"))
+            else:
+                members[name] = info
+    for name in members:
+        if "/" in name:
+            directories.add(name.rsplit("/", 1)[0])
+    destination.mkdir(parents=True, exist_ok=True)
+    for name in sorted(directories):
+        (destination / name).mkdir(parents=True, exist_ok=True)
+
+    stats = ExtractStats(directories=len(directories))
+    order = sorted(members.items(), key=lambda item: item[1].file_size, reverse=True)
+    if workers <= 1 or len(order) <= 1:
+        with zipfile.ZipFile(zip_path) as archive:
+            for name, info in order:
+                stats.bytes_uncompressed += _extract_member(archive, info, destination / name)
+                stats.files += 1
+        return stats
+
+    local = threading.local()
+    handles: List[zipfile.ZipFile] = []
+    handles_lock = threading.Lock()
+
+    def extract(name: str, info: zipfile.ZipInfo) -> int:
+        archive = getattr(local, "archive", None)
+        if archive is None:
+            archive = local.archive = zipfile.ZipFile(zip_path)
+            with handles_lock:
+                handles.append(archive)
+        return _extract_member(archive, info, destination / name)
+
+    executor = ThreadPoolExecutor(max_workers=min(workers, len(order)), thread_name_prefix="unzip")
+    try:
+        futures = [executor.submit(extract, name, info) for name, info in order]
+        done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+        failed = next((future for future in done if future.exception() is not None), None)
+        if failed is not None:
+            raise failed.exception()  # type: ignore[misc]
+        for future in futures:
+            stats.bytes_uncompressed += future.result()
+            stats.files += 1
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        for archive in handles:
+            archive.close()
+    return stats
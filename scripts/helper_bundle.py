@@ -0,0 +1,71 @@
+"""Per-game bundles: the small files of a game concatenated into one file plus an offset table."""
+from __future__ import annotations
+
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+BUNDLE_DATA_NAME = "scummvm-bundle.bin"
+BUNDLE_TABLE_NAME = "scummvm-bundle.json"
+BUNDLE_VERSION = 1
+DEFAULT_MIN_FILES = 16
+DEFAULT_MAX_FILE_SIZE = 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+
+
+def write_bundle(
+    folder: Path,
+    paths: Iterable[str],
+    *,
+    min_files: int = DEFAULT_MIN_FILES,
+    max_file_size: int = DEFAULT_MAX_FILE_SIZE,
+) -> Optional[Dict[str, object]]:
+    """Write ``BUNDLE_DATA_NAME`` and ``BUNDLE_TABLE_NAME`` into ``folder``.
+
+    Every file of ``paths`` (relative to ``folder``) up to ``max_file_size`` is
+    appended to the data file in path order, so the files of one directory sit
+    next to each other and a client can fetch a whole directory with a single
+    range request. The table maps each bundled path to ``[offset, length]``.
+    Large files stay loose only. A bundle left over from an earlier run is
+    replaced. Returns the manifest record of the bundle, or None (after
+    removing any old bundle) if the game has fewer than ``min_files`` small
+    files.
+    """
+    folder = Path(folder)
+    for name in (BUNDLE_DATA_NAME, BUNDLE_TABLE_NAME):
+        (folder / name).unlink(missing_ok=True)
+    members = [
+        path
+        for path in sorted(set(paths) - {BUNDLE_DATA_NAME, BUNDLE_TABLE_NAME})
+        if path.rsplit("/", 1)[-1] != "index.json" and (folder / path).stat().st_size <= max_file_size
+    ]
+    if len(members) < min_files:
+        return None
+
+    table: Dict[str, list] = {}
+    offset = 0
+    with open(folder / BUNDLE_DATA_NAME, "wb") as bundle:
+        for path in members:
+            with open(folder / path, "rb") as handle:
+                shutil.copyfileobj(handle, bundle, CHUNK_SIZE)
+            length = bundle.tell() - offset
+            table[path] = [offset, length]
+            offset += length
+
+    payload = {"version": BUNDLE_VERSION, "data": BUNDLE_DATA_NAME, "size": offset, "files": table}
+    with open(folder / BUNDLE_TABLE_NAME, "w", encoding="utf-8") as handle:
+        json.dump(payload, handle, separators=(",", ":"), ensure_ascii=False, sort_keys=True)
+    # Give the bundle a stable mtime so re-running the sync does not look like a change.
+    newest = max(int((folder / path).stat().st_mtime) for path in members)
+    for name in (BUNDLE_DATA_NAME, BUNDLE_TABLE_NAME):
+        os.utime(folder / name, (newest, newest))
+    return {"data": BUNDLE_DATA_NAME, "table": BUNDLE_TABLE_NAME, "size": offset, "files": len(table)}
+
+
+def bundle_paths(bundle: Optional[Dict[str, object]]) -> Iterable[str]:
+    """Yield the paths (relative to the game folder) of the files making up ``bundle``."""
+    if bundle:
+        yield str(bundle["data"])
+        yield str(bundle["table"])
@@ -0,0 +1,163 @@
+"""Precompressed ``.br`` / ``.gz`` sidecars for game files served over HTTP."""
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import shutil
+from concurrent.futures import Executor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+try:  # Optional: without the brotli module only gzip sidecars are produced.
+    import brotli  # type: ignore[import-not-found]
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+CHUNK_SIZE = 1024 * 1024
+DEFAULT_MIN_SIZE = 16 * 1024
+# Keep a variant only if it is at most this fraction of the original.
+DEFAULT_MAX_RATIO = 0.9
+ENCODINGS = ("br", "gz")
+# Written at the game root; lists the sidecars and is what the web server checks before serving one.
+COMPRESSED_TABLE_NAME = "scummvm-compressed.json"
+COMPRESSED_TABLE_VERSION = 1
+
+# Formats that are already compressed; recompressing them wastes CPU for nothing.
+INCOMPRESSIBLE_SUFFIXES = {
+    ".7z", ".br", ".bz2", ".flac", ".gif", ".gz", ".jpeg", ".jpg", ".lzma", ".m4a",
+    ".mkv", ".mp3", ".mp4", ".ogg", ".ogv", ".opus", ".png", ".rar", ".webm", ".webp",
+    ".xz", ".zip", ".zst",
+}
+
+
+def brotli_available() -> bool:
+    return brotli is not None
+
+
+def _write_gzip(source: Path, target: Path) -> None:
+    with open(source, "rb") as src, open(target, "wb") as raw:
+        # mtime=0 and no file name keep the output byte-identical across runs.
+        with gzip.GzipFile(filename="", mode="wb", compresslevel=9, fileobj=raw, mtime=0) as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+
+def _write_brotli(source: Path, target: Path, quality: int) -> None:
+    compressor = brotli.Compressor(quality=quality)
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+            dst.write(compressor.process(chunk))
+        dst.write(compressor.finish())
+
+
+def compress_file(path: str, max_ratio: float = DEFAULT_MAX_RATIO, brotli_quality: int = 11) -> Dict[str, int]:
+    """Write ``<path>.br`` / ``<path>.gz`` next to ``path`` and return the sizes of the variants kept.
+
+    Runs in a worker process. A variant that does not shrink the file below
+    ``max_ratio`` of its size is deleted again. Kept sidecars get the mtime of
+    the original so listings and HTTP validators stay consistent.
+    """
+    source = Path(path)
+    stat = source.stat()
+    kept: Dict[str, int] = {}
+    for encoding in ENCODINGS:
+        if encoding == "br" and brotli is None:
+            continue
+        target = source.with_name(f"{source.name}.{encoding}")
+        if encoding == "br":
+            _write_brotli(source, target, brotli_quality)
+        else:
+            _write_gzip(source, target)
+        size = target.stat().st_size
+        if size <= stat.st_size * max_ratio:
+            os.utime(target, (stat.st_atime, stat.st_mtime))
+            kept[encoding] = size
+        else:
+            target.unlink()
+    return kept
+
+
+def precompress_folder(
+    folder: Path,
+    paths: Optional[Iterable[str]],
+    executor: Executor,
+    *,
+    min_size: int = DEFAULT_MIN_SIZE,
+    max_ratio: float = DEFAULT_MAX_RATIO,
+    exclude: Iterable[str] = (),
+) -> Dict[str, Dict[str, int]]:
+    """Create sidecars for the compressible files among ``paths`` (relative to ``folder``, default: all).
+
+    Returns ``{relative_path: {"br": size, "gz": size}}`` for every file that
+    got at least one sidecar; the paths in ``exclude`` are left alone. A game
+    that ships a file next to its own ``.br``/``.gz`` name gets no sidecars at
+    all: the web server cannot tell such a pair from a sidecar, so it only
+    serves sidecars for games with a :data:`COMPRESSED_TABLE_NAME`, which is
+    never written for them. Call :func:`remove_compressed` first to drop the
+    output of an earlier run.
+    """
+    folder = Path(folder)
+    candidates = []
+    if paths is None:
+        paths = [
+            os.path.relpath(os.path.join(root, name), folder).replace(os.sep, "/")
+            for root, _, names in os.walk(folder)
+            for name in names
+        ]
+    existing = set(paths)
+    excluded = set(exclude)
+    if any(f"{relative_path}.{encoding}" in existing for relative_path in existing for encoding in ENCODINGS):
+        return {}
+    for relative_path in sorted(existing - excluded):
+        if Path(relative_path).suffix.lower() in INCOMPRESSIBLE_SUFFIXES or relative_path.rsplit("/", 1)[-1] == "index.json":
+            continue
+        if relative_path == COMPRESSED_TABLE_NAME:
+            continue
+        if (folder / relative_path).stat().st_size < min_size:
+            continue
+        candidates.append(relative_path)
+
+    futures = {relative_path: executor.submit(compress_file, str(folder / relative_path), max_ratio) for relative_path in candidates}
+    results: Dict[str, Dict[str, int]] = {}
+    for relative_path, future in futures.items():
+        kept = future.result()
+        if kept:
+            results[relative_path] = kept
+    return results
+
+
+def sidecar_paths(compressed: Optional[Dict[str, Dict[str, int]]]) -> Iterable[str]:
+    """Yield the relative paths of the sidecar files described by ``compressed``."""
+    for relative_path, variants in (compressed or {}).items():
+        for encoding in variants:
+            yield f"{relative_path}.{encoding}"
+
+
+def write_compressed_table(folder: Path, compressed: Dict[str, Dict[str, int]]) -> str:
+    """Write :data:`COMPRESSED_TABLE_NAME` (``{"files": {path: {encoding: size}}}``) and return its relative path."""
+    table = {"version": COMPRESSED_TABLE_VERSION, "files": dict(sorted(compressed.items()))}
+    with open(Path(folder) / COMPRESSED_TABLE_NAME, "w", encoding="utf-8") as handle:
+        json.dump(table, handle, separators=(",", ":"), sort_keys=True)
+    return COMPRESSED_TABLE_NAME
+
+
+def remove_compressed(folder: Path) -> List[str]:
+    """Delete the table and sidecars an earlier run wrote into ``folder``; returns the removed relative paths."""
+    folder = Path(folder)
+    table_path = folder / COMPRESSED_TABLE_NAME
+    try:
+        with open(table_path, "r", encoding="utf-8") as handle:
+            table = json.load(handle)
+    except (OSError, ValueError):
+        return []
+    if not isinstance(table, dict) or table.get("version") != COMPRESSED_TABLE_VERSION or not isinstance(table.get("files"), dict):
+        # Not ours: a game may ship a file of that name.
+        return []
+    files = table["files"]
+    removed = []
+    for sidecar in list(sidecar_paths(files)) + [COMPRESSED_TABLE_NAME]:
+        path = folder / sidecar
+        if path.is_file():
+            path.unlink()
+            removed.append(sidecar)
+    return removed
@@ -0,0 +1,806 @@
+"""HTTP download helpers: resumable and segmented range requests, mirror racing, retry with backoff and a local cache."""
+from __future__ import annotations
+
+import hashlib
+import http.client
+import json
+import os
+import shutil
+import socket
+import struct
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, as_completed, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from helper_archive import END_SEARCH_SIZE, central_directory_extracted_size, central_directory_span
+
+CHUNK_SIZE = 1024 * 1024
+USER_AGENT = "scummvm-demo-sync"
+PRIMARY_HOST = "downloads.scummvm.org"
+# Below this size one stream is already fast enough that extra requests only add latency.
+SEGMENT_MIN_SIZE = 8 * 1024 * 1024
+# Files are cut into more segments than connections so a slow range does not hold up the end.
+SEGMENTS_PER_CONNECTION = 4
+# Bytes each mirror is asked for when racing them.
+RACE_BYTES = 256 * 1024
+# How often the progress of a segmented download is saved for a later resume.
+SEGMENT_STATE_INTERVAL = 5.0
+
+# Errors worth another attempt: dropped connections, truncated bodies, timeouts.
+TRANSIENT_ERRORS = (
+    urllib.error.URLError,
+    http.client.HTTPException,
+    ConnectionError,
+    socket.timeout,
+    TimeoutError,
+)
+
+
+class DownloadError(RuntimeError):
+    """Raised when a download cannot be completed after all retries."""
+
+
+class NotModified(Exception):
+    """The server answered a conditional request with 304 Not Modified."""
+
+
+class _RangesUnsupported(Exception):
+    """A source ignored or mangled a range request; the caller falls back to one plain stream."""
+
+
+@dataclass
+class DownloadResult:
+    """Validators and size reported by the server for a finished download."""
+
+    size: int
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    accept_ranges: bool = False
+
+
+def _meta_path(partial_path: Path) -> Path:
+    return partial_path.with_name(partial_path.name + ".json")
+
+
+def _load_partial_meta(partial_path: Path) -> Dict[str, object]:
+    meta_path = _meta_path(partial_path)
+    if not partial_path.exists() or not meta_path.exists():
+        return {}
+    try:
+        with open(meta_path, "r", encoding="utf-8") as handle:
+            data = json.load(handle)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _save_partial_meta(partial_path: Path, url: str, result: DownloadResult) -> None:
+    with open(_meta_path(partial_path), "w", encoding="utf-8") as handle:
+        json.dump({"url": url, "size": result.size, "etag": result.etag, "last_modified": result.last_modified}, handle)
+
+
+def discard_partial(partial_path: Path) -> None:
+    """Remove a partial download and its resume metadata."""
+    for path in (partial_path, _meta_path(partial_path)):
+        if path.exists():
+            path.unlink()
+
+
+def _parse_content_range(value: Optional[str]) -> Optional[tuple]:
+    # "bytes 100-199/1000" -> (100, 199, 1000); total may be "*".
+    if not value or not value.startswith("bytes "):
+        return None
+    try:
+        span, total = value[6:].split("/", 1)
+        start, end = span.split("-", 1)
+        return int(start), int(end), (int(total) if total != "*" else None)
+    except ValueError:
+        return None
+
+
+def _fetch_once(
+    url: str,
+    partial_path: Path,
+    meta: Dict[str, object],
+    timeout: float,
+    progress: Optional[Callable[[str], None]],
+    conditional_headers: Optional[Dict[str, str]] = None,
+) -> DownloadResult:
+    offset = partial_path.stat().st_size if partial_path.exists() else 0
+    validator = meta.get("etag") or meta.get("last_modified")
+    if meta.get("url") != url or not validator:
+        # Without a validator we cannot prove the partial bytes still match upstream.
+        offset = 0
+
+    headers = {"User-Agent": USER_AGENT}
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = str(validator)
+    elif conditional_headers:
+        headers.update(conditional_headers)
+
+    request = urllib.request.Request(url, headers=headers)
+    try:
+        response = urllib.request.urlopen(request, timeout=timeout)
+    except urllib.error.HTTPError as exc:
+        if exc.code == 304 and not offset and conditional_headers:
+            raise NotModified(url) from exc
+        if exc.code == 416 and offset and offset == meta.get("size"):
+            # Partial file already holds every byte.
+            return DownloadResult(size=offset, etag=meta.get("etag"), last_modified=meta.get("last_modified"))  # type: ignore[arg-type]
+        if exc.code == 416:
+            discard_partial(partial_path)
+        raise
+
+    with response:
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        length_header = response.headers.get("Content-Length")
+        body_length = int(length_header) if length_header and length_header.isdigit() else None
+
+        if response.status == 206:
+            content_range = _parse_content_range(response.headers.get("Content-Range"))
+            if not content_range or content_range[0] != offset:
+                discard_partial(partial_path)
+                raise http.client.HTTPException(f"Unexpected Content-Range for {url}: {response.headers.get('Content-Range')}")
+            total = content_range[2]
+            if meta.get("size") and total is not None and total != meta.get("size"):
+                discard_partial(partial_path)
+                raise http.client.HTTPException(f"Remote size changed for {url}")
+            if meta.get("etag") and etag and etag != meta.get("etag"):
+                discard_partial(partial_path)
+                raise http.client.HTTPException(f"ETag changed for {url}")
+            mode = "ab"
+            if progress:
+                progress(f"Resuming {url} at byte {offset}")
+        else:
+            # Full body: the server ignored the range or If-Range found a newer file.
+            offset = 0
+            total = body_length
+            mode = "wb"
+
+        result = DownloadResult(size=total if total is not None else -1, etag=etag, last_modified=last_modified)
+        if total is not None and (etag or last_modified):
+            _save_partial_meta(partial_path, url, result)
+        elif _meta_path(partial_path).exists():
+            _meta_path(partial_path).unlink()
+
+        with open(partial_path, mode) as handle:
+            while True:
+                chunk = response.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                handle.write(chunk)
+
+    written = partial_path.stat().st_size
+    if total is not None and written != total:
+        raise http.client.IncompleteRead(b"", total - written)
+    result.size = written
+    return result
+
+
+def download_with_resume(
+    url: str,
+    destination: Path,
+    partial_path: Optional[Path] = None,
+    *,
+    attempts: int = 5,
+    timeout: float = 60.0,
+    progress: Optional[Callable[[str], None]] = None,
+    conditional_headers: Optional[Dict[str, str]] = None,
+) -> DownloadResult:
+    """Download ``url`` to ``destination``, resuming an interrupted partial file.
+
+    Bytes are written to ``partial_path`` (default ``<destination>.downloading``)
+    together with a small JSON sidecar recording the ETag/Last-Modified and the
+    expected size. Subsequent attempts - in this call or a later run - send a
+    ``Range``/``If-Range`` request so only the missing tail is transferred; if
+    the upstream file changed the server answers with the full body and the
+    partial file is replaced. The finished file must match Content-Length before
+    it is renamed into place. ``conditional_headers`` (If-None-Match and friends)
+    are sent on fresh requests; a 304 answer raises :class:`NotModified`.
+    """
+    destination = Path(destination)
+    partial_path = Path(partial_path) if partial_path else destination.with_name(destination.name + ".downloading")
+
+    last_error: Optional[BaseException] = None
+    for attempt in range(1, max(1, attempts) + 1):
+        meta = _load_partial_meta(partial_path)
+        try:
+            result = _fetch_once(url, partial_path, meta, timeout, progress, conditional_headers)
+        except urllib.error.HTTPError as exc:
+            if exc.code < 500 and exc.code not in (408, 416, 429):
+                raise DownloadError(f"Download of {url} failed: HTTP {exc.code}") from exc
+            last_error = exc
+        except TRANSIENT_ERRORS as exc:
+            last_error = exc
+        else:
+            partial_path.rename(destination)
+            meta_path = _meta_path(partial_path)
+            if meta_path.exists():
+                meta_path.unlink()
+            return result
+
+        if attempt < attempts:
+            delay = min(60, 2 ** attempt)
+            if progress:
+                progress(f"Download of {url} interrupted ({last_error}); retry {attempt}/{attempts - 1} in {delay}s")
+            time.sleep(delay)
+
+    raise DownloadError(f"Download of {url} failed after {attempts} attempts: {last_error}") from last_error
+
+
+def mirror_urls(url: str, mirrors: Sequence[str]) -> List[str]:
+    """Return the same ``/frs/`` path on every mirror base URL; only downloads.scummvm.org files are mirrored."""
+    parsed = urllib.parse.urlparse(url)
+    if parsed.netloc != PRIMARY_HOST or not parsed.path.startswith("/frs/"):
+        return []
+    path = parsed.path + (f"?{parsed.query}" if parsed.query else "")
+    return [f"{mirror.rstrip('/')}{path}" for mirror in mirrors]
+
+
+class _Segment:
+    """Byte range ``start``-``end`` (inclusive); ``offset`` is the next byte still missing."""
+
+    def __init__(self, start: int, end: int):
+        self.start = start
+        self.end = end
+        self.offset = start
+
+
+def _split_segments(size: int, connections: int) -> List[_Segment]:
+    count = max(1, min(connections * SEGMENTS_PER_CONNECTION, size // (CHUNK_SIZE * 2) or 1))
+    step = -(-size // count)
+    return [_Segment(start, min(start + step, size) - 1) for start in range(0, size, step)]
+
+
+def _segment_state_path(segments_path: Path) -> Path:
+    return segments_path.with_name(segments_path.name + ".json")
+
+
+def _save_segment_state(segments_path: Path, url: str, head: DownloadResult, segments: Sequence[_Segment]) -> None:
+    """Record which bytes of ``segments_path`` are complete (written before each offset moved)."""
+    state_path = _segment_state_path(segments_path)
+    temp_path = state_path.with_name(state_path.name + ".tmp")
+    with open(temp_path, "w", encoding="utf-8") as handle:
+        json.dump({
+            "url": url,
+            "size": head.size,
+            "etag": head.etag,
+            "last_modified": head.last_modified,
+            "segments": [[segment.start, segment.end, segment.offset] for segment in segments],
+        }, handle)
+    os.replace(temp_path, state_path)
+
+
+def _load_segment_state(segments_path: Path, url: str, head: DownloadResult) -> Optional[List[_Segment]]:
+    """Segments of an interrupted download of the same file, or None if it cannot be resumed.
+
+    The partial file is only trusted if ``head`` still reports the size and
+    the ETag/Last-Modified it was started with; the ``If-Range`` on every
+    segment request catches a change after that.
+    """
+    state_path = _segment_state_path(segments_path)
+    if not segments_path.exists() or not state_path.exists():
+        return None
+    try:
+        with open(state_path, "r", encoding="utf-8") as handle:
+            state = json.load(handle)
+        ranges = [(int(start), int(end), int(offset)) for start, end, offset in state["segments"]]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    if state.get("url") != url or state.get("size") != head.size or segments_path.stat().st_size != head.size:
+        return None
+    if not (head.etag or head.last_modified) or (state.get("etag"), state.get("last_modified")) != (head.etag, head.last_modified):
+        return None
+    segments: List[_Segment] = []
+    expected_start = 0
+    for start, end, offset in ranges:
+        if start != expected_start or end < start or not start <= offset <= end + 1:
+            return None
+        segment = _Segment(start, end)
+        segment.offset = offset
+        segments.append(segment)
+        expected_start = end + 1
+    return segments if expected_start == head.size else None
+
+
+def _discard_segments(segments_path: Path) -> None:
+    for path in (segments_path, _segment_state_path(segments_path)):
+        if path.exists():
+            path.unlink()
+
+
+def _fetch_segment(url: str, fd: int, segment: _Segment, validator: Optional[str], timeout: float, stop: threading.Event) -> None:
+    """GET the missing part of ``segment`` and write it in place with ``pwrite``."""
+    headers = {"User-Agent": USER_AGENT, "Range": f"bytes={segment.offset}-{segment.end}"}
+    if validator:
+        # If the file changed since it was sized, the server sends 200 and the download starts over.
+        headers["If-Range"] = validator
+    request = urllib.request.Request(url, headers=headers)
+    try:
+        response = urllib.request.urlopen(request, timeout=timeout)
+    except urllib.error.HTTPError as exc:
+        if exc.code == 416:
+            raise _RangesUnsupported(f"{url} rejected bytes={segment.offset}-{segment.end}") from exc
+        raise
+    with response:
+        content_range = _parse_content_range(response.headers.get("Content-Range"))
+        if response.status != 206 or not content_range or content_range[:2] != (segment.offset, segment.end):
+            raise _RangesUnsupported(f"{url} answered bytes={segment.offset}-{segment.end} with {response.status} {response.headers.get('Content-Range')}")
+        while segment.offset <= segment.end and not stop.is_set():
+            chunk = response.read(min(CHUNK_SIZE, segment.end + 1 - segment.offset))
+            if not chunk:
+                break
+            os.pwrite(fd, chunk, segment.offset)
+            segment.offset += len(chunk)
+    if segment.offset <= segment.end and not stop.is_set():
+        raise http.client.IncompleteRead(b"", segment.end + 1 - segment.offset)
+
+
+def _probe_source(url: str, size: int, timeout: float) -> Optional[Tuple[float, Optional[str]]]:
+    """Time a ``RACE_BYTES`` range request; returns (seconds, validator) or None if unusable."""
+    started = time.monotonic()
+    request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT, "Range": f"bytes=0-{min(RACE_BYTES, size) - 1}"})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            content_range = _parse_content_range(response.headers.get("Content-Range"))
+            if response.status != 206 or not content_range or content_range[2] != size:
+                return None
+            response.read()
+            return time.monotonic() - started, response.headers.get("ETag") or response.headers.get("Last-Modified")
+    except TRANSIENT_ERRORS:
+        return None
+
+
+def race_sources(urls: Sequence[str], size: int, timeout: float = 30.0) -> Optional[Tuple[str, Optional[str]]]:
+    """Fetch the first ``RACE_BYTES`` from every URL at once and return the first to finish with its validator.
+
+    Sources whose file has a different size, or that do not honour ranges, are
+    disqualified. Returns None when none of them is usable.
+    """
+    executor = ThreadPoolExecutor(max_workers=len(urls), thread_name_prefix="race")
+    try:
+        futures = {executor.submit(_probe_source, url, size, timeout): url for url in urls}
+        for future in as_completed(futures):
+            outcome = future.result()
+            if outcome is not None:
+                return futures[future], outcome[1]
+        return None
+    finally:
+        # Losers finish (or time out) in the background; their bytes are small.
+        executor.shutdown(wait=False)
+
+
+def _is_not_modified(head: DownloadResult, conditional_headers: Optional[Dict[str, str]]) -> bool:
+    if not conditional_headers:
+        return False
+    if conditional_headers.get("If-None-Match"):
+        return head.etag is not None and head.etag == conditional_headers["If-None-Match"]
+    return head.last_modified is not None and head.last_modified == conditional_headers.get("If-Modified-Since")
+
+
+def download_segmented(
+    url: str,
+    destination: Path,
+    partial_path: Optional[Path] = None,
+    *,
+    connections: int = 4,
+    mirrors: Sequence[str] = (),
+    min_size: int = SEGMENT_MIN_SIZE,
+    attempts: int = 5,
+    timeout: float = 60.0,
+    progress: Optional[Callable[[str], None]] = None,
+    conditional_headers: Optional[Dict[str, str]] = None,
+) -> DownloadResult:
+    """Download ``url`` over several range requests at once, optionally from the fastest mirror.
+
+    A ``HEAD`` on ``url`` gives the size and validators. Files of at least
+    ``min_size`` from a server that advertises ``Accept-Ranges: bytes`` are cut
+    into segments fetched by ``connections`` threads straight into their place
+    in a preallocated ``<destination>.segments`` file; each segment retries on
+    its own, from the byte where it stopped. Their progress is saved next to
+    that file (``.segments.json``) every ``SEGMENT_STATE_INTERVAL`` seconds and
+    when the download fails, so a later call for the same unchanged file (same
+    size and ETag/Last-Modified) only fetches the missing ranges. With ``mirrors`` (the same file on
+    other hosts, see :func:`mirror_urls`), all sources are raced first and the
+    segments come from the winner, falling back to ``url`` for a segment the
+    mirror fails. Everything else - small files, no range support, a source
+    that ignores a range or a file that changed mid-download - goes through
+    :func:`download_with_resume`, as does a download whose single-stream
+    partial file already exists. The validators returned are always those of
+    ``url``, so the manifest compares like with like.
+    """
+    destination = Path(destination)
+    partial_path = Path(partial_path) if partial_path else destination.with_name(destination.name + ".downloading")
+
+    def single_stream() -> DownloadResult:
+        return download_with_resume(url, destination, partial_path, attempts=attempts, timeout=timeout, progress=progress, conditional_headers=conditional_headers)
+
+    if (connections <= 1 and not mirrors) or _load_partial_meta(partial_path):
+        return single_stream()
+    head = probe_url(url, timeout)
+    if head is None or not head.accept_ranges or head.size < max(1, min_size):
+        return single_stream()
+    if _is_not_modified(head, conditional_headers):
+        raise NotModified(url)
+
+    validators = {url: head.etag or head.last_modified}
+    source = url
+    if mirrors:
+        winner = race_sources([url, *mirrors], head.size, timeout)
+        if winner is not None:
+            source = winner[0]
+            validators[source] = winner[1]
+            if source != url and progress:
+                progress(f"Downloading {url} from mirror {urllib.parse.urlparse(source).netloc}")
+
+    segments_path = destination.with_name(destination.name + ".segments")
+    segments = _load_segment_state(segments_path, url, head)
+    if segments is not None:
+        done = sum(segment.offset - segment.start for segment in segments)
+        if progress:
+            progress(f"Resuming segmented download of {url} ({done} of {head.size} bytes already there)")
+        fd = os.open(segments_path, os.O_WRONLY)
+    else:
+        _discard_segments(segments_path)
+        segments = _split_segments(head.size, connections)
+        fd = os.open(segments_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    stop = threading.Event()
+
+    def fetch(segment: _Segment) -> None:
+        current = source
+        last_error: Optional[BaseException] = None
+        for attempt in range(1, max(1, attempts) + 1):
+            if stop.is_set():
+                return
+            try:
+                _fetch_segment(current, fd, segment, validators.get(current), timeout, stop)
+                return
+            except urllib.error.HTTPError as exc:
+                if exc.code < 500 and exc.code not in (408, 429) and current == url:
+                    raise DownloadError(f"Download of {url} failed: HTTP {exc.code}") from exc
+                last_error = exc
+            except _RangesUnsupported as exc:
+                if current == url:
+                    raise
+                last_error = exc
+            except TRANSIENT_ERRORS as exc:
+                last_error = exc
+            if stop.is_set():
+                return
+            if current != url:
+                # Finish on the primary rather than retrying a mirror that already failed.
+                current = url
+                continue
+            if attempt < attempts:
+                time.sleep(min(60, 2 ** attempt))
+        raise DownloadError(f"Download of {url} failed after {attempts} attempts: {last_error}")
+
+    missing = [segment for segment in segments if segment.offset <= segment.end]
+    try:
+        try:
+            os.posix_fallocate(fd, 0, head.size)
+        except (AttributeError, OSError):
+            os.ftruncate(fd, head.size)
+        with ThreadPoolExecutor(max_workers=max(1, min(connections, len(missing))), thread_name_prefix="segment") as executor:
+            pending = {executor.submit(fetch, segment) for segment in missing}
+            try:
+                while pending:
+                    finished, pending = wait(pending, timeout=SEGMENT_STATE_INTERVAL, return_when=FIRST_EXCEPTION)
+                    for future in finished:
+                        future.result()
+                    _save_segment_state(segments_path, url, head, segments)
+            except BaseException:
+                stop.set()
+                raise
+    except _RangesUnsupported as exc:
+        os.close(fd)
+        _discard_segments(segments_path)
+        if progress:
+            progress(f"Segmented download of {url} not possible ({exc}), using a single stream")
+        return single_stream()
+    except BaseException:
+        os.close(fd)
+        # The worker threads have stopped, so every offset is backed by written bytes.
+        _save_segment_state(segments_path, url, head, segments)
+        raise
+    os.close(fd)
+    segments_path.rename(destination)
+    _segment_state_path(segments_path).unlink(missing_ok=True)
+    return DownloadResult(size=head.size, etag=head.etag, last_modified=head.last_modified, accept_ranges=True)
+
+
+def probe_url(url: str, timeout: float = 30.0) -> Optional[DownloadResult]:
+    """Return the size and validators the server reports for ``url`` via HEAD, or None."""
+    request = urllib.request.Request(url, method="HEAD", headers={"User-Agent": USER_AGENT})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            headers = response.headers
+    except TRANSIENT_ERRORS:
+        return None
+    length_header = headers.get("Content-Length")
+    size = int(length_header) if length_header and length_header.isdigit() else -1
+    accept_ranges = (headers.get("Accept-Ranges") or "").strip().lower() == "bytes"
+    return DownloadResult(size=size, etag=headers.get("ETag"), last_modified=headers.get("Last-Modified"), accept_ranges=accept_ranges)
+
+
+def probe_content_length(url: str, timeout: float = 30.0) -> Optional[int]:
+    """Return the size the server reports for ``url`` via HEAD, or None if unknown."""
+    result = probe_url(url, timeout)
+    return result.size if result is not None and result.size >= 0 else None
+
+
+def _fetch_range(url: str, start: Optional[int], end: int, timeout: float) -> Optional[tuple]:
+    """GET ``bytes=start-end`` (or the last ``end`` bytes when ``start`` is None); returns (data, total) or None."""
+    byte_range = f"bytes=-{end}" if start is None else f"bytes={start}-{end}"
+    request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT, "Range": byte_range})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            content_range = _parse_content_range(response.headers.get("Content-Range"))
+            if response.status != 206 or not content_range or content_range[2] is None:
+                # The server ignored the range; do not pull the whole archive just to size it.
+                return None
+            return response.read(), content_range[2]
+    except TRANSIENT_ERRORS:
+        return None
+
+
+def probe_zip_sizes(url: str, timeout: float = 30.0, max_directory: int = 16 * 1024 * 1024) -> Optional[tuple]:
+    """Return ``(archive_size, extracted_size)`` of a remote zip by reading only its central directory.
+
+    Needs range request support; returns None when the server lacks it or the
+    archive does not look like a zip.
+    """
+    fetched = _fetch_range(url, None, END_SEARCH_SIZE, timeout)
+    if fetched is None:
+        return None
+    tail, archive_size = fetched
+    try:
+        span = central_directory_span(tail, archive_size)
+        if span is None:
+            return None
+        offset, size = span
+        tail_start = archive_size - len(tail)
+        if offset >= tail_start:
+            directory = tail[offset - tail_start:offset - tail_start + size]
+        elif size <= max_directory:
+            fetched = _fetch_range(url, offset, offset + size - 1, timeout)
+            if fetched is None:
+                return None
+            directory = fetched[0]
+        else:
+            return None
+        return archive_size, central_directory_extracted_size(directory)
+    except struct.error:
+        return None
+
+
+class DownloadCache:
+    """Persistent content-addressed cache of downloaded files.
+
+    Blobs live under ``objects/<sha256>`` and ``index.json`` maps each URL to
+    the blob it last resolved to, together with the server's ETag and
+    Last-Modified. A cached URL is revalidated with a conditional GET
+    (``If-None-Match`` / ``If-Modified-Since``); only a changed upstream file is
+    downloaded again. When the cache grows past ``max_bytes`` the least
+    recently used blobs are evicted. Recency lives in ``usage.json``, written
+    by :meth:`flush` at the end of a run, so ``index.json`` only changes when a
+    download or eviction changes it (CI keys the saved cache on its hash).
+    Files are handed out as hard links where possible, so deleting the
+    handed-out copy never touches the cache.
+    """
+
+    INDEX_VERSION = 1
+
+    def __init__(self, root: Path, max_bytes: Optional[int] = None):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.objects_dir = self.root / "objects"
+        self.partial_dir = self.root / "partial"
+        self.index_path = self.root / "index.json"
+        self.usage_path = self.root / "usage.json"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.partial_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._pinned: Dict[str, int] = {}
+        self._entries: Dict[str, Dict[str, object]] = self._load_index()
+        self._last_used: Dict[str, float] = self._load_usage()
+        self._usage_changed = False
+        self.hits = 0
+        self.misses = 0
+
+    # --- Index -----------------------------------------------------------
+
+    def _load_index(self) -> Dict[str, Dict[str, object]]:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as handle:
+                data = json.load(handle)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(data, dict) or data.get("version") != self.INDEX_VERSION:
+            return {}
+        entries = data.get("entries")
+        if not isinstance(entries, dict):
+            return {}
+        return {url: entry for url, entry in entries.items() if (self.objects_dir / str(entry.get("sha256"))).exists()}
+
+    def _load_usage(self) -> Dict[str, float]:
+        # Caches written before usage.json existed kept last_used in the index entries.
+        usage = {url: float(entry.pop("last_used")) for url, entry in self._entries.items() if isinstance(entry.get("last_used"), (int, float))}
+        try:
+            with open(self.usage_path, "r", encoding="utf-8") as handle:
+                data = json.load(handle)
+        except (OSError, ValueError):
+            return usage
+        if isinstance(data, dict):
+            usage.update({url: float(value) for url, value in data.items() if url in self._entries and isinstance(value, (int, float))})
+        return usage
+
+    def _save_index(self) -> None:
+        temp_path = self.index_path.with_suffix(".json.tmp")
+        with open(temp_path, "w", encoding="utf-8") as handle:
+            json.dump({"version": self.INDEX_VERSION, "entries": self._entries}, handle, indent=1, sort_keys=True)
+        os.replace(temp_path, self.index_path)
+        self._save_usage()
+
+    def _save_usage(self) -> None:
+        usage = {url: used for url, used in self._last_used.items() if url in self._entries}
+        temp_path = self.usage_path.with_suffix(".json.tmp")
+        with open(temp_path, "w", encoding="utf-8") as handle:
+            json.dump(usage, handle, indent=1, sort_keys=True)
+        os.replace(temp_path, self.usage_path)
+        self._usage_changed = False
+
+    def flush(self) -> None:
+        """Write the recency of cache hits; call once at the end of a run."""
+        with self._lock:
+            if self._usage_changed:
+                self._save_usage()
+
+    def _blob_path(self, digest: str) -> Path:
+        return self.objects_dir / digest
+
+    # --- Public API ------------------------------------------------------
+
+    def fetch(
+        self,
+        url: str,
+        destination: Path,
+        *,
+        attempts: int = 5,
+        timeout: float = 60.0,
+        progress: Optional[Callable[[str], None]] = None,
+        connections: int = 1,
+        mirrors: Sequence[str] = (),
+    ) -> DownloadResult:
+        """Place the current content of ``url`` at ``destination``, downloading only if it changed.
+
+        ``connections`` and ``mirrors`` are passed to :func:`download_segmented`.
+        """
+        destination = Path(destination)
+        conditional_headers: Dict[str, str] = {}
+        with self._lock:
+            entry = dict(self._entries.get(url) or {})
+            cached_digest = str(entry.get("sha256")) if entry else None
+            if cached_digest and self._blob_path(cached_digest).exists():
+                # Pin the blob so a concurrent eviction cannot remove it before it is placed.
+                self._pinned[cached_digest] = self._pinned.get(cached_digest, 0) + 1
+                if entry.get("etag"):
+                    conditional_headers["If-None-Match"] = str(entry["etag"])
+                if entry.get("last_modified"):
+                    conditional_headers["If-Modified-Since"] = str(entry["last_modified"])
+            else:
+                cached_digest = None
+
+        try:
+            return self._fetch(url, destination, entry, conditional_headers, attempts, timeout, progress, connections, mirrors)
+        finally:
+            if cached_digest:
+                with self._lock:
+                    self._pinned[cached_digest] -= 1
+                    if not self._pinned[cached_digest]:
+                        del self._pinned[cached_digest]
+
+    # --- Internals -------------------------------------------------------
+
+    def _fetch(
+        self,
+        url: str,
+        destination: Path,
+        entry: Dict[str, object],
+        conditional_headers: Dict[str, str],
+        attempts: int,
+        timeout: float,
+        progress: Optional[Callable[[str], None]],
+        connections: int,
+        mirrors: Sequence[str],
+    ) -> DownloadResult:
+
+        url_key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        fetched_path = self.partial_dir / url_key
+        try:
+            result = download_segmented(
+                url,
+                fetched_path,
+                self.partial_dir / f"{url_key}.downloading",
+                connections=connections,
+                mirrors=mirrors,
+                attempts=attempts,
+                timeout=timeout,
+                progress=progress,
+                conditional_headers=conditional_headers or None,
+            )
+        except NotModified:
+            self.hits += 1
+            if progress:
+                progress(f"Cache hit for {url}")
+            self._place(self._blob_path(str(entry["sha256"])), destination)
+            with self._lock:
+                if url in self._entries:
+                    self._last_used[url] = time.time()
+                    self._usage_changed = True
+            return DownloadResult(size=int(entry.get("size") or 0), etag=entry.get("etag"), last_modified=entry.get("last_modified"))  # type: ignore[arg-type]
+
+        self.misses += 1
+        digest = _sha256_file(fetched_path)
+        blob_path = self._blob_path(digest)
+        if blob_path.exists():
+            fetched_path.unlink()
+        else:
+            os.replace(fetched_path, blob_path)
+
+        with self._lock:
+            self._entries[url] = {
+                "sha256": digest,
+                "size": blob_path.stat().st_size,
+                "etag": result.etag,
+                "last_modified": result.last_modified,
+            }
+            self._last_used[url] = time.time()
+            self._evict(keep=digest)
+            self._save_index()
+        self._place(blob_path, destination)
+        return result
+
+    def _place(self, blob_path: Path, destination: Path) -> None:
+        temp_path = destination.with_name(destination.name + ".caching")
+        if temp_path.exists():
+            temp_path.unlink()
+        try:
+            os.link(blob_path, temp_path)
+        except OSError:
+            shutil.copyfile(blob_path, temp_path)
+        os.replace(temp_path, destination)
+
+    def _evict(self, keep: str) -> None:
+        if not self.max_bytes:
+            return
+        referenced: Dict[str, float] = {}
+        for url, entry in self._entries.items():
+            digest = str(entry.get("sha256"))
+            referenced[digest] = max(referenced.get(digest, 0.0), self._last_used.get(url, 0.0))
+        sizes = {digest: self._blob_path(digest).stat().st_size for digest in referenced if self._blob_path(digest).exists()}
+        total = sum(sizes.values())
+        for digest, _ in sorted(referenced.items(), key=lambda item: item[1]):
+            if total <= self.max_bytes:
+                break
+            if digest == keep or digest not in sizes or digest in self._pinned:
+                continue
+            self._blob_path(digest).unlink()
+            total -= sizes[digest]
+            self._entries = {url: entry for url, entry in self._entries.items() if entry.get("sha256") != digest}
+
+
+def _sha256_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,130 @@
+"""Append-only journal of per-game sync stage transitions, used to resume an interrupted run."""
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+JOURNAL_NAME = ".sync-journal.jsonl"
+JOURNAL_VERSION = 1
+# Per-game events; the first four in the order a game passes through them.
+GAME_STAGES = ("downloaded", "extracted", "uploaded", "committed", "removed")
+
+
+@dataclass
+class JournalState:
+    """What the journal of an earlier run says had been done when it stopped."""
+
+    started: float = 0.0
+    # Remote top-level folders as listed at the start of the journaled run.
+    inventory: Optional[Set[str]] = None
+    stages: Dict[str, Set[str]] = field(default_factory=dict)
+    indexed: bool = False
+    finished: bool = False
+
+    def games(self, stage: str) -> Set[str]:
+        return {game for game, stages in self.stages.items() if stage in stages}
+
+    def remote_folders(self) -> Optional[Set[str]]:
+        """The remote inventory as it stands after the journaled uploads and removals."""
+        if self.inventory is None:
+            return None
+        return (self.inventory | self.games("uploaded")) - self.games("removed")
+
+
+class SyncJournal:
+    """One JSON record per line, flushed and fsynced before the next step starts.
+
+    A torn final line (the process died mid-write) is ignored when the journal
+    is read back, so every record that made it to disk is trustworthy.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._handle = None
+
+    def load(self) -> Optional[JournalState]:
+        """Replay the journal on disk; None if there is none or it belongs to another version."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as handle:
+                lines = handle.read().splitlines()
+        except OSError:
+            return None
+        state: Optional[JournalState] = None
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            event = record.get("event")
+            if event == "run":
+                if record.get("version") != JOURNAL_VERSION:
+                    return None
+                if state is None:
+                    state = JournalState(started=float(record.get("t") or 0.0))
+                # A resumed run appends to the journal; a finished one never does.
+                state.finished = False
+            elif state is None:
+                continue
+            elif event == "inventory":
+                state.inventory = set(record.get("folders") or [])
+            elif event in GAME_STAGES and record.get("game"):
+                stages = state.stages.setdefault(str(record["game"]), set())
+                if event == "downloaded":
+                    # A fresh archive (a retry or a refresh) has to be extracted again.
+                    stages.discard("extracted")
+                stages.add(event)
+            elif event == "indexed":
+                state.indexed = True
+            elif event == "finished":
+                state.finished = True
+        return state
+
+    def start(self, resume: bool = False) -> None:
+        """Open the journal for this run, appending when resuming and starting over otherwise."""
+        self.close()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._handle = open(self.path, "a" if resume else "w", encoding="utf-8")
+        if resume and self._handle.tell() and not self.path.read_bytes().endswith(b"\n"):
+            # Terminate a torn final record so it cannot swallow the next one.
+            self._handle.write("\n")
+        self._write({"event": "run", "version": JOURNAL_VERSION, "resumed": resume})
+
+    def record(self, event: str, game: Optional[str] = None, **details: object) -> None:
+        record: Dict[str, object] = {"event": event}
+        if game is not None:
+            record["game"] = game
+        record.update(details)
+        self._write(record)
+
+    def record_inventory(self, folders: Iterable[str]) -> None:
+        self._write({"event": "inventory", "folders": sorted(folders)})
+
+    def finish(self) -> None:
+        self._write({"event": "finished"})
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._handle is not None:
+                self._handle.close()
+                self._handle = None
+
+    def _write(self, record: Dict[str, object]) -> None:
+        with self._lock:
+            if self._handle is None:
+                return
+            record = {"t": round(time.time(), 3), **record}
+            self._handle.write(json.dumps(record, separators=(",", ":"), ensure_ascii=False) + "\n")
+            self._handle.flush()
+            os.fsync(self._handle.fileno())
+
+
+def incomplete_extractions(state: JournalState) -> List[str]:
+    """Games whose latest archive was downloaded but never completely extracted."""
+    return sorted(state.games("downloaded") - state.games("extracted"))
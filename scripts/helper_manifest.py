@@ -0,0 +1,321 @@
+"""Server-side sync manifest: one versioned JSON file describing the published data tree."""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from helper_compress import COMPRESSED_TABLE_NAME, sidecar_paths
+
+MANIFEST_NAME = ".sync-manifest.json"
+MANIFEST_VERSION = 2
+# Version 1 stored ``indexes`` as a plain list without content digests.
+_COMPATIBLE_VERSIONS = {1, MANIFEST_VERSION}
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# A file record is [size, mtime, sha256-or-None]; lists keep the JSON compact.
+FileRecord = List[object]
+
+
+def hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def scan_local_folder(folder: Path) -> Tuple[Dict[str, FileRecord], Set[str]]:
+    """Return ``(files, dirs)`` for a local game folder, hashing every file."""
+    folder = Path(folder)
+    files: Dict[str, FileRecord] = {}
+    dirs: Set[str] = set()
+    for root, dir_names, file_names in os.walk(folder):
+        relative_root = os.path.relpath(root, folder).replace(os.sep, "/")
+        prefix = "" if relative_root == "." else f"{relative_root}/"
+        for name in dir_names:
+            dirs.add(f"{prefix}{name}")
+        for name in file_names:
+            path = Path(root) / name
+            stat = path.stat()
+            files[f"{prefix}{name}"] = [stat.st_size, int(stat.st_mtime), hash_file(path)]
+    return files, dirs
+
+
+def parse_find_listing(output: str) -> Tuple[Set[str], Dict[str, Tuple[int, int]], Set[str]]:
+    """Parse ``find . -printf "%y %s %T@ %p\\n"`` output.
+
+    Returns ``(directories, files, index_dirs)`` with paths relative to the
+    listed root (``""`` for the root itself). Hidden entries are ignored and
+    ``index.json`` files are reported through ``index_dirs`` only.
+    """
+    directories: Set[str] = set()
+    files: Dict[str, Tuple[int, int]] = {}
+    index_dirs: Set[str] = set()
+
+    for raw_line in output.strip().splitlines():
+        line = raw_line.strip()
+        if not line:
+            continue
+        try:
+            entry_type, size_str, mtime_str, path_value = line.split(" ", 3)
+        except ValueError:
+            continue
+
+        if path_value.startswith("./"):
+            path_value = path_value[2:]
+        normalized_path = "" if path_value == "." else path_value
+
+        path_parts = [part for part in normalized_path.split("/") if part]
+        if any(part.startswith(".") for part in path_parts):
+            continue
+
+        if entry_type == "d":
+            directories.add(normalized_path)
+        elif entry_type == "f":
+            try:
+                size = int(size_str)
+                mtime = int(float(mtime_str))
+            except ValueError:
+                continue
+            parent_dir = normalized_path.rsplit("/", 1)[0] if "/" in normalized_path else ""
+            if normalized_path.rsplit("/", 1)[-1] == "index.json":
+                index_dirs.add(parent_dir)
+                continue
+            if normalized_path:
+                files[normalized_path] = (size, mtime)
+
+    directories.add("")
+    return directories, files, index_dirs
+
+
+class SyncManifest:
+    """In-memory view of the server manifest.
+
+    ``folders`` maps each top-level game folder to its sub-directories and to
+    ``{relative_file_path: [size, mtime, sha256]}`` (plus an optional ``source``
+    record of the upstream archive's validators and a ``compressed`` map of
+    ``{relative_file_path: {"br": size, "gz": size}}`` for files that have
+    precompressed sidecars, which are themselves listed in ``files`` along
+    with the game's sidecar table, and a
+    ``bundle`` record naming the concatenated bundle of the game's small
+    files, whose two files are listed in ``files`` as well), ``root_files`` holds loose
+    files in the data root and ``indexes`` maps every directory (relative to
+    the data root, ``""`` for the root) that carries an ``index.json`` to the
+    sha256 of the content the sync wrote there. ``store`` lists the blobs of the
+    server-side content store (``sha256 -> size``) and ``stats`` carries run
+    history such as the measured ``throughput`` used by ``--plan``. Hashes are only known for
+    files uploaded by the sync itself; files and indexes discovered by a
+    remote scan carry ``None``.
+    """
+
+    def __init__(self) -> None:
+        self.folders: Dict[str, Dict[str, object]] = {}
+        self.root_files: Dict[str, FileRecord] = {}
+        self.indexes: Dict[str, Optional[str]] = {}
+        self.store: Dict[str, int] = {}
+        self.stats: Dict[str, Dict[str, float]] = {}
+        self.updated: float = 0.0
+
+    # --- Serialization ---------------------------------------------------
+
+    @classmethod
+    def from_json(cls, text: str) -> Optional["SyncManifest"]:
+        """Parse manifest text; returns None for missing, corrupt or foreign-version data."""
+        if not text or not text.strip():
+            return None
+        try:
+            data = json.loads(text)
+        except ValueError:
+            return None
+        if not isinstance(data, dict) or data.get("version") not in _COMPATIBLE_VERSIONS:
+            return None
+        manifest = cls()
+        folders = data.get("folders")
+        if isinstance(folders, dict):
+            for name, folder in folders.items():
+                if isinstance(folder, dict):
+                    manifest.folders[name] = {
+                        "dirs": list(folder.get("dirs") or []),
+                        "files": dict(folder.get("files") or {}),
+                    }
+                    for extra in ("source", "compressed", "bundle"):
+                        if isinstance(folder.get(extra), dict):
+                            manifest.folders[name][extra] = dict(folder[extra])
+        root_files = data.get("root_files")
+        if isinstance(root_files, dict):
+            manifest.root_files = dict(root_files)
+        indexes = data.get("indexes") or {}
+        if isinstance(indexes, list):
+            indexes = {path: None for path in indexes}
+        manifest.indexes = dict(indexes) if isinstance(indexes, dict) else {}
+        store = data.get("store")
+        manifest.store = dict(store) if isinstance(store, dict) else {}
+        stats = data.get("stats")
+        manifest.stats = {key: dict(value) for key, value in stats.items() if isinstance(value, dict)} if isinstance(stats, dict) else {}
+        manifest.updated = float(data.get("updated") or 0.0)
+        return manifest
+
+    def to_json(self) -> str:
+        self.updated = time.time()
+        data = {
+            "version": MANIFEST_VERSION,
+            "updated": int(self.updated),
+            "folders": {name: self.folders[name] for name in sorted(self.folders)},
+            "root_files": self.root_files,
+            "indexes": self.indexes,
+            "store": self.store,
+            "stats": self.stats,
+        }
+        return json.dumps(data, separators=(",", ":"), ensure_ascii=False, sort_keys=True)
+
+    # --- Mutation --------------------------------------------------------
+
+    def set_folder(
+        self,
+        name: str,
+        files: Dict[str, FileRecord],
+        dirs: Iterable[str] = (),
+        source: Optional[Dict[str, object]] = None,
+        compressed: Optional[Dict[str, Dict[str, int]]] = None,
+        bundle: Optional[Dict[str, object]] = None,
+    ) -> None:
+        all_dirs = set(dirs)
+        for path in files:
+            parts = path.split("/")[:-1]
+            for depth in range(1, len(parts) + 1):
+                all_dirs.add("/".join(parts[:depth]))
+        self.folders[name] = {"dirs": sorted(all_dirs), "files": dict(sorted(files.items()))}
+        if source:
+            self.folders[name]["source"] = dict(source)
+        if compressed:
+            self.folders[name]["compressed"] = dict(sorted(compressed.items()))
+        if bundle:
+            self.folders[name]["bundle"] = dict(bundle)
+        # Content changed: its generated indexes must be rewritten.
+        self.drop_indexes(name)
+
+    def remove_folder(self, name: str) -> None:
+        self.folders.pop(name, None)
+        self.drop_indexes(name)
+
+    def drop_indexes(self, name: str) -> None:
+        """Forget the recorded indexes of a top-level folder and its subdirectories."""
+        self.indexes = {path: digest for path, digest in self.indexes.items() if path != name and not path.startswith(f"{name}/")}
+
+    def merge_scan(self, directories: Set[str], files: Dict[str, Tuple[int, int]], index_dirs: Set[str], folders: Optional[Iterable[str]] = None) -> None:
+        """Replace the given top-level folders (default: all) with the result of a remote find.
+
+        Known hashes are kept for files whose size and mtime did not change.
+        """
+        scanned: Dict[str, Dict[str, FileRecord]] = {}
+        root_files: Dict[str, FileRecord] = {}
+        scanned_dirs: Dict[str, Set[str]] = {}
+        for directory in directories:
+            if not directory:
+                continue
+            top, _, rest = directory.partition("/")
+            scanned_dirs.setdefault(top, set())
+            if rest:
+                scanned_dirs[top].add(rest)
+        for path, (size, mtime) in files.items():
+            top, _, rest = path.partition("/")
+            if not rest:
+                root_files[path] = [size, mtime, None]
+                continue
+            previous = self.folders.get(top, {}).get("files", {}).get(rest)  # type: ignore[union-attr]
+            known_hash = previous[2] if previous and previous[0] == size and previous[1] == mtime else None
+            scanned.setdefault(top, {})[rest] = [size, mtime, known_hash]
+
+        targets = set(folders) if folders is not None else set(self.folders) | set(scanned_dirs)
+        for name in targets:
+            if name in scanned_dirs:
+                previous_folder = self.folders.get(name, {})
+                folder_files = dict(sorted(scanned.get(name, {}).items()))
+                self.folders[name] = {"dirs": sorted(scanned_dirs[name]), "files": folder_files}
+                if previous_folder.get("source"):
+                    self.folders[name]["source"] = previous_folder["source"]
+                # Keep sidecar records only while the table, the original and every sidecar are still there.
+                compressed = {
+                    path: variants
+                    for path, variants in (previous_folder.get("compressed") or {}).items()  # type: ignore[union-attr]
+                    if path in folder_files and all(f"{path}.{encoding}" in folder_files for encoding in variants)
+                }
+                if compressed and COMPRESSED_TABLE_NAME in folder_files:
+                    self.folders[name]["compressed"] = compressed
+                bundle = previous_folder.get("bundle")
+                if bundle and all(path in folder_files for path in _bundle_paths(bundle)):  # type: ignore[arg-type]
+                    self.folders[name]["bundle"] = bundle
+            else:
+                self.folders.pop(name, None)
+            previous = {path: digest for path, digest in self.indexes.items() if path == name or path.startswith(f"{name}/")}
+            self.drop_indexes(name)
+            for path in index_dirs:
+                if path == name or path.startswith(f"{name}/"):
+                    self.indexes[path] = previous.get(path)
+        if folders is None:
+            self.root_files = root_files
+            if "" in index_dirs:
+                self.indexes.setdefault("", None)
+            else:
+                self.indexes.pop("", None)
+
+    # --- Queries ---------------------------------------------------------
+
+    def set_source(self, name: str, source: Dict[str, object]) -> None:
+        if name in self.folders:
+            self.folders[name]["source"] = dict(source)
+
+    def folder_names(self) -> Set[str]:
+        return set(self.folders)
+
+    def folder_files(self, name: str) -> Dict[str, FileRecord]:
+        return dict(self.folders.get(name, {}).get("files", {}))  # type: ignore[arg-type]
+
+    def source(self, name: str) -> Optional[Dict[str, object]]:
+        """Validators (url, size, etag, last_modified) of the archive the folder was built from."""
+        source = self.folders.get(name, {}).get("source")
+        return dict(source) if isinstance(source, dict) else None
+
+    def directories(self) -> Set[str]:
+        result = {""}
+        for name, folder in self.folders.items():
+            result.add(name)
+            result.update(f"{name}/{path}" for path in folder.get("dirs", []))  # type: ignore[union-attr]
+        return result
+
+    def hash_locations(self) -> Dict[str, str]:
+        """Map every known file hash to one path (relative to the data root) holding that content."""
+        locations: Dict[str, str] = {}
+        for name, folder in self.folders.items():
+            for path, record in folder.get("files", {}).items():  # type: ignore[union-attr]
+                if record[2]:
+                    locations.setdefault(str(record[2]), f"{name}/{path}")
+        return locations
+
+    def iter_files(self, include_derived: bool = True) -> Iterator[Tuple[str, int]]:
+        """Yield ``(path relative to the data root, size)`` for every file.
+
+        With ``include_derived=False`` the sidecars and bundle files generated
+        by the sync are left out, leaving only the files of the games themselves.
+        """
+        for path, record in self.root_files.items():
+            yield path, int(record[0])
+        for name, folder in self.folders.items():
+            derived: Set[str] = set()
+            if not include_derived:
+                compressed = folder.get("compressed") or {}
+                derived.update(sidecar_paths(compressed))  # type: ignore[arg-type]
+                if compressed:
+                    derived.add(COMPRESSED_TABLE_NAME)
+                derived.update(_bundle_paths(folder.get("bundle")))  # type: ignore[arg-type]
+            for path, record in folder.get("files", {}).items():  # type: ignore[union-attr]
+                if path not in derived:
+                    yield f"{name}/{path}", int(record[0])
+
+
+def _bundle_paths(bundle: Optional[Dict[str, object]]) -> List[str]:
+    return [str(bundle["data"]), str(bundle["table"])] if bundle else []
@@ -0,0 +1,151 @@
+"""Wall-clock timers and byte counters for sync runs, summarized as JSON or OpenMetrics."""
+from __future__ import annotations
+
+import contextlib
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Sequence
+
+from helper_openmetrics import OpenMetricsWriter
+
+METRICS_VERSION = 1
+
+
+def _empty() -> Dict[str, float]:
+    return {"count": 0, "seconds": 0.0, "bytes": 0}
+
+
+class SyncMetrics:
+    """Thread-safe collector for one run.
+
+    ``phase`` times run-level steps (sheet fetch, remote listing, index build),
+    ``stage`` times pipeline stages on behalf of one or more games (a batch
+    splits its time evenly), ``add_bytes`` attributes transferred bytes to a
+    game and stage, and ``count`` bumps plain counters such as ssh round trips.
+    Stage seconds are busy time summed over workers, so with parallel workers
+    they can exceed the wall-clock duration of the run.
+    """
+
+    def __init__(self) -> None:
+        self.started = time.time()
+        self._started_monotonic = time.monotonic()
+        self._lock = threading.Lock()
+        self.phases: Dict[str, Dict[str, float]] = {}
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.games: Dict[str, Dict[str, Dict[str, float]]] = {}
+        self.counters: Dict[str, int] = {}
+        self.gauges: Dict[str, float] = {}
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record_phase(name, time.monotonic() - started)
+
+    def record_phase(self, name: str, seconds: float) -> None:
+        with self._lock:
+            phase = self.phases.setdefault(name, _empty())
+            phase["count"] += 1
+            phase["seconds"] += seconds
+
+    @contextlib.contextmanager
+    def stage(self, name: str, games: Sequence[str]) -> Iterator[None]:
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                stage = self.stages.setdefault(name, _empty())
+                stage["count"] += max(1, len(games))
+                stage["seconds"] += elapsed
+                for game in games:
+                    record = self.games.setdefault(game, {}).setdefault(name, _empty())
+                    record["count"] += 1
+                    record["seconds"] += elapsed / len(games)
+
+    def add_bytes(self, stage: str, game: Optional[str], size: int) -> None:
+        with self._lock:
+            self.stages.setdefault(stage, _empty())["bytes"] += size
+            if game is not None:
+                self.games.setdefault(game, {}).setdefault(stage, _empty())["bytes"] += size
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_gauge(self, name: str, value: float) -> None:
+        with self._lock:
+            self.gauges[name] = value
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self._started_monotonic
+
+    def summary(self) -> Dict[str, object]:
+        with self._lock:
+            stages = {}
+            for name, stage in self.stages.items():
+                stages[name] = {
+                    **_rounded(stage),
+                    "throughput": round(stage["bytes"] / stage["seconds"]) if stage["seconds"] and stage["bytes"] else None,
+                }
+            return {
+                "version": METRICS_VERSION,
+                "started": int(self.started),
+                "wall_seconds": round(self.elapsed(), 3),
+                "phases": {name: _rounded(phase) for name, phase in sorted(self.phases.items())},
+                "stages": dict(sorted(stages.items())),
+                "games": {
+                    game: {name: _rounded(record) for name, record in sorted(records.items())}
+                    for game, records in sorted(self.games.items())
+                },
+                "counters": dict(sorted(self.counters.items())),
+                "gauges": dict(sorted(self.gauges.items())),
+            }
+
+    def write_json(self, path: Path) -> None:
+        path = Path(path)
+        temp_path = path.with_name(path.name + ".tmp")
+        temp_path.write_text(json.dumps(self.summary(), indent=2) + "\n", encoding="utf-8")
+        temp_path.replace(path)
+
+
+def write_openmetrics(metrics: SyncMetrics, path: Path, success: bool, prefix: str = "scummvm_sync") -> None:
+    """Export the run as an OpenMetrics textfile (gauges, counters and per-game stage histograms)."""
+    writer = OpenMetricsWriter()
+    writer.gauge(f"{prefix}_last_run_timestamp_seconds", "Unix time the run started", int(metrics.started))
+    writer.gauge(f"{prefix}_success", "1 if the run completed without an error", 1 if success else 0)
+    writer.gauge(f"{prefix}_duration_seconds", "Wall-clock duration of the run", round(metrics.elapsed(), 3))
+    with metrics._lock:
+        phases = dict(metrics.phases)
+        stages = dict(metrics.stages)
+        games = {game: dict(records) for game, records in metrics.games.items()}
+        counters = dict(metrics.counters)
+        gauges = dict(metrics.gauges)
+    for name, phase in sorted(phases.items()):
+        writer.gauge(f"{prefix}_phase_duration_seconds", "Wall-clock time spent in each phase of the run", round(phase["seconds"], 3), {"phase": name})
+    for name, stage in sorted(stages.items()):
+        writer.counter(f"{prefix}_stage_bytes", "Bytes moved by each pipeline stage", int(stage["bytes"]), {"stage": name})
+    for name, stage in sorted(stages.items()):
+        writer.counter(f"{prefix}_stage_busy_seconds", "Worker time spent in each pipeline stage", round(stage["seconds"], 3), {"stage": name})
+    for name in sorted(stages):
+        observations = [records[name]["seconds"] for records in games.values() if name in records and records[name]["count"]]
+        writer.histogram(f"{prefix}_game_stage_duration_seconds", "Per-game time spent in each pipeline stage", observations, labels={"stage": name})
+    for name, value in sorted(counters.items()):
+        if name.endswith("_commands"):
+            writer.counter(f"{prefix}_remote_commands", "ssh/scp commands run against the host", value, {"command": name[: -len("_commands")]})
+        elif name.startswith("games_"):
+            writer.counter(f"{prefix}_games", "Games by outcome of this run", value, {"result": name[len("games_"):]})
+        else:
+            writer.counter(f"{prefix}_{name}", f"Run counter {name}", value)
+    for name, value in sorted(gauges.items()):
+        writer.gauge(f"{prefix}_{name}", f"Value of {name} at the end of the run", value)
+    writer.write(path)
+
+
+def _rounded(record: Dict[str, float]) -> Dict[str, float]:
+    return {"count": int(record["count"]), "seconds": round(record["seconds"], 3), "bytes": int(record["bytes"])}
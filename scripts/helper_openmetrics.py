@@ -0,0 +1,81 @@
+"""Minimal Prometheus text exposition for node_exporter's textfile collector."""
+from __future__ import annotations
+
+import math
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Per-game stage durations span sub-second copies to half-hour uploads.
+DURATION_BUCKETS = (0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+Labels = Optional[Dict[str, str]]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Labels, extra: Sequence[Tuple[str, str]] = ()) -> str:
+    pairs = list((labels or {}).items()) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class OpenMetricsWriter:
+    """Collect metric families and render them as one OpenMetrics text document.
+
+    Families keep the order of their first sample; samples of the same family
+    with different labels are grouped under one ``# TYPE`` / ``# HELP`` header.
+    """
+
+    def __init__(self) -> None:
+        self._families: Dict[str, Dict[str, object]] = {}
+
+    def gauge(self, name: str, help_text: str, value: float, labels: Labels = None) -> None:
+        self._family(name, "gauge", help_text).append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    def counter(self, name: str, help_text: str, value: float, labels: Labels = None) -> None:
+        # node_exporter parses the Prometheus text format, where the family is named
+        # exactly like its samples; a bare ``name`` family would be dropped as empty.
+        self._family(f"{name}_total", "counter", help_text).append(f"{name}_total{_format_labels(labels)} {_format_value(value)}")
+
+    def histogram(self, name: str, help_text: str, observations: Iterable[float], buckets: Sequence[float] = DURATION_BUCKETS, labels: Labels = None) -> None:
+        values = sorted(observations)
+        samples = self._family(name, "histogram", help_text)
+        for bound in list(buckets) + [math.inf]:
+            count = sum(1 for value in values if value <= bound)
+            samples.append(f"{name}_bucket{_format_labels(labels, [('le', _format_value(float(bound)))])} {count}")
+        samples.append(f"{name}_sum{_format_labels(labels)} {_format_value(float(sum(values)))}")
+        samples.append(f"{name}_count{_format_labels(labels)} {len(values)}")
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for name, family in self._families.items():
+            lines.append(f"# TYPE {name} {family['type']}")
+            lines.append(f"# HELP {name} {_escape(str(family['help']))}")
+            lines.extend(family["samples"])  # type: ignore[arg-type]
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: Path) -> None:
+        """Write atomically so the collector never reads a half-written file."""
+        path = Path(path)
+        temp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        temp_path.write_text(self.render(), encoding="utf-8")
+        os.replace(temp_path, path)
+
+    def _family(self, name: str, metric_type: str, help_text: str) -> List[str]:
+        family = self._families.setdefault(name, {"type": metric_type, "help": help_text, "samples": []})
+        if family["type"] != metric_type:
+            raise ValueError(f"Metric {name} already registered as {family['type']}")
+        return family["samples"]  # type: ignore[return-value]
@@ -0,0 +1,310 @@
+"""Bounded multi-stage worker pipeline used to overlap downloads, extraction and uploads."""
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+# Marker pushed through the queues to tell a worker its stage has been closed.
+_SENTINEL = object()
+
+
+class Stage(NamedTuple):
+    """One pipeline stage.
+
+    With ``batch_size`` > 1 the callable receives a list of up to that many
+    items (waiting at most ``batch_linger`` seconds for the list to fill) and
+    returns a list of items to forward, or ``None``.
+    """
+
+    name: str
+    func: Callable
+    workers: int = 1
+    batch_size: int = 1
+    batch_linger: float = 0.0
+
+
+class Pipeline:
+    """Run items through a fixed sequence of stages, each with its own worker pool.
+
+    Every stage reads from a bounded queue, so a slow stage applies back-pressure
+    to the ones before it instead of letting finished work pile up on disk. A stage
+    callable returns the item to hand to the next stage, or ``None`` to drop it.
+    The first exception raised by any worker aborts the pipeline: remaining items
+    are drained without being processed and the exception is re-raised by
+    :meth:`close` (or when leaving the ``with`` block). ``on_drop`` is called
+    once for every item that leaves the pipeline unfinished, either because its
+    stage raised or because the pipeline was aborted while it was queued, so
+    callers can hand back whatever the item was holding.
+    """
+
+    def __init__(self, stages: Sequence[Sequence], queue_size: int = 2, on_drop: Optional[Callable[[object], None]] = None):
+        if not stages:
+            raise ValueError("Pipeline needs at least one stage")
+        self._stages: List[Stage] = []
+        for spec in stages:
+            stage = Stage(*spec)
+            self._stages.append(stage._replace(workers=max(1, int(stage.workers)), batch_size=max(1, int(stage.batch_size))))
+        self._queues: List[queue.Queue] = [queue.Queue(maxsize=max(1, queue_size, stage.batch_size)) for stage in self._stages]
+        self._remaining = [stage.workers for stage in self._stages]
+        self._lock = threading.Lock()
+        self._aborted = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._threads: List[threading.Thread] = []
+        self._closed = False
+        self._on_drop = on_drop
+
+        for index, stage in enumerate(self._stages):
+            for worker in range(stage.workers):
+                thread = threading.Thread(target=self._worker, args=(index,), name=f"{stage.name}-{worker}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    # --- Public API ------------------------------------------------------
+
+    @property
+    def aborted(self) -> bool:
+        return self._aborted.is_set()
+
+    def submit(self, item: object) -> bool:
+        """Queue an item for the first stage, blocking while that stage is full.
+
+        Returns False once the pipeline has been aborted so callers can stop
+        producing work.
+        """
+        if self._closed:
+            raise RuntimeError("Cannot submit to a closed pipeline")
+        while not self._aborted.is_set():
+            try:
+                self._queues[0].put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def abort(self, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            if error is not None and self._error is None:
+                self._error = error
+        self._aborted.set()
+
+    def close(self) -> None:
+        """Wait for all queued items to pass every stage and re-raise the first failure."""
+        if not self._closed:
+            self._closed = True
+            for _ in range(self._stages[0].workers):
+                self._queues[0].put(_SENTINEL)
+        for thread in self._threads:
+            thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self) -> "Pipeline":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_value is not None:
+            # The producer failed: stop processing, let the workers wind down and
+            # surface the producer's exception rather than a secondary one.
+            self.abort()
+            try:
+                self.close()
+            except BaseException:
+                pass
+            return
+        self.close()
+
+    # --- Workers ---------------------------------------------------------
+
+    def _worker(self, index: int) -> None:
+        stage = self._stages[index]
+        inbox = self._queues[index]
+        is_last = index == len(self._stages) - 1
+
+        closed = False
+        while not closed:
+            item = inbox.get()
+            if item is _SENTINEL:
+                break
+            if stage.batch_size > 1:
+                item, closed = self._collect_batch(inbox, item, stage)
+            if self._aborted.is_set():
+                self._drop(item if stage.batch_size > 1 else [item])
+                continue
+            try:
+                result = stage.func(item)
+            except BaseException as exc:  # noqa: BLE001 - re-raised from close()
+                self.abort(exc)
+                self._drop(item if stage.batch_size > 1 else [item])
+                continue
+            if result is None or is_last:
+                continue
+            for forwarded in (result if stage.batch_size > 1 else [result]):
+                if not self._forward(index + 1, forwarded):
+                    self._drop([forwarded])
+
+        with self._lock:
+            self._remaining[index] -= 1
+            last_out = self._remaining[index] == 0
+        if last_out and not is_last:
+            for _ in range(self._stages[index + 1].workers):
+                self._queues[index + 1].put(_SENTINEL)
+
+    def _collect_batch(self, inbox: queue.Queue, first: object, stage: Stage):
+        """Gather up to ``batch_size`` items; returns (batch, stage_closed)."""
+        batch = [first]
+        deadline = time.monotonic() + stage.batch_linger
+        while len(batch) < stage.batch_size:
+            try:
+                item = inbox.get(timeout=max(0.0, deadline - time.monotonic())) if stage.batch_linger else inbox.get_nowait()
+            except queue.Empty:
+                break
+            if item is _SENTINEL:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _forward(self, index: int, item: object) -> bool:
+        outbox = self._queues[index]
+        while not self._aborted.is_set():
+            try:
+                outbox.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _drop(self, items: List[object]) -> None:
+        if self._on_drop is None:
+            return
+        for item in items:
+            try:
+                self._on_drop(item)
+            except BaseException as exc:  # noqa: BLE001 - re-raised from close()
+                self.abort(exc)
+
+
+class TransferBudget:
+    """Thread-safe cap on committed transfers, transferred bytes and wall-clock time.
+
+    Mirrors the serial ``--max-transfers`` semantics under concurrency: a slot is
+    reserved before work starts and only counts once the transfer commits, so a
+    failed or skipped transfer hands its slot back to the next candidate. Bytes
+    are reserved the same way; a transfer that would overshoot ``max_bytes`` is
+    refused while smaller ones later in the queue may still fit. Past
+    ``deadline`` (a ``time.monotonic()`` value) nothing new is admitted, and once
+    some bytes have committed a transfer the observed throughput says cannot
+    finish in time is refused as well.
+    """
+
+    def __init__(self, limit: Optional[int], max_bytes: Optional[int] = None, deadline: Optional[float] = None):
+        self.limit = limit
+        self.max_bytes = max_bytes
+        self.deadline = deadline
+        self.committed = 0
+        self.committed_bytes = 0
+        self._in_flight = 0
+        self._in_flight_bytes = 0
+        self._started = time.monotonic()
+        self._condition = threading.Condition()
+        # Whether the last refused acquire() hit the byte or time budget rather than ``limit``.
+        self.refused_by_budget = False
+
+    def acquire(self, abort: Optional[Callable[[], bool]] = None, size: int = 0) -> bool:
+        """Reserve a slot, waiting on in-flight transfers when they decide the outcome."""
+        with self._condition:
+            self.refused_by_budget = False
+            if not self._fits(size):
+                self.refused_by_budget = True
+                return False
+            if self.limit is None:
+                self._reserve(size)
+                return True
+            while self.committed + self._in_flight >= self.limit and self._in_flight and self.committed < self.limit:
+                if abort is not None and abort():
+                    return False
+                self._condition.wait(timeout=0.5)
+            if self.committed + self._in_flight >= self.limit:
+                return False
+            if not self._fits(size):
+                self.refused_by_budget = True
+                return False
+            self._reserve(size)
+            return True
+
+    def release(self, committed: bool, size: int = 0) -> None:
+        with self._condition:
+            self._in_flight -= 1
+            self._in_flight_bytes -= size
+            if committed:
+                self.committed += 1
+                self.committed_bytes += size
+            self._condition.notify_all()
+
+    def _reserve(self, size: int) -> None:
+        self._in_flight += 1
+        self._in_flight_bytes += size
+
+    def _fits(self, size: int) -> bool:
+        if self.max_bytes is not None and self.committed_bytes + self._in_flight_bytes + size > self.max_bytes:
+            return False
+        if self.deadline is None:
+            return True
+        now = time.monotonic()
+        if now >= self.deadline:
+            return False
+        if self.committed_bytes and size:
+            rate = self.committed_bytes / max(now - self._started, 1e-3)
+            return now + (self._in_flight_bytes + size) / rate <= self.deadline
+        return True
+
+
+class StagingBudget:
+    """Thread-safe cap on the local disk space used by games between download and upload.
+
+    Each game reserves its estimated footprint (archive plus extracted size)
+    under a key before it is downloaded; admission blocks while the reservation
+    would push the bytes in flight past ``max_bytes``. A game that alone exceeds
+    the budget is still admitted once nothing else is staged, so an oversized
+    demo slows the run down instead of stalling it. Estimates can be corrected
+    with :meth:`adjust` once the real size is known, and :meth:`release` hands
+    the space back as soon as the game's local files are gone.
+    """
+
+    def __init__(self, max_bytes: Optional[int]):
+        self.max_bytes = max_bytes
+        self.peak = 0
+        self._reserved: Dict[str, int] = {}
+        self._condition = threading.Condition()
+
+    @property
+    def in_use(self) -> int:
+        with self._condition:
+            return sum(self._reserved.values())
+
+    def acquire(self, key: str, size: int, abort: Optional[Callable[[], bool]] = None) -> bool:
+        """Reserve ``size`` bytes for ``key``, waiting for staged games to be released."""
+        with self._condition:
+            while self.max_bytes is not None and self._reserved and sum(self._reserved.values()) + size > self.max_bytes:
+                if abort is not None and abort():
+                    return False
+                self._condition.wait(timeout=0.5)
+            self._set(key, size)
+            return True
+
+    def adjust(self, key: str, size: int) -> None:
+        """Replace the reservation of an admitted game with a better estimate (never blocks)."""
+        with self._condition:
+            if key in self._reserved:
+                self._set(key, size)
+                self._condition.notify_all()
+
+    def release(self, key: str) -> None:
+        with self._condition:
+            if self._reserved.pop(key, None) is not None:
+                self._condition.notify_all()
+
+    def _set(self, key: str, size: int) -> None:
+        self._reserved[key] = max(0, size)
+        self.peak = max(self.peak, sum(self._reserved.values()))
@@ -0,0 +1,92 @@
+"""Dry-run planning: the actions a sync would take and what they are expected to cost."""
+from __future__ import annotations
+
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, List, Optional
+
+PLAN_VERSION = 1
+# Used until a real run has recorded throughput in the server manifest (bytes/second).
+DEFAULT_THROUGHPUT = {"download": 8 * 1024 * 1024, "upload": 2 * 1024 * 1024}
+# Weight of the newest run in the recorded moving average.
+THROUGHPUT_SMOOTHING = 0.3
+# Rough cost of one ssh round trip (removal, index write) when nothing else is known.
+ROUND_TRIP_SECONDS = 1.0
+
+
+@dataclass
+class PlanAction:
+    """One step of a sync plan. Byte counts are None when they could not be estimated."""
+
+    action: str
+    game: Optional[str] = None
+    reason: Optional[str] = None
+    url: Optional[str] = None
+    download_bytes: Optional[int] = None
+    upload_bytes: Optional[int] = None
+    estimated_seconds: Optional[float] = None
+    destructive: bool = False
+
+    def to_dict(self) -> Dict[str, object]:
+        return {key: value for key, value in asdict(self).items() if value is not None and value is not False}
+
+
+def update_throughput(history: Dict[str, float], kind: str, size: int, seconds: float) -> None:
+    """Fold one run's ``size`` bytes in ``seconds`` into the moving average stored in ``history``."""
+    if size <= 0 or seconds <= 0:
+        return
+    rate = size / seconds
+    previous = history.get(kind)
+    history[kind] = rate if not previous else previous + THROUGHPUT_SMOOTHING * (rate - float(previous))
+
+
+def transfer_seconds(download_bytes: Optional[int], upload_bytes: Optional[int], throughput: Dict[str, float]) -> Optional[float]:
+    """Serial time one game spends downloading and uploading at the given rates."""
+    if download_bytes is None and upload_bytes is None:
+        return None
+    seconds = (download_bytes or 0) / throughput["download"] + (upload_bytes or 0) / throughput["upload"]
+    return round(seconds, 1)
+
+
+def build_plan(
+    actions: Iterable[PlanAction],
+    throughput: Dict[str, float],
+    throughput_source: str,
+    download_workers: int = 1,
+    upload_workers: int = 1,
+    settings: Optional[Dict[str, object]] = None,
+) -> Dict[str, object]:
+    """Assemble the machine-readable plan document.
+
+    The total duration assumes the pipeline is bound by its slowest stage: all
+    downloads spread over ``download_workers`` or all uploads spread over
+    ``upload_workers``, whichever takes longer, plus the ssh round trips.
+    """
+    actions = list(actions)
+    counts: Dict[str, int] = {}
+    for action in actions:
+        counts[action.action] = counts.get(action.action, 0) + 1
+    transfers = [action for action in actions if action.action in ("transfer", "refresh")]
+    download_bytes = sum(action.download_bytes or 0 for action in transfers)
+    upload_bytes = sum(action.upload_bytes or 0 for action in transfers)
+    round_trips = sum(action.estimated_seconds or 0.0 for action in actions if action.action in ("remove", "rebuild_index"))
+    seconds = max(
+        download_bytes / (throughput["download"] * max(1, download_workers)),
+        upload_bytes / (throughput["upload"] * max(1, upload_workers)),
+    ) + round_trips
+    unknown: List[str] = [str(action.game) for action in transfers if action.download_bytes is None]
+    return {
+        "version": PLAN_VERSION,
+        "generated": int(time.time()),
+        "settings": settings or {},
+        "throughput": {"download": round(throughput["download"]), "upload": round(throughput["upload"]), "source": throughput_source},
+        "totals": {
+            "actions": counts,
+            "download_bytes": download_bytes,
+            "upload_bytes": upload_bytes,
+            "estimated_seconds": round(seconds, 1),
+            "destructive": sum(1 for action in actions if action.destructive),
+            "unknown_size": unknown,
+        },
+        "actions": [action.to_dict() for action in actions],
+    }
@@ -0,0 +1,88 @@
+"""Size-aware transfer scheduling: probe download sizes up front and order pending games."""
+from __future__ import annotations
+
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, TypeVar
+
+# "name" keeps the historical relative_path order.
+ORDER_POLICIES = ("name", "smallest", "featured")
+PROBE_WORKERS = 8
+
+T = TypeVar("T")
+
+_SIZE_UNITS = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+_DURATION_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600}
+
+
+@dataclass
+class TransferCandidate:
+    """A game that is missing on the remote and will be transferred."""
+
+    relative_path: str
+    url: str
+    size: Optional[int] = None
+    featured: bool = False
+
+
+def parse_size(value: str) -> int:
+    """Parse ``"750M"``, ``"2G"``, ``"1.5g"`` or a plain byte count."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?\s*", value.lower())
+    if not match:
+        raise ValueError(f"Invalid size: {value!r}")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2)])
+
+
+def parse_duration(value: str) -> float:
+    """Parse ``"90"`` (seconds), ``"45m"`` or ``"1.5h"``."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smh]?)\s*", value.lower())
+    if not match:
+        raise ValueError(f"Invalid duration: {value!r}")
+    return float(match.group(1)) * _DURATION_UNITS[match.group(2)]
+
+
+def format_size(size: int) -> str:
+    value = float(size)
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if value < 1024 or unit == "GiB":
+            return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{size} B"
+
+
+def probe_urls(urls: Iterable[str], probe: Callable[[str], T], workers: int = PROBE_WORKERS) -> Dict[str, T]:
+    """Run ``probe`` for every distinct URL in parallel and return ``{url: result}``."""
+    unique = list(dict.fromkeys(urls))
+    if not unique:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(unique)))) as executor:
+        return dict(zip(unique, executor.map(probe, unique)))
+
+
+def probe_sizes(candidates: Iterable[TransferCandidate], probe: Callable[[str], Optional[int]], workers: int = PROBE_WORKERS) -> None:
+    """Fill in ``size`` for every candidate that does not know it yet, probing in parallel."""
+    unknown = [candidate for candidate in candidates if candidate.size is None]
+    sizes = probe_urls((candidate.url for candidate in unknown), probe, workers)
+    for candidate in unknown:
+        candidate.size = sizes[candidate.url]
+
+
+def order_candidates(candidates: Iterable[TransferCandidate], policy: str) -> List[TransferCandidate]:
+    """Return the candidates in the order they should be admitted.
+
+    ``smallest`` moves the cheap games forward so a time- or byte-boxed run
+    completes as many as possible; ``featured`` does the same within the
+    featured set first. Games of unknown size go last in both.
+    """
+    if policy not in ORDER_POLICIES:
+        raise ValueError(f"Unknown transfer order: {policy}")
+
+    def by_size(candidate: TransferCandidate):
+        return (candidate.size is None, candidate.size or 0, candidate.relative_path)
+
+    if policy == "smallest":
+        return sorted(candidates, key=by_size)
+    if policy == "featured":
+        return sorted(candidates, key=lambda candidate: (not candidate.featured,) + by_size(candidate))
+    return sorted(candidates, key=lambda candidate: candidate.relative_path)
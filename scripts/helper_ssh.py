@@ -1,21 +1,128 @@
 """Helpers for building SSH/SCP commands with persistent control sockets."""
 from __future__ import annotations
 
+import base64
+import collections
+import contextlib
 import os
+import secrets
+import select
+import shlex
 import subprocess
-from typing import Dict, List, Optional, Tuple
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
 CONTROL_PATH = "/tmp/scummvm-ssh-%r@%h:%p"
+# How long a new remote shell may take to answer its handshake (prompts or a hung master never do).
+SHELL_START_TIMEOUT = 30.0
 
 
-class SSHHelper:
-    """Build ssh/scp commands and manage a persistent control socket."""
+@dataclass
+class RemoteEntry:
+    """One direct child of the remote data root as reported by the inventory probe."""
+
+    name: str
+    kind: str  # "d" directory, "f" regular file, other find %Y letters otherwise
+    size: int
+    has_index: bool = False
+
+    @property
+    def is_dir(self) -> bool:
+        return self.kind == "d"
+
+
+def build_inventory_command(base_path: str) -> str:
+    """Remote shell command listing every entry of ``base_path`` in one round trip.
+
+    Emits ``<type> <size> <name>`` per direct child (symlinks resolved like
+    ``test -d``) followed by ``i 0 <name>`` for each child directory holding an
+    ``index.json``.
+    """
+    return (
+        f'cd "{base_path}" && '
+        'find . -mindepth 1 -maxdepth 1 -printf "%Y %s %P\\n" && '
+        'find -L . -mindepth 2 -maxdepth 2 -name index.json -type f -printf "i 0 %h\\n"'
+    )
+
+
+def parse_inventory(output: str) -> Dict[str, RemoteEntry]:
+    """Parse the output of :func:`build_inventory_command` into entries keyed by name."""
+    entries: Dict[str, RemoteEntry] = {}
+    index_dirs = set()
+    for raw_line in output.splitlines():
+        try:
+            kind, size_str, name = raw_line.split(" ", 2)
+        except ValueError:
+            continue
+        name = name[2:] if name.startswith("./") else name
+        if not name or "/" in name or name.startswith("."):
+            # Hidden entries (the sync manifest, .htaccess, ...) are skipped like ``ls -1`` does.
+            continue
+        if kind == "i":
+            index_dirs.add(name)
+            continue
+        try:
+            size = int(size_str)
+        except ValueError:
+            size = 0
+        entries[name] = RemoteEntry(name=name, kind=kind, size=size)
+    for name in index_dirs:
+        if name in entries:
+            entries[name].has_index = True
+    return entries
+
 
-    def __init__(self, server: Optional[str], port: Optional[int]):
+class SSHConnectionPool:
+    """A fixed set of ssh ControlMaster connections to one server.
+
+    Every master has its own control socket, so N concurrent transfers run on
+    N TCP connections instead of sharing one. :meth:`lease` hands out the least
+    loaded connection for the current thread; commands built inside the lease
+    (:meth:`build_command`) go through that master. Masters run with ssh
+    keepalives so a dead link is noticed, and a lease re-opens a master whose
+    ``ssh -O check`` fails before handing it out.
+    """
+
+    HEALTH_CHECK_INTERVAL = 30.0
+
+    def __init__(
+        self,
+        server: Optional[str],
+        port: Optional[int],
+        size: int = 1,
+        *,
+        connect_timeout: int = 20,
+        keepalive_interval: int = 15,
+        keepalive_count: int = 4,
+        log: Optional[Callable[[str], None]] = None,
+    ):
         self.server = server
         self.port = port
+        self.size = max(1, size)
+        self.connect_timeout = connect_timeout
+        self.keepalive_interval = keepalive_interval
+        self.keepalive_count = keepalive_count
+        self.log = log
+        self._lock = threading.Lock()
+        self._in_flight = [0] * self.size
+        self._last_check = [0.0] * self.size
+        self._next = 0
+        self._local = threading.local()
 
-    def build_persistent_command(self, base_command: str = "ssh") -> Tuple[List[str], Dict[str, str]]:
+    # --- Command building ------------------------------------------------
+
+    def control_path(self, index: int = 0) -> str:
+        # The first master keeps the historical socket name so existing tooling still finds it.
+        return CONTROL_PATH if index == 0 else f"{CONTROL_PATH}-{index}"
+
+    def _port_args(self, base_command: str) -> List[str]:
+        if not self.port:
+            return []
+        return ["-P" if base_command == "scp" else "-p", str(self.port)]
+
+    def build_persistent_command(self, base_command: str = "ssh", index: int = 0) -> Tuple[List[str], Dict[str, str]]:
         """Return (command, environment) preconfigured for ControlMaster."""
         cmd: List[str] = []
         env = os.environ.copy()
@@ -31,21 +138,24 @@ class SSHHelper:
         if ssh_key and not ssh_password:
             cmd.extend(["-i", ssh_key])
 
-        if self.port:
-            port_value = str(self.port)
-            if base_command == "scp":
-                cmd.extend(["-P", port_value])
-            else:
-                cmd.extend(["-p", port_value])
+        cmd.extend(self._port_args(base_command))
 
+        # Force IPv4: GitHub Actions runners have no outbound IPv6, so if the
+        # host has an AAAA record OpenSSH tries IPv6 first and hangs on the TCP
+        # connect until it times out (~3 min). Fail fast on IPv4 instead.
+        cmd.extend(["-4", "-o", f"ConnectTimeout={self.connect_timeout}"])
         cmd.extend(
             [
                 "-o",
                 "ControlMaster=auto",
                 "-o",
-                f"ControlPath={CONTROL_PATH}",
+                f"ControlPath={self.control_path(index)}",
                 "-o",
                 "ControlPersist=600",
+                "-o",
+                f"ServerAliveInterval={self.keepalive_interval}",
+                "-o",
+                f"ServerAliveCountMax={self.keepalive_count}",
             ]
         )
 
@@ -56,40 +166,288 @@ class SSHHelper:
 
         return cmd, env
 
-    def build_controlpath_command(self, base_command: str = "ssh") -> List[str]:
-        """Return a command that reuses the persistent connection."""
+    def build_command(self, base_command: str = "ssh", index: Optional[int] = None) -> List[str]:
+        """Return a command that reuses a master (the leased one, or ``index``)."""
+        if index is None:
+            index = self.current_index()
         cmd = [base_command]
-        if self.port:
-            port_value = str(self.port)
-            if base_command == "scp":
-                cmd.extend(["-P", port_value])
-            else:
-                cmd.extend(["-p", port_value])
-        cmd.extend(["-o", f"ControlPath={CONTROL_PATH}"])
+        cmd.extend(self._port_args(base_command))
+        cmd.extend(["-4", "-o", f"ControlPath={self.control_path(index)}"])
         return cmd
 
-    def open_persistent_connection(self) -> None:
-        """Open the ControlMaster socket if a server is configured."""
+    def current_index(self) -> int:
+        """The master leased by the current thread, or the first one outside a lease."""
+        return getattr(self._local, "index", None) or 0
+
+    # --- Connection management ------------------------------------------
+
+    def open_connection(self, index: int, attempts: int = 1) -> bool:
+        if not self.server:
+            return False
+        cmd, env = self.build_persistent_command(index=index)
+        ssh_pos = next((i for i, arg in enumerate(cmd) if arg in {"ssh", "scp"}), 0)
+        cmd.insert(ssh_pos + 1, "-MNf")
+        cmd.append(self.server)
+        for attempt in range(1, attempts + 1):
+            result = subprocess.run(cmd, env=env)
+            if result.returncode == 0:
+                with self._lock:
+                    self._last_check[index] = time.monotonic()
+                return True
+            if attempt < attempts:
+                delay = min(60, 10 * attempt)
+                if self.log:
+                    self.log(f"SSH connect failed (exit {result.returncode}); retry {attempt}/{attempts - 1} in {delay}s")
+                time.sleep(delay)
+        return False
+
+    def open(self, attempts: int = 1) -> None:
+        """Open every master; the first one must succeed, extra ones are best effort."""
         if not self.server:
             return
-        cmd, env = self.build_persistent_command()
-        for index, argument in enumerate(cmd):
-            if argument in {"ssh", "scp"}:
-                cmd.insert(index + 1, "-MNf")
+        if not self.open_connection(0, attempts):
+            raise RuntimeError(f"Could not open SSH connection after {attempts} attempts")
+        opened = 1
+        for index in range(1, self.size):
+            if self.open_connection(index, attempts=2):
+                opened += 1
+            else:
                 break
-        cmd.append(self.server)
-        subprocess.run(cmd, check=True, env=env)
+        if opened < self.size:
+            # The shared host caps concurrent sessions; work with what we got.
+            if self.log:
+                self.log(f"Only {opened} of {self.size} SSH connections could be opened")
+            self.size = opened
+            self._in_flight = self._in_flight[:opened]
+            self._last_check = self._last_check[:opened]
+
+    def check(self, index: int) -> bool:
+        if not self.server:
+            return False
+        cmd = ["ssh", "-O", "check", "-o", f"ControlPath={self.control_path(index)}", self.server]
+        return subprocess.run(cmd, check=False, capture_output=True).returncode == 0
+
+    def close(self) -> List[subprocess.CompletedProcess]:
+        results: List[subprocess.CompletedProcess] = []
+        if not self.server:
+            return results
+        for index in range(self.size):
+            cmd = ["ssh", "-O", "exit", "-o", f"ControlPath={self.control_path(index)}", self.server]
+            results.append(subprocess.run(cmd, check=False, capture_output=True))
+        return results
+
+    @contextlib.contextmanager
+    def lease(self) -> Iterator[int]:
+        """Bind the least loaded healthy master to the current thread for the duration."""
+        if getattr(self._local, "index", None) is not None:
+            # Nested lease on the same thread: keep using the outer connection.
+            yield self._local.index
+            return
+        with self._lock:
+            lowest = min(self._in_flight)
+            candidates = [i for i in range(self.size) if self._in_flight[i] == lowest]
+            index = min(candidates, key=lambda i: (i - self._next) % self.size)
+            self._next = (index + 1) % self.size
+            self._in_flight[index] += 1
+            needs_check = time.monotonic() - self._last_check[index] > self.HEALTH_CHECK_INTERVAL
+        try:
+            if needs_check and self.server:
+                if self.check(index):
+                    with self._lock:
+                        self._last_check[index] = time.monotonic()
+                else:
+                    if self.log:
+                        self.log(f"SSH connection {index} is down, reconnecting")
+                    if not self.open_connection(index, attempts=3):
+                        raise RuntimeError(f"Could not re-open SSH connection {index}")
+            self._local.index = index
+            yield index
+        finally:
+            self._local.index = None
+            with self._lock:
+                self._in_flight[index] -= 1
+
+
+class RemoteShell:
+    """One long-lived ``sh`` on the remote host that runs many commands in turn.
+
+    Forking ``ssh`` per command costs a process start and a new channel on
+    the master each time; this keeps a single ``ssh ... sh`` running and frames
+    every request on its stdin/stdout instead. A request runs the command in
+    its own ``sh -c`` (so ``cd``, variables and even syntax errors stay
+    contained) with its stdin fed from a here-document (base64, so any bytes survive) and stdout
+    and stderr captured to files. The shell then prints a header line
+    ``<token> <exit status> <stdout bytes> <stderr bytes>`` and the raw
+    output. The token is random per session, so command output cannot fake a
+    header. Requests are serialized.
+    """
+
+    def __init__(self, command: List[str]):
+        self.command = list(command)
+        self._token = secrets.token_hex(16)
+        self._process: Optional[subprocess.Popen] = None
+        self._lock = threading.Lock()
+        # Why the last start() failed, for the caller's log.
+        self.error: Optional[str] = None
+        # Last lines ssh (or the session's sh) wrote to stderr; commands' own stderr goes to files.
+        self._stderr_tail: collections.deque = collections.deque(maxlen=20)
+
+    @property
+    def alive(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def start(self, timeout: float = SHELL_START_TIMEOUT) -> bool:
+        """Start the session and wait up to ``timeout`` seconds for its handshake.
+
+        Returns False if the remote side is unusable, with the reason (and
+        whatever ssh printed to stderr, such as a password or host key prompt)
+        in :attr:`error`.
+        """
+        self.close()
+        self.error = None
+        self._stderr_tail.clear()
+        line = ""
+        drain: Optional[threading.Thread] = None
+        try:
+            self._process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=os.environ.copy())
+            drain = threading.Thread(target=self._drain_stderr, args=(self._process.stderr,), name="remote-shell-stderr", daemon=True)
+            drain.start()
+            self._send(
+                f't=$(mktemp -d) || exit 1\ntrap \'rm -rf "$t"\' EXIT\n'
+                f"command -v base64 >/dev/null 2>&1 || exit 1\nprintf '%s ready\\n' {self._token}\n"
+            )
+            # Nothing has been read yet, so the buffered reader holds no data select could miss.
+            if select.select([self._process.stdout], [], [], timeout)[0]:
+                line = self._process.stdout.readline().decode("utf-8", errors="replace").strip()
+            else:
+                self.error = f"no handshake within {timeout:g}s"
+        except OSError:
+            # A broken pipe means ssh already exited; its stderr says why.
+            pass
+        if line == f"{self._token} ready":
+            return True
+        if self._process is not None:
+            self._kill()
+            with contextlib.suppress(subprocess.TimeoutExpired):
+                self._process.wait(timeout=5)
+        if drain is not None:
+            drain.join(timeout=1)
+        self.error = self.error or "session closed before the handshake"
+        detail = self.stderr_tail()
+        if detail:
+            self.error += f": {detail}"
+        self.close()
+        return False
+
+    def stderr_tail(self) -> str:
+        """The last lines the session wrote to stderr, joined with ``; ``."""
+        return "; ".join(self._stderr_tail)
+
+    def run(self, command: str, input: Optional[bytes] = None, timeout: Optional[float] = None) -> Tuple[int, bytes, bytes]:
+        """Run ``command``; (exit status, stdout, stderr). Raises OSError if the session died.
+
+        On timeout the session is killed and subprocess.TimeoutExpired raised.
+        """
+        with self._lock:
+            if not self.alive:
+                raise OSError("remote shell is not running")
+            if input is None:
+                script = f'sh -c {shlex.quote(command)} < /dev/null > "$t/o" 2> "$t/e"'
+            else:
+                encoded = base64.encodebytes(input).decode("ascii")
+                marker = f"{self._token}_IN"
+                script = f'base64 -d > "$t/i" <<\'{marker}\'\n{encoded}{marker}\nsh -c {shlex.quote(command)} < "$t/i" > "$t/o" 2> "$t/e"'
+            script += f'; r=$?; printf \'%s %s %s %s\\n\' {self._token} "$r" "$(wc -c < "$t/o")" "$(wc -c < "$t/e")"; cat "$t/o" "$t/e"\n'
+            timed_out = threading.Event()
+
+            def expire() -> None:
+                timed_out.set()
+                self._kill()
+
+            timer = threading.Timer(timeout, expire) if timeout else None
+            if timer is not None:
+                timer.start()
+            try:
+                self._send(script)
+                header = self._process.stdout.readline().decode("utf-8", errors="replace").split()
+                if len(header) != 4 or header[0] != self._token:
+                    raise OSError("remote shell closed")
+                returncode, out_size, err_size = (int(value) for value in header[1:])
+                stdout = self._read_exactly(out_size)
+                stderr = self._read_exactly(err_size)
+            except (OSError, ValueError) as exc:
+                if timed_out.is_set():
+                    raise subprocess.TimeoutExpired(command, timeout or 0) from exc
+                self._kill()
+                raise OSError(f"remote shell failed: {exc}") from exc
+            finally:
+                if timer is not None:
+                    timer.cancel()
+            return returncode, stdout, stderr
+
+    def close(self) -> None:
+        process, self._process = self._process, None
+        if process is None:
+            return
+        try:
+            process.stdin.close()
+            process.wait(timeout=10)
+        except (OSError, subprocess.TimeoutExpired):
+            process.kill()
+            process.wait()
+        finally:
+            if process.stdout:
+                process.stdout.close()
+            if process.stderr:
+                process.stderr.close()
+
+    def _send(self, text: str) -> None:
+        self._process.stdin.write(text.encode("utf-8"))
+        self._process.stdin.flush()
+
+    def _read_exactly(self, size: int) -> bytes:
+        data = self._process.stdout.read(size) if size else b""
+        if len(data) != size:
+            raise OSError("remote shell closed mid-response")
+        return data
+
+    def _kill(self) -> None:
+        if self._process is not None and self._process.poll() is None:
+            self._process.kill()
+
+    def _drain_stderr(self, stream) -> None:
+        # Keeps the pipe from filling up during a long session; ends when the process exits.
+        with contextlib.suppress(OSError, ValueError):
+            for raw_line in stream:
+                line = raw_line.decode("utf-8", errors="replace").strip()
+                if line:
+                    self._stderr_tail.append(line)
+
+
+class SSHHelper:
+    """Build ssh/scp commands and manage persistent control sockets (see SSHConnectionPool)."""
+
+    def __init__(self, server: Optional[str], port: Optional[int], pool_size: int = 1):
+        self.server = server
+        self.port = port
+        self.pool = SSHConnectionPool(server, port, pool_size)
+
+    def build_persistent_command(self, base_command: str = "ssh") -> Tuple[List[str], Dict[str, str]]:
+        """Return (command, environment) preconfigured for ControlMaster."""
+        return self.pool.build_persistent_command(base_command)
+
+    def build_controlpath_command(self, base_command: str = "ssh") -> List[str]:
+        """Return a command that reuses the persistent connection."""
+        return self.pool.build_command(base_command)
+
+    def open_persistent_connection(self) -> None:
+        """Open the ControlMaster socket(s) if a server is configured."""
+        if not self.server:
+            return
+        self.pool.open()
 
     def close_persistent_connection(self) -> Optional[subprocess.CompletedProcess]:
-        """Close the ControlMaster socket if it exists."""
+        """Close the ControlMaster socket(s) if they exist."""
         if not self.server:
             return None
-        cmd = [
-            "ssh",
-            "-O",
-            "exit",
-            "-o",
-            f"ControlPath={CONTROL_PATH}",
-            self.server,
-        ]
-        return subprocess.run(cmd, check=False, capture_output=True)
+        return self.pool.close()[0]
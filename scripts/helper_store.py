@@ -0,0 +1,85 @@
+"""Server-side content store: one hard link per known file content, shared between games."""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Mapping, Sequence
+
+# Hidden directory in the data root holding one hard link per known file content.
+STORE_NAME = ".sync-store"
+# Control files unpacked with an upload and consumed by dedup_script().
+SEED_NAME = ".sync-seed"
+STORE_ADD_NAME = ".sync-store-add"
+LINKS_NAME = ".sync-links"
+
+
+@dataclass
+class DedupPlan:
+    """How an upload uses the server content store (see GameDownloader.dedup_upload)."""
+
+    # Relative path -> sha256 of files hard-linked from the store instead of sent.
+    links: Dict[str, str] = field(default_factory=dict)
+    # sha256 -> existing remote path (from the data root) to link into the store first.
+    seed: Dict[str, str] = field(default_factory=dict)
+    # Relative path -> sha256 of sent files to add to the store afterwards.
+    adds: Dict[str, str] = field(default_factory=dict)
+    saved_bytes: int = 0
+
+
+def plan_dedup(files: Mapping[str, list], paths: Sequence[str], store: Mapping[str, int], hash_locations: Mapping[str, str]) -> DedupPlan:
+    """Decide which of ``paths`` can be hard-linked instead of sent.
+
+    ``files`` maps relative paths to manifest records (``[size, mtime,
+    sha256]``), ``store`` holds the digests already in the store and
+    ``hash_locations`` maps other known digests to a remote path (from the
+    data root) that can seed the store.
+    """
+    plan = DedupPlan()
+    for path in paths:
+        digest = files[path][2]
+        # index.json is regenerated in place, and newlines would break the list format.
+        if not digest or path.rsplit("/", 1)[-1] == "index.json" or "\n" in path:
+            continue
+        location = hash_locations.get(digest)
+        if digest in store:
+            plan.links[path] = digest
+        elif location and "\n" not in location:
+            plan.seed[digest] = location
+            plan.links[path] = digest
+        elif digest in plan.adds.values():
+            # Second copy inside the same game: link it once the first one is stored.
+            plan.links[path] = digest
+        else:
+            plan.adds[path] = digest
+            continue
+        plan.saved_bytes += int(files[path][0])
+    return plan
+
+
+def _lines(pairs: Iterable[tuple]) -> bytes:
+    return "".join(f"{first} {second}\n" for first, second in pairs).encode("utf-8")
+
+
+def dedup_control(plan: DedupPlan) -> Dict[str, bytes]:
+    """The control files (name -> content) to unpack with the upload of ``plan``."""
+    return {
+        SEED_NAME: _lines(plan.seed.items()),
+        STORE_ADD_NAME: _lines((digest, path) for path, digest in plan.adds.items()),
+        LINKS_NAME: _lines((digest, path) for path, digest in plan.links.items()),
+    }
+
+
+def dedup_script() -> str:
+    """Shell run inside ``<name>.uploading`` after the control files were unpacked.
+
+    Existing copies of known content are linked into the store first, then
+    the files that just arrived, and finally every deduplicated path is
+    hard-linked from the store (``ln -f`` replaces, never writes through).
+    """
+    store = f"../{STORE_NAME}"
+    return (
+        f'mkdir -p "{store}" '
+        f'&& while IFS= read -r l; do [ -e "{store}/${{l%% *}}" ] || ln "../${{l#* }}" "{store}/${{l%% *}}" || exit 1; done < {SEED_NAME} '
+        f'&& while IFS= read -r l; do [ -e "{store}/${{l%% *}}" ] || ln "${{l#* }}" "{store}/${{l%% *}}" || exit 1; done < {STORE_ADD_NAME} '
+        f'&& while IFS= read -r l; do mkdir -p "$(dirname "${{l#* }}")" && ln -f "{store}/${{l%% *}}" "${{l#* }}" || exit 1; done < {LINKS_NAME} '
+        f'&& rm -f {SEED_NAME} {STORE_ADD_NAME} {LINKS_NAME}'
+    )
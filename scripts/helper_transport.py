@@ -0,0 +1,405 @@
+"""Transports: how the sync reaches the published data root (ssh to a host, or a local/mounted directory)."""
+from __future__ import annotations
+
+import abc
+import contextlib
+import errno
+import fcntl
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import threading
+from pathlib import Path
+from typing import Callable, ContextManager, Dict, List, Optional, Set, Tuple
+
+from helper_ssh import RemoteEntry, RemoteShell, SSHConnectionPool, build_inventory_command, parse_inventory
+
+# ioctl(2) request that clones a file's extents (a reflink) on btrfs, XFS and other CoW filesystems.
+FICLONE = 0x40049409
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+
+CommandHook = Optional[Callable[[str], None]]
+
+# Fallback extractor for hosts without unzip; the archive was already checked locally.
+_UNZIP_SCRIPT = "import sys, zipfile; zipfile.ZipFile(sys.argv[1]).extractall()"
+
+
+def swap_command(temp_path: str, folder: str, replace: bool = False) -> str:
+    """Shell command that publishes ``temp_path`` as ``folder``."""
+    if not replace:
+        return f'mv "{temp_path}" "{folder}"'
+    # Two renames keep the window without a live folder as short as possible.
+    return f'rm -rf "{folder}.replaced" && mv "{folder}" "{folder}.replaced" && mv "{temp_path}" "{folder}" && rm -rf "{folder}.replaced"'
+
+
+def remote_unzip_command(temp_path: str, archive_path: str) -> str:
+    """Command that unpacks ``archive_path`` into a fresh ``temp_path``, deletes it and lists every file.
+
+    Uses ``unzip`` when the host has it and Python's ``zipfile`` otherwise, and
+    exits 127 when it has neither. The listing is read by :func:`parse_file_listing`.
+    """
+    return (
+        f'rm -rf "{temp_path}" && mkdir -p "{temp_path}" && cd "{temp_path}" && '
+        f'if command -v unzip >/dev/null 2>&1; then unzip -qq -o "{archive_path}"; '
+        f'elif command -v python3 >/dev/null 2>&1; then python3 -c {shlex.quote(_UNZIP_SCRIPT)} "{archive_path}"; '
+        f'else exit 127; fi && rm -f "{archive_path}" && find . -type f -printf "%s %T@ %P\\0"'
+    )
+
+
+def parse_file_listing(output: bytes) -> Dict[str, Tuple[int, int]]:
+    """Parse NUL-separated ``find -printf "%s %T@ %P\\0"`` records into ``{path: (size, mtime)}``."""
+    files: Dict[str, Tuple[int, int]] = {}
+    for record in output.split(b"\0"):
+        try:
+            size, mtime, path = record.decode("utf-8", errors="replace").split(" ", 2)
+            files[path] = (int(size), int(float(mtime)))
+        except ValueError:
+            continue
+    return files
+
+
+class Transport(abc.ABC):
+    """Operations the sync runs against the data root ``root``.
+
+    Everything is expressed as shell commands run on the target by
+    :meth:`run`/:meth:`popen`; subclasses override the file operations they can
+    do more cheaply. ``on_command`` is called with the kind of every process
+    started (``"ssh"``, ``"scp"``, ``"local"``) so callers can count round trips.
+    """
+
+    name = "transport"
+
+    def __init__(self, root: str, on_command: CommandHook = None):
+        self.root = root
+        self.on_command = on_command
+
+    # --- Connection management ------------------------------------------
+
+    def open(self, attempts: int = 1) -> None:
+        pass
+
+    def close(self) -> List[subprocess.CompletedProcess]:
+        return []
+
+    def describe(self) -> str:
+        return f"{self.name} target {self.root}"
+
+    def lease(self) -> ContextManager[object]:
+        """Bind one connection to the current thread for the duration (a no-op without a pool)."""
+        return contextlib.nullcontext()
+
+    # --- Commands --------------------------------------------------------
+
+    @abc.abstractmethod
+    def command(self, command: str) -> List[str]:
+        """argv that runs the shell ``command`` on the target."""
+
+    def run(self, command: str, **kwargs: object) -> subprocess.CompletedProcess:
+        """``subprocess.run`` the shell ``command`` on the target."""
+        self._count(self.name)
+        return subprocess.run(self.command(command), env=os.environ.copy(), **kwargs)  # type: ignore[arg-type]
+
+    def popen(self, command: str) -> subprocess.Popen:
+        """Start ``command`` on the target with a pipe to its stdin (for tar streams)."""
+        self._count(self.name)
+        return subprocess.Popen(self.command(command), stdin=subprocess.PIPE, env=os.environ.copy())
+
+    # --- File operations -------------------------------------------------
+
+    def inventory(self, timeout: Optional[float] = 60) -> Dict[str, RemoteEntry]:
+        """Every entry of the root (type, size, index.json presence) in one round trip."""
+        result = self.run(build_inventory_command(self.root), capture_output=True, text=True, check=False, timeout=timeout)
+        if result.returncode != 0:
+            raise RuntimeError(f"Remote inventory failed (exit {result.returncode}): {result.stderr.strip()}")
+        return parse_inventory(result.stdout)
+
+    def read_file(self, path: str) -> Optional[bytes]:
+        """Contents of ``path``, None if it does not exist; RuntimeError if it cannot be read."""
+        result = self.run(f'if [ -f "{path}" ]; then cat "{path}"; fi', capture_output=True, check=False, timeout=60)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.decode("utf-8", errors="replace").strip())
+        return result.stdout or None
+
+    def write_file(self, path: str, payload: bytes) -> None:
+        """Atomically replace ``path`` (temp file + rename)."""
+        self.run(f'cat > "{path}.tmp" && mv "{path}.tmp" "{path}"', input=payload, check=True, capture_output=True)
+
+    def remove(self, path: str, timeout: Optional[float] = None) -> bool:
+        """``rm -rf`` ``path``; False if that failed."""
+        return self.run(f'rm -rf "{path}"', check=False, capture_output=True, timeout=timeout).returncode == 0
+
+    def rename(self, source: str, destination: str) -> None:
+        self.run(f'mv "{source}" "{destination}"', check=True)
+
+    def swap(self, temp_path: str, folder: str, replace: bool = False) -> None:
+        """Publish the fully uploaded ``temp_path`` as ``folder`` (see :func:`swap_command`)."""
+        self.run(swap_command(temp_path, folder, replace), check=True)
+
+    @abc.abstractmethod
+    def upload_tree(self, local_path: Path, path: str) -> None:
+        """Copy the local directory ``local_path`` to ``path``, keeping mtimes."""
+
+    @abc.abstractmethod
+    def upload_file(self, local_path: Path, path: str) -> None:
+        """Copy the single local file ``local_path`` to ``path``."""
+
+    def _count(self, kind: str) -> None:
+        if self.on_command is not None:
+            self.on_command(kind)
+
+
+class SSHTransport(Transport):
+    """Run everything on ``server`` through a pool of ssh ControlMaster connections.
+
+    With ``persistent_shell`` the commands of :meth:`run` go through one
+    long-lived :class:`RemoteShell` per master instead of one ``ssh`` process
+    each. A master whose shell cannot be started falls back to forking ssh
+    per command, as it always did. Streams (:meth:`popen`) and scp uploads
+    always get their own process.
+    """
+
+    name = "ssh"
+    # subprocess.run arguments the remote shell can honour.
+    SHELL_ARGUMENTS = {"input", "capture_output", "text", "check", "timeout"}
+
+    def __init__(
+        self,
+        server: str,
+        port: Optional[int],
+        root: str,
+        connections: int = 1,
+        *,
+        log: Optional[Callable[[str], None]] = None,
+        on_command: CommandHook = None,
+        persistent_shell: bool = False,
+    ):
+        super().__init__(root, on_command)
+        self.server = server
+        self.pool = SSHConnectionPool(server, port, connections, log=log)
+        self.log = log
+        self.persistent_shell = persistent_shell
+        self._shells: Dict[int, RemoteShell] = {}
+        # Masters whose remote shell could not be started; they fork ssh per command.
+        self._shell_failed: Set[int] = set()
+        self._shells_lock = threading.Lock()
+
+    def open(self, attempts: int = 1) -> None:
+        self.pool.open(attempts=attempts)
+
+    def close(self) -> List[subprocess.CompletedProcess]:
+        with self._shells_lock:
+            shells, self._shells = list(self._shells.values()), {}
+        for shell in shells:
+            shell.close()
+        return self.pool.close()
+
+    def describe(self) -> str:
+        return f"{self.pool.size} SSH connections" if self.pool.size > 1 else "SSH connection"
+
+    def lease(self) -> ContextManager[object]:
+        return self.pool.lease()
+
+    def command(self, command: str) -> List[str]:
+        # Inside a pool lease this targets the leased master, otherwise the first one.
+        return self.pool.build_command("ssh") + [self.server, command]
+
+    def run(self, command: str, **kwargs: object) -> subprocess.CompletedProcess:
+        shell = self._shell() if set(kwargs) <= self.SHELL_ARGUMENTS else None
+        if shell is None:
+            return super().run(command, **kwargs)
+        self._count("shell")
+        args = self.command(command)
+        try:
+            returncode, stdout, stderr = shell.run(command, kwargs.get("input"), kwargs.get("timeout"))  # type: ignore[arg-type]
+        except subprocess.TimeoutExpired as exc:
+            raise subprocess.TimeoutExpired(args, exc.timeout) from None
+        except OSError as exc:
+            # Same outcome as an ssh process losing its connection.
+            returncode, stdout, stderr = 255, b"", f"{exc}\n".encode("utf-8")
+        if not kwargs.get("capture_output"):
+            sys.stdout.buffer.write(stdout)
+            sys.stdout.flush()
+            sys.stderr.buffer.write(stderr)
+            sys.stderr.flush()
+            stdout = stderr = None
+        output: object = stdout
+        errors: object = stderr
+        if kwargs.get("text") and stdout is not None:
+            output = stdout.decode("utf-8", errors="replace")
+            errors = stderr.decode("utf-8", errors="replace")
+        if kwargs.get("check") and returncode != 0:
+            raise subprocess.CalledProcessError(returncode, args, output, errors)
+        return subprocess.CompletedProcess(args, returncode, output, errors)
+
+    def _shell(self) -> Optional[RemoteShell]:
+        """The live remote shell of the current master, started on first use."""
+        if not self.persistent_shell:
+            return None
+        index = self.pool.current_index()
+        with self._shells_lock:
+            if index in self._shell_failed:
+                return None
+            shell = self._shells.get(index)
+            if shell is None:
+                shell = self._shells[index] = RemoteShell(self.pool.build_command("ssh", index) + [self.server, "sh"])
+        # The shell's own lock serializes requests; only (re)starting needs care here.
+        if shell.alive:
+            return shell
+        with self._shells_lock:
+            if shell.alive:
+                return shell
+            if shell.start():
+                return shell
+            self._shell_failed.add(index)
+        if self.log:
+            self.log(f"Remote shell on SSH connection {index} unavailable ({shell.error}), running one ssh process per command")
+        return None
+
+    def upload_tree(self, local_path: Path, path: str) -> None:
+        self._count("scp")
+        scp_cmd = self.pool.build_command("scp")
+        # -p keeps mtimes, so the manifest's recorded mtimes match a later remote scan.
+        scp_cmd.extend(["-r", "-p", str(local_path), f"{self.server}:{path}"])
+        subprocess.run(scp_cmd, check=True, env=os.environ.copy())
+
+    def upload_file(self, local_path: Path, path: str) -> None:
+        self._count("scp")
+        scp_cmd = self.pool.build_command("scp")
+        scp_cmd.extend([str(local_path), f"{self.server}:{path}"])
+        subprocess.run(scp_cmd, check=True, env=os.environ.copy())
+
+
+class LocalTransport(Transport):
+    """Publish into a directory on this machine, such as an NFS mount of the web root.
+
+    Shell commands run through ``sh`` without any ssh process. Uploads copy
+    with reflinks where the filesystem supports them and ``copy_file_range``
+    (server-side copies on NFS 4.2) otherwise, and swaps are plain renames.
+    """
+
+    name = "local"
+
+    def command(self, command: str) -> List[str]:
+        return ["sh", "-c", command]
+
+    def read_file(self, path: str) -> Optional[bytes]:
+        try:
+            with open(path, "rb") as handle:
+                return handle.read() or None
+        except FileNotFoundError:
+            return None
+        except OSError as exc:
+            raise RuntimeError(str(exc)) from exc
+
+    def write_file(self, path: str, payload: bytes) -> None:
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as handle:
+            handle.write(payload)
+        os.replace(temp_path, path)
+
+    def remove(self, path: str, timeout: Optional[float] = None) -> bool:
+        try:
+            _remove_path(path)
+        except OSError:
+            return False
+        return True
+
+    def rename(self, source: str, destination: str) -> None:
+        os.rename(source, destination)
+
+    def swap(self, temp_path: str, folder: str, replace: bool = False) -> None:
+        if not replace:
+            os.rename(temp_path, folder)
+            return
+        _remove_path(f"{folder}.replaced")
+        os.rename(folder, f"{folder}.replaced")
+        os.rename(temp_path, folder)
+        _remove_path(f"{folder}.replaced")
+
+    def upload_tree(self, local_path: Path, path: str) -> None:
+        copy_tree(Path(local_path), Path(path))
+
+    def upload_file(self, local_path: Path, path: str) -> None:
+        copy_file(Path(local_path), Path(path))
+
+
+def _remove_path(path: str) -> None:
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.unlink(path)
+
+
+def copy_file(source: Path, destination: Path) -> None:
+    """Copy one file's data: a reflink if possible, else ``copy_file_range``, else a plain copy."""
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            return
+        except OSError:
+            pass
+        remaining = os.fstat(src.fileno()).st_size
+        try:
+            while remaining > 0:
+                copied = os.copy_file_range(src.fileno(), dst.fileno(), min(remaining, COPY_CHUNK_SIZE))
+                if copied == 0:
+                    break
+                remaining -= copied
+            return
+        except OSError as exc:
+            # Old kernels refuse cross-filesystem ranges; anything else is a real error.
+            if exc.errno not in (errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.EINVAL):
+                raise
+        src.seek(0)
+        dst.seek(0)
+        dst.truncate()
+        shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+
+
+def copy_tree(source: Path, destination: Path) -> None:
+    """``cp -rp`` with :func:`copy_file`: data, modes and mtimes of files and directories."""
+    directories: List[Path] = []
+    for current, dirnames, filenames in os.walk(source):
+        relative = Path(current).relative_to(source)
+        target_dir = destination / relative
+        target_dir.mkdir(parents=True, exist_ok=True)
+        directories.append(relative)
+        for name in filenames:
+            source_file = Path(current) / name
+            target_file = target_dir / name
+            if source_file.is_symlink():
+                os.symlink(os.readlink(source_file), target_file)
+                continue
+            copy_file(source_file, target_file)
+            shutil.copystat(source_file, target_file)
+        for name in dirnames:
+            if (Path(current) / name).is_symlink():
+                os.symlink(os.readlink(Path(current) / name), target_dir / name)
+    # Directory mtimes last, after their contents stopped changing.
+    for relative in reversed(directories):
+        shutil.copystat(source / relative, destination / relative)
+
+
+def create_transport(
+    kind: str,
+    server: Optional[str],
+    port: Optional[int],
+    root: Optional[str],
+    connections: int = 1,
+    *,
+    log: Optional[Callable[[str], None]] = None,
+    on_command: CommandHook = None,
+    persistent_shell: bool = False,
+) -> Optional[Transport]:
+    """The configured transport, or None when the target is incomplete (no uploads)."""
+    if not root:
+        return None
+    if kind == "local":
+        return LocalTransport(root, on_command)
+    if kind != "ssh":
+        raise ValueError(f"Unknown transport {kind!r}")
+    if not server:
+        return None
+    return SSHTransport(server, port, root, connections, log=log, on_command=on_command, persistent_shell=persistent_shell)
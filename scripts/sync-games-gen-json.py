@@ -4,42 +4,55 @@
 import argparse
 import json
 import os
-import subprocess
 import sys
+import time
 from pathlib import Path
-from typing import Dict, List, Set
+from typing import Dict, List, Optional, Set
 
 from helper_gsheet import (
     build_unified_demo_catalog,
     validate_remote_folders,
     create_json_entry,
 )
-from helper_ssh import SSHHelper
-def list_remote_folders(ssh_helper: SSHHelper, server: str, base_path: str) -> Set[str]:
+from helper_manifest import MANIFEST_NAME, SyncManifest
+from helper_openmetrics import OpenMetricsWriter
+from helper_transport import Transport, create_transport
+
+
+def load_remote_manifest(transport: Transport) -> Optional[SyncManifest]:
+    """Fetch the manifest maintained by sync-games.py in a single round trip (None if unusable)."""
+    try:
+        payload = transport.read_file(f"{transport.root}/{MANIFEST_NAME}")
+    except RuntimeError as exc:
+        print(f"Warning: could not read remote manifest: {exc}", file=sys.stderr)
+        return None
+    return SyncManifest.from_json(payload.decode("utf-8", errors="replace")) if payload else None
+
+
+def list_remote_folders(transport: Transport) -> Set[str]:
     """Return the set of direct subdirectories on the remote server."""
-    if not server or not base_path:
-        raise ValueError("Both server and base_path are required to list remote folders")
-
-    base_cmd = ssh_helper.build_controlpath_command()
-    env = os.environ.copy()
-    base_cmd.extend([server, f'ls -1 "{base_path}"'])
-
-    result = subprocess.run(base_cmd, capture_output=True, text=True, env=env, check=False)
-    if result.returncode != 0:
-        stderr = result.stderr.strip()
-        raise RuntimeError(f"Failed to list remote folders (exit {result.returncode}): {stderr}")
-
-    folders: Set[str] = set()
-    for line in result.stdout.splitlines():
-        entry = line.strip()
-        if not entry:
-            continue
-        test_cmd = ssh_helper.build_controlpath_command()
-        test_cmd.extend([server, f'test -d "{base_path}/{entry}"'])
-        test_result = subprocess.run(test_cmd, capture_output=True, env=env, check=False)
-        if test_result.returncode == 0:
-            folders.add(entry)
-    return folders
+    inventory = transport.inventory(timeout=None)
+    return {name for name, entry in inventory.items() if entry.is_dir}
+
+
+def gen_json_metrics_path(path: Path) -> Path:
+    """``sync.prom`` -> ``sync.gen-json.prom``, so sync-games.sh can pass one --metrics-textfile to both scripts."""
+    path = Path(path)
+    base = path.stem if path.suffix == ".prom" else path.name
+    return path.with_name(f"{base}.gen-json.prom")
+
+
+def write_metrics_textfile(path: Path, started: float, success: bool, remote_folders: int, entries: int, issues: Dict[str, int]) -> None:
+    """Export the outcome of this run as an OpenMetrics textfile."""
+    writer = OpenMetricsWriter()
+    writer.gauge("scummvm_gen_json_last_run_timestamp_seconds", "Unix time the run started", int(started))
+    writer.gauge("scummvm_gen_json_success", "1 if games.json was written without validation errors", 1 if success else 0)
+    writer.gauge("scummvm_gen_json_duration_seconds", "Wall-clock duration of the run", round(time.time() - started, 3))
+    writer.gauge("scummvm_gen_json_remote_folders", "Game folders found on the remote server", remote_folders)
+    writer.gauge("scummvm_gen_json_entries", "Entries written to games.json", entries)
+    for kind, count in sorted(issues.items()):
+        writer.gauge("scummvm_gen_json_validation_issues", "Validation problems by kind", count, {"kind": kind})
+    writer.write(path)
 
 
 def main() -> int:
@@ -50,7 +63,11 @@ def main() -> int:
     parser.add_argument("--scp-server", help="SCP/SSH server in user@host format")
     parser.add_argument("--scp-path", help="Remote path containing demo folders")
     parser.add_argument("--scp-port", type=int, help="SSH/SCP port (default 22)")
+    parser.add_argument("--transport", choices=["ssh", "local"], default="ssh", help="Read --scp-path over ssh or as a local/mounted directory (default: ssh)")
+    parser.add_argument("--rescan-remote", action="store_true", help="List the remote folders instead of reading the sync manifest")
+    parser.add_argument("--metrics-textfile", metavar="FILE", help="Write entry and validation counts as a textfile next to FILE (FILE.prom becomes FILE.gen-json.prom); FILE itself is left to sync-games.py")
     args = parser.parse_args()
+    started = time.time()
 
     metadata_path = Path(args.metadata)
     
@@ -64,22 +81,28 @@ def main() -> int:
     scp_path = args.scp_path or os.environ.get("SSH_PATH")
     scp_port = args.scp_port or (int(os.environ["SSH_PORT"]) if os.environ.get("SSH_PORT") else None)
 
-    if not scp_server or not scp_path:
-        print("Error: scp-server and scp-path must be provided via arguments or environment", file=sys.stderr)
+    transport = create_transport(args.transport, scp_server, scp_port, scp_path)
+    if transport is None:
+        print("Error: scp-path (and scp-server for the ssh transport) must be provided via arguments or environment", file=sys.stderr)
         return 1
 
     # List remote folders
-    ssh_helper = SSHHelper(scp_server, scp_port)
-    ssh_helper.open_persistent_connection()
+    transport.open()
     try:
-        remote_folders = list_remote_folders(ssh_helper, scp_server, scp_path)
+        manifest = None if args.rescan_remote else load_remote_manifest(transport)
+        if manifest is not None:
+            remote_folders = manifest.folder_names()
+            print(f"Read {len(remote_folders)} folders from the remote manifest")
+        else:
+            remote_folders = list_remote_folders(transport)
     finally:
-        ssh_helper.close_persistent_connection()
+        transport.close()
 
     # Validate using improved logic
     errors, warnings = validate_remote_folders(remote_folders, demo_catalog)
     
     has_errors = False
+    issues = {"orphaned": len(errors), "missing": len(warnings), "invalid": 0}
     if errors:
         print("\033[91mError: Orphaned folders on remote server:\033[0m", file=sys.stderr)
         for message in errors:
@@ -97,12 +120,14 @@ def main() -> int:
         entry_data = demo_catalog.get(folder)
         if entry_data is None:
             print(f"\033[91mValidation error: {folder} missing in demo catalog\033[0m", file=sys.stderr)
+            issues["invalid"] += 1
             has_errors = True
             continue
         if args.featured_only and not (entry_data.metadata and entry_data.metadata.get("featured")):
             continue
         if not entry_data.should_include_in_json:
             print(f"\033[91mValidation error: {folder} should not be included in JSON \033[0m", file=sys.stderr)
+            issues["invalid"] += 1
             has_errors = True
             continue
         
@@ -117,6 +142,8 @@ def main() -> int:
         json.dump(entries, handle, indent=2, ensure_ascii=False)
 
     print(f"Wrote {len(entries)} entries to {output_path}")
+    if args.metrics_textfile:
+        write_metrics_textfile(gen_json_metrics_path(Path(args.metrics_textfile)), started, not has_errors, len(remote_folders), len(entries), issues)
     
     # Return 1 if there were validation errors, 0 otherwise
     return 1 if has_errors else 0
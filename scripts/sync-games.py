@@ -2,17 +2,23 @@
 """ScummVM Game Downloader and Uploader."""
 
 import argparse
+import hashlib
+import io
 import json
 import os
 import shutil
 import subprocess
 import sys
+import tarfile
+import threading
 import time
 import urllib.parse
 import urllib.request
 import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Optional, Sequence, Set, Tuple
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
 
 from helper_gsheet import (
     CombinedEntry,
@@ -23,14 +29,192 @@ from helper_gsheet import (
     normalize_download_url,
     validate_remote_folders,
 )
+from helper_archive import ZipStreamCorrupt, ZipStreamUnsupported, extract_zip_parallel, zip_member_sizes, zip_stream_to_tar
+from helper_bundle import (
+    BUNDLE_DATA_NAME,
+    BUNDLE_TABLE_NAME,
+    DEFAULT_MAX_FILE_SIZE as DEFAULT_BUNDLE_MAX_FILE_SIZE,
+    DEFAULT_MIN_FILES as DEFAULT_BUNDLE_MIN_FILES,
+    bundle_paths,
+    write_bundle,
+)
+from helper_compress import DEFAULT_MIN_SIZE, brotli_available, precompress_folder, remove_compressed, sidecar_paths, write_compressed_table
+from helper_download import TRANSIENT_ERRORS, USER_AGENT, DownloadCache, DownloadResult, download_segmented, mirror_urls, probe_content_length, probe_url, probe_zip_sizes
+from helper_journal import JOURNAL_NAME, JournalState, SyncJournal, incomplete_extractions
+from helper_manifest import MANIFEST_NAME, SyncManifest, hash_file, parse_find_listing, scan_local_folder
+from helper_metrics import SyncMetrics, write_openmetrics
+from helper_pipeline import Pipeline, StagingBudget, TransferBudget
+from helper_plan import DEFAULT_THROUGHPUT, ROUND_TRIP_SECONDS, PlanAction, build_plan, transfer_seconds, update_throughput
+from helper_schedule import ORDER_POLICIES, TransferCandidate, format_size, order_candidates, parse_duration, parse_size, probe_sizes, probe_urls
+from helper_ssh import RemoteEntry
+from helper_store import STORE_NAME, DedupPlan, dedup_control, dedup_script, plan_dedup
+from helper_transport import Transport, create_transport, parse_file_listing, remote_unzip_command, swap_command
+
+
+@dataclass
+class SyncJob:
+    """A game travelling through the download -> extract -> upload pipeline."""
+
+    relative_path: str
+    url: str
+    filename: str
+    archive_path: Optional[Path] = None
+    folder_path: Optional[Path] = None
+    reused_local_folder: bool = False
+    manifest_files: Optional[Dict[str, list]] = None
+    manifest_dirs: Optional[Set[str]] = None
+    uploaded: bool = False
+    process_metadata: bool = False
+    # Size reserved against --max-bytes / --time-budget (0 when unknown).
+    expected_bytes: int = 0
+    # Already on the remote: replace it by transferring only the changed files.
+    delta: bool = False
+    # Its transfer and staging reservations have been handed back.
+    released: bool = False
+
+
+def _source_record(url: str, result: DownloadResult) -> Dict[str, object]:
+    """Manifest record of the upstream archive a remote folder was built from."""
+    return {"url": url, "size": result.size, "etag": result.etag, "last_modified": result.last_modified}
+
+
+def _source_changed(recorded: Dict[str, object], current: DownloadResult) -> bool:
+    # Compare the strongest validator both sides have; size alone is the last resort.
+    if recorded.get("etag") and current.etag:
+        return recorded["etag"] != current.etag
+    if recorded.get("last_modified") and current.last_modified:
+        return recorded["last_modified"] != current.last_modified
+    return current.size >= 0 and recorded.get("size") != current.size
+
+
+# How long a batching upload worker waits for more small games to arrive.
+UPLOAD_BATCH_LINGER = 2.0
+
+# The server manifest is rewritten after this many changed games or seconds, at
+# the end of the run and when the connection closes; the journal covers the gap.
+MANIFEST_SAVE_CHANGES = 25
+MANIFEST_SAVE_SECONDS = 120.0
+
+
+def _folder_size(folder_path: Path) -> int:
+    total = 0
+    for root, _, files in os.walk(folder_path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
 
 class GameDownloader:
-    def __init__(self, download_dir: str = "games", scp_server: Optional[str] = None, scp_path: Optional[str] = None, scp_port: Optional[int] = None):
+    def __init__(
+        self,
+        download_dir: str = "games",
+        scp_server: Optional[str] = None,
+        scp_path: Optional[str] = None,
+        scp_port: Optional[int] = None,
+        download_retries: int = 5,
+        download_cache: Optional[DownloadCache] = None,
+        download_workers: int = 2,
+        download_connections: int = 1,
+        mirrors: Sequence[str] = (),
+        extract_workers: int = 1,
+        extract_threads: Optional[int] = None,
+        upload_workers: int = 1,
+        queue_size: int = 2,
+        stream_uploads: bool = False,
+        remote_extract: bool = False,
+        upload_batch: int = 1,
+        upload_batch_max_bytes: Optional[int] = None,
+        rescan_remote: bool = False,
+        verify_indexes: bool = False,
+        ssh_connections: int = 1,
+        transfer_order: str = "name",
+        max_bytes: Optional[int] = None,
+        time_budget: Optional[float] = None,
+        delta_sync: bool = False,
+        dedup: bool = False,
+        precompress: bool = False,
+        precompress_workers: Optional[int] = None,
+        precompress_min_size: int = DEFAULT_MIN_SIZE,
+        bundle: bool = False,
+        bundle_min_files: int = DEFAULT_BUNDLE_MIN_FILES,
+        bundle_max_file_size: int = DEFAULT_BUNDLE_MAX_FILE_SIZE,
+        disk_budget: Optional[int] = None,
+        resume: bool = False,
+        transport: str = "ssh",
+        persistent_shell: bool = True,
+    ):
         self.download_dir = Path(download_dir)
         self.download_dir.mkdir(exist_ok=True)
         self.scp_server = scp_server
         self.scp_path = scp_path
         self.scp_port = scp_port
+        self.download_retries = download_retries
+        self.download_cache = download_cache
+        self.download_workers = download_workers
+        self.download_connections = download_connections
+        self.mirrors = list(mirrors)
+        self.extract_workers = extract_workers
+        # Threads inflating the members of one zip; each extraction worker gets its own set.
+        self.extract_threads = max(1, extract_threads or min(4, os.cpu_count() or 1))
+        self.upload_workers = upload_workers
+        self.queue_size = queue_size
+        self.stream_uploads = stream_uploads
+        self.remote_extract = remote_extract
+        # Set once the host turns out to have neither unzip nor python3.
+        self._remote_extract_unavailable = False
+        self.upload_batch = upload_batch
+        self.upload_batch_max_bytes = upload_batch_max_bytes
+        self.rescan_remote = rescan_remote
+        self.verify_indexes = verify_indexes
+        self._touched_folders: Set[str] = set()
+        self.remote_manifest: Optional[SyncManifest] = None
+        self._manifest_needs_scan = False
+        self._manifest_lock = threading.Lock()
+        # Changes not yet written to the server; see _manifest_changed().
+        self._manifest_unsaved = 0
+        self._manifest_saved_at = time.monotonic()
+        self._remote_inventory: Optional[Dict[str, RemoteEntry]] = None
+        self._transfer_budget = TransferBudget(None)
+        self.transfer_order = transfer_order
+        self.max_bytes = max_bytes
+        self.time_budget = time_budget
+        self._started = time.monotonic()
+        self._expected_sizes: Dict[str, int] = {}
+        self.delta_sync = delta_sync
+        # Upstream validators of every archive fetched this run, keyed by job URL.
+        self._sources: Dict[str, Dict[str, object]] = {}
+        self.dedup = dedup
+        self.dedup_saved_bytes = 0
+        self._hash_locations: Optional[Dict[str, str]] = None
+        self.precompress = precompress
+        self.precompress_workers = precompress_workers
+        self.precompress_min_size = precompress_min_size
+        self._compress_pool: Optional[ProcessPoolExecutor] = None
+        # Sidecars created for a local game folder, keyed by folder name until it is recorded.
+        self._sidecars: Dict[str, Dict[str, Dict[str, int]]] = {}
+        self.bundle = bundle
+        self.bundle_min_files = bundle_min_files
+        self.bundle_max_file_size = bundle_max_file_size
+        # Bundle records of local game folders, keyed by folder name like _sidecars.
+        self._bundles: Dict[str, Dict[str, object]] = {}
+        self.disk_budget = disk_budget
+        self._staging = StagingBudget(None)
+        # Estimated local footprint (archive + extracted) of every pending game.
+        self._staging_estimates: Dict[str, int] = {}
+        self.metrics = SyncMetrics()
+        self.resume = resume
+        self.journal = SyncJournal(self.download_dir / JOURNAL_NAME)
+        # --plan: read the remote state but never write to it.
+        self.dry_run = False
+        # Bytes and busy seconds of plain downloads/uploads this run, folded into the manifest's throughput history.
+        self._throughput_samples: Dict[str, List[float]] = {"download": [0, 0.0], "upload": [0, 0.0]}
+        self._throughput_lock = threading.Lock()
+        # None when no target is configured (download and extract only).
+        self.transport: Optional[Transport] = create_transport(
+            transport, scp_server, scp_port, scp_path, ssh_connections,
+            log=self._print, on_command=lambda kind: self.metrics.count(f"{kind}_commands"),
+            persistent_shell=persistent_shell,
+        )
 
         self.catalog: Dict[str, CombinedEntry] = {}
         self.metadata_by_path: Dict[str, Dict[str, object]] = {}
@@ -154,118 +338,51 @@ class GameDownloader:
         padded_message = message.ljust(terminal_width)
         print(padded_message, file=file)
 
-    # --- SSH helpers -----------------------------------------------------
-
-    def _build_ssh_command(self, base_command: str = "ssh"):
-        cmd: List[str] = []
-        env = os.environ.copy()
-        control_path = "/tmp/scummvm-ssh-%r@%h:%p"
-
-        ssh_password = os.environ.get("SSH_PASSWORD")
-        if ssh_password:
-            cmd.extend(["sshpass", "-e", base_command])
-            env["SSHPASS"] = ssh_password
-        else:
-            cmd.append(base_command)
-
-        ssh_key = os.environ.get("SSH_KEY_PATH")
-        if ssh_key and not ssh_password:
-            cmd.extend(["-i", ssh_key])
-
-        if self.scp_port:
-            if base_command == "scp":
-                cmd.extend(["-P", str(self.scp_port)])
-            else:
-                cmd.extend(["-p", str(self.scp_port)])
-
-        # Force IPv4: GitHub Actions runners have no outbound IPv6, so if the
-        # host has an AAAA record OpenSSH tries IPv6 first and hangs on the TCP
-        # connect until it times out (~3 min). Fail fast on IPv4 instead.
-        cmd.extend(["-4", "-o", "ConnectTimeout=20"])
-        cmd.extend(["-o", "ControlMaster=auto", "-o", f"ControlPath={control_path}", "-o", "ControlPersist=600"])
-
-        if ssh_password:
-            cmd.extend(["-o", "StrictHostKeyChecking=no"])
-        else:
-            cmd.extend(["-o", "BatchMode=yes", "-o", "StrictHostKeyChecking=no"])
-
-        return cmd, env
-
-    def _build_controlpath_ssh_command(self, base_command: str = "ssh") -> List[str]:
-        cmd = [base_command]
-        control_path = "/tmp/scummvm-ssh-%r@%h:%p"
-
-        if self.scp_port:
-            if base_command == "scp":
-                cmd.extend(["-P", str(self.scp_port)])
-            else:
-                cmd.extend(["-p", str(self.scp_port)])
-
-        cmd.extend(["-4", "-o", f"ControlPath={control_path}"])
-        return cmd
+    # --- Remote helpers --------------------------------------------------
 
     def open_connection(self) -> None:
-        ssh_cmd, env = self._build_ssh_command()
-        ssh_pos = next((i for i, arg in enumerate(ssh_cmd) if arg in {"ssh", "scp"}), 0)
-        ssh_cmd.insert(ssh_pos + 1, "-MNf")
-        ssh_cmd.append(f"{self.scp_server}")
+        if self.transport is None:
+            return
         # sync-games runs in parallel with the scp-action deploys to the SAME
         # shared Hostinger host, which caps concurrent SSH sessions - so the
         # master connection intermittently times out (while scp-action wins the
         # race). Retry with backoff instead of failing the whole deploy.
-        attempts = 6
-        for attempt in range(1, attempts + 1):
-            result = subprocess.run(ssh_cmd, env=env)
-            if result.returncode == 0:
-                self._temp_print("Opened SSH connection")
-                return
-            if attempt < attempts:
-                delay = min(60, 10 * attempt)
-                self._print(
-                    f"SSH connect failed (exit {result.returncode}); "
-                    f"retry {attempt}/{attempts - 1} in {delay}s"
-                )
-                time.sleep(delay)
-        raise RuntimeError(f"Could not open SSH connection after {attempts} attempts")
+        self.transport.open(attempts=6)
+        self._temp_print(f"Opened {self.transport.describe()}")
 
     def close_connection(self) -> None:
-        control_path = "/tmp/scummvm-ssh-%r@%h:%p"
-        close_cmd = ["ssh", "-O", "exit", "-o", f"ControlPath={control_path}", f"{self.scp_server}"]
-        result = subprocess.run(close_cmd, check=False, capture_output=True)
-        if result.returncode == 0:
-            self._temp_print("Closed SSH connection")
-        elif result.returncode == 255:
-            self._temp_print("SSH connection already closed")
-        else:
-            stderr_output = result.stderr.decode("utf-8", errors="ignore").strip()
-            self._print(f"Warning: Could not close SSH connection (exit code {result.returncode}): {stderr_output}")
+        if self.transport is None:
+            return
+        if self._manifest_unsaved:
+            try:
+                self.save_remote_manifest()
+            except (OSError, RuntimeError, subprocess.CalledProcessError) as exc:
+                self._print(f"Warning: Could not save the remote manifest: {exc}")
+        for index, result in enumerate(self.transport.close()):
+            if result.returncode == 0:
+                self._temp_print("Closed SSH connection")
+            elif result.returncode == 255:
+                self._temp_print("SSH connection already closed")
+            else:
+                stderr_output = result.stderr.decode("utf-8", errors="ignore").strip()
+                self._print(f"Warning: Could not close SSH connection {index} (exit code {result.returncode}): {stderr_output}")
+
+    def get_remote_inventory(self, refresh: bool = False) -> Dict[str, RemoteEntry]:
+        """Return every entry of the remote root (type, size, index.json presence) in one round trip."""
+        if self.transport is None:
+            return {}
+        if self._remote_inventory is None or refresh:
+            self._remote_inventory = self.transport.inventory(timeout=60)
+        return self._remote_inventory
 
     def get_remote_folders(self) -> Set[str]:
-        if not self.scp_server or not self.scp_path:
+        if self.transport is None:
             return set()
-
-        ssh_cmd = self._build_controlpath_ssh_command()
-        env = os.environ.copy()
-        ssh_cmd.extend([self.scp_server, f'ls -1 "{self.scp_path}"'])
-
-        result = subprocess.run(ssh_cmd, capture_output=True, check=False, env=env, timeout=30, text=True)
-        if result.returncode != 0:
-            raise RuntimeError(f"Remote command failed: {result.stderr.strip()}")
-
-        folders: Set[str] = set()
-        for line in result.stdout.strip().splitlines():
-            entry = line.strip()
-            if not entry:
-                continue
-            test_cmd = self._build_controlpath_ssh_command()
-            test_cmd.extend([self.scp_server, f'test -d "{self.scp_path}/{entry}"'])
-            test_result = subprocess.run(test_cmd, capture_output=True, check=False, env=env, timeout=10)
-            if test_result.returncode == 0:
-                folders.add(entry)
-        return folders
+        inventory = self.get_remote_inventory(refresh=True)
+        return {name for name, entry in inventory.items() if entry.is_dir}
 
     def folder_exists_on_remote(self, folder_name: str, remote_folders_set: Optional[Set[str]] = None) -> bool:
-        if not self.scp_server or not self.scp_path:
+        if self.transport is None:
             return False
 
         if remote_folders_set is not None:
@@ -274,68 +391,174 @@ class GameDownloader:
                 return True
             return False
 
-        ssh_cmd = self._build_controlpath_ssh_command()
-        env = os.environ.copy()
-        ssh_cmd.extend([self.scp_server, f'test -d "{self.scp_path}/{folder_name}"'])
-
-        result = subprocess.run(ssh_cmd, capture_output=True, check=False, env=env, timeout=30)
-        if result.returncode in (0, 1):
-            return result.returncode == 0
-
-        stderr_output = result.stderr.decode("utf-8", errors="ignore").strip()
-        if result.returncode == 255:
-            raise RuntimeError(f"Failed to connect to remote server: {stderr_output}")
-        raise RuntimeError(f"Remote command failed: {stderr_output}")
+        # Answer from the (cached) inventory instead of one ssh round trip per target.
+        entry = self.get_remote_inventory().get(folder_name)
+        return bool(entry and entry.is_dir)
 
     def remove_from_remote(self, folder_name: str) -> bool:
         """Delete a game folder from the remote data host (un-sync a skipped game)."""
-        if not self.scp_server or not self.scp_path:
+        if self.transport is None:
             return False
         # Safety: refuse anything that could escape the games directory.
         if not folder_name or folder_name.startswith("/") or ".." in folder_name.split("/"):
             self._print(f"Refusing to remove unsafe remote path: {folder_name!r}")
             return False
-        ssh_cmd = self._build_controlpath_ssh_command()
-        ssh_cmd.extend([self.scp_server, f'rm -rf "{self.scp_path}/{folder_name}"'])
-        result = subprocess.run(ssh_cmd, check=False, env=os.environ.copy(), timeout=60)
-        if result.returncode == 0:
+        if self.transport.remove(f"{self.scp_path}/{folder_name}", timeout=60):
             self._print(f"Removed skipped game from remote server: {folder_name}")
+            if self.remote_manifest is not None:
+                with self._manifest_lock:
+                    self.remote_manifest.remove_folder(folder_name)
+                self._manifest_changed()
             return True
-        self._print(f"Warning: could not remove {folder_name} from remote (exit {result.returncode})")
+        self._print(f"Warning: could not remove {folder_name} from remote")
         return False
 
+    # --- Remote manifest -------------------------------------------------
+
+    def load_remote_manifest(self) -> None:
+        """Fetch the server manifest; without one the next index build does a full scan."""
+        self.remote_manifest = None
+        self._manifest_needs_scan = True
+        if self.transport is None:
+            return
+        try:
+            payload = self.transport.read_file(f"{self.scp_path}/{MANIFEST_NAME}")
+            self.remote_manifest = SyncManifest.from_json(payload.decode("utf-8", errors="replace")) if payload else None
+        except RuntimeError as exc:
+            self._print(f"Warning: Could not read remote manifest: {exc}")
+
+        if self.remote_manifest is None:
+            self._print("No usable remote manifest, it will be rebuilt from a full scan")
+            self.remote_manifest = SyncManifest()
+        elif self.rescan_remote:
+            # Keep the old manifest around so known hashes survive the rescan.
+            self._print("--rescan-remote: the manifest will be rebuilt from a full scan")
+        else:
+            self._manifest_needs_scan = False
+            self._print(f"Loaded remote manifest with {len(self.remote_manifest.folders)} folders")
+
+    def save_remote_manifest(self) -> None:
+        """Atomically replace the server manifest (temp file + mv)."""
+        if self.transport is None or self.remote_manifest is None or self.dry_run:
+            return
+        with self._manifest_lock:
+            if self._manifest_needs_scan:
+                # Never publish a manifest that has not seen the whole tree yet.
+                return
+            payload = self.remote_manifest.to_json().encode("utf-8")
+            self.transport.write_file(f"{self.scp_path}/{MANIFEST_NAME}", payload)
+            self._manifest_unsaved = 0
+            self._manifest_saved_at = time.monotonic()
+
+    def _manifest_changed(self) -> None:
+        """Note a manifest change, saving it only every MANIFEST_SAVE_CHANGES changes or MANIFEST_SAVE_SECONDS.
+
+        The whole manifest is rewritten on every save, so saving after each
+        game would cost one round trip and one manifest upload per game.
+        """
+        with self._manifest_lock:
+            self._manifest_unsaved += 1
+            due = self._manifest_unsaved >= MANIFEST_SAVE_CHANGES or time.monotonic() - self._manifest_saved_at >= MANIFEST_SAVE_SECONDS
+        if due:
+            self.save_remote_manifest()
+
+    def _scan_remote(self, folders: Optional[Sequence[str]] = None) -> Optional[str]:
+        """Return ``find -printf`` output for the data root or only the given top-level folders."""
+        targets = " ".join(f'"{folder}"' for folder in folders) if folders else "."
+        find_command = f'cd "{self.scp_path}" && find {targets} -printf "%y %s %T@ %p\\n" 2>/dev/null'
+        result = self.transport.run(find_command, capture_output=True, check=False, text=True)
+        if result.returncode != 0 and not result.stdout:
+            self._print(f"Warning: Could not get remote directory listing: {result.stderr}")
+            return None
+        return result.stdout
+
+    def _reconcile_remote_manifest(self, remote_folders: Set[str]) -> None:
+        """Bring the manifest in line with the actual root listing, scanning only new folders."""
+        manifest = self.remote_manifest
+        if manifest is None or self._manifest_needs_scan:
+            return
+        known = manifest.folder_names()
+        unknown = sorted(remote_folders - known)
+        vanished = known - remote_folders
+        for folder in vanished:
+            manifest.remove_folder(folder)
+        # The inventory also tells us which game folders lost their index.json.
+        unindexed = {name for name, entry in (self._remote_inventory or {}).items() if entry.is_dir and not entry.has_index and name in manifest.indexes}
+        for name in unindexed:
+            manifest.indexes.pop(name, None)
+        if unknown:
+            self._temp_print(f"Scanning {len(unknown)} folders missing from the manifest...")
+            listing = self._scan_remote(unknown)
+            if listing is None:
+                self._manifest_needs_scan = True
+                return
+            directories, files, index_dirs = parse_find_listing(listing)
+            manifest.merge_scan(directories, files, index_dirs, folders=unknown)
+            self._touched_folders.update(unknown)
+        if unknown or vanished or unindexed:
+            self._print(f"Reconciled remote manifest: {len(unknown)} added, {len(vanished)} removed, {len(unindexed)} missing index.json")
+            self._manifest_changed()
+
+    def _record_remote_folder(self, folder_name: str, files: Optional[Dict[str, list]], dirs: Optional[Set[str]] = None, source: Optional[Dict[str, object]] = None) -> None:
+        if self.remote_manifest is None or files is None:
+            return
+        with self._manifest_lock:
+            self.remote_manifest.set_folder(folder_name, files, dirs or (), source, self._sidecars.pop(folder_name, None), self._bundles.pop(folder_name, None))
+            self._touched_folders.add(folder_name)
+        self._manifest_changed()
+
     # --- File transfer helpers ------------------------------------------
 
+    def _encode_url(self, url: str) -> str:
+        parsed_url = urllib.parse.urlparse(url)
+        encoded_path = urllib.parse.quote(parsed_url.path, safe="/")
+        return urllib.parse.urlunparse((parsed_url.scheme, parsed_url.netloc, encoded_path, parsed_url.params, parsed_url.query, parsed_url.fragment))
+
     def download_file(self, url: str, filename: str) -> Path:
         filepath = self.download_dir / filename
         temp_filepath = self.download_dir / f"{filename}.downloading"
+        encoded_url = self._encode_url(url)
 
-        parsed_url = urllib.parse.urlparse(url)
-        encoded_path = urllib.parse.quote(parsed_url.path, safe="/")
-        encoded_url = urllib.parse.urlunparse((parsed_url.scheme, parsed_url.netloc, encoded_path, parsed_url.params, parsed_url.query, parsed_url.fragment))
+        mirrors = mirror_urls(encoded_url, self.mirrors)
 
         self._temp_print(f"Downloading {encoded_url}")
-        urllib.request.urlretrieve(encoded_url, temp_filepath)
-        temp_filepath.rename(filepath)
+        if self.download_cache is not None:
+            result = self.download_cache.fetch(encoded_url, filepath, attempts=self.download_retries, progress=self._print, connections=self.download_connections, mirrors=mirrors)
+        else:
+            result = download_segmented(encoded_url, filepath, temp_filepath, connections=self.download_connections, mirrors=mirrors, attempts=self.download_retries, progress=self._print)
+        self._sources[url] = _source_record(encoded_url, result)
         self._temp_print(f"Download completed: {filename}")
         return filepath
 
-    def extract_zip(self, zip_path: Path) -> Path:
+    def extract_zip(self, zip_path: Path, keep_archive: bool = False) -> Path:
         zip_path = Path(zip_path)
         extract_dir = self.download_dir / zip_path.stem
         if extract_dir.exists():
             self._print(f"Directory {extract_dir} already exists, skipping extraction")
             return extract_dir
 
+        # Extract beside the final name so a cut-off run never leaves a folder that looks complete.
+        partial_dir = extract_dir.with_name(extract_dir.name + ".extracting")
+        self._remove_local_path(partial_dir)
         self._temp_print(f"Extracting {zip_path} to {extract_dir}")
-        with zipfile.ZipFile(zip_path, "r") as zip_ref:
-            zip_ref.extractall(extract_dir)
+        try:
+            stats = extract_zip_parallel(zip_path, partial_dir, self.extract_threads)
+        except (ZipStreamCorrupt, zipfile.BadZipFile) as exc:
+            self._remove_local_path(partial_dir)
+            # The archive itself is bad; drop it so the next run downloads it again.
+            zip_path.unlink(missing_ok=True)
+            self.metrics.count("extract_failures")
+            raise ZipStreamCorrupt(f"Cannot extract {zip_path.name}: {exc}") from exc
+        partial_dir.rename(extract_dir)
+        self._temp_print(f"Extracted {stats.files} files ({format_size(stats.bytes_uncompressed)}) from {zip_path.name}")
+        if keep_archive:
+            return extract_dir
         zip_path.unlink()
         self._temp_print(f"Removed {zip_path}")
         return extract_dir
 
-    def upload_folder(self, folder_path: Path) -> bool:
-        if not self.scp_server or not self.scp_path:
+    def upload_folder(self, folder_path: Path, replace: bool = False) -> bool:
+        if self.transport is None:
             self._print("No SCP server configured, skipping upload")
             return False
 
@@ -343,79 +566,400 @@ class GameDownloader:
         folder_name = folder_path.name
         temp_name = f"{folder_name}.uploading"
 
-        cleanup_cmd = self._build_controlpath_ssh_command()
-        env = os.environ.copy()
-        cleanup_cmd.extend([self.scp_server, f'rm -rf "{self.scp_path}/{temp_name}"'])
-        subprocess.run(cleanup_cmd, check=False, env=env, capture_output=True)
+        self.transport.remove(f"{self.scp_path}/{temp_name}")
+        # Keeps mtimes, so the manifest's recorded mtimes match a later remote scan.
+        self.transport.upload_tree(folder_path, f"{self.scp_path}/{temp_name}")
+        self.metrics.add_bytes("upload", folder_name, _folder_size(folder_path))
+        self.transport.swap(f"{self.scp_path}/{temp_name}", f"{self.scp_path}/{folder_name}", replace)
 
-        scp_cmd = self._build_controlpath_ssh_command("scp")
-        scp_cmd.append("-r")
-        scp_cmd.extend([str(folder_path), f"{self.scp_server}:{self.scp_path}/{temp_name}"])
-        subprocess.run(scp_cmd, check=True, env=env)
+        self._print(f"\033[1;32mGame {folder_name} successfully uploaded\033[0m")
+        return True
 
-        ssh_cmd = self._build_controlpath_ssh_command()
-        ssh_cmd.extend([self.scp_server, f'mv "{self.scp_path}/{temp_name}" "{self.scp_path}/{folder_name}"'])
-        subprocess.run(ssh_cmd, check=True, env=env)
+    def upload_archive(self, zip_path: Path, folder_path: Path, manifest_files: Optional[Dict[str, list]] = None) -> bool:
+        """Upload the game's zip as one file and unpack it on the server into ``<name>.uploading``.
+
+        One compressed file (``<name>.uploading.zip``, beside the temp folder so
+        unpacking can start from an empty one) crosses the wire instead of
+        ``scp -r`` of the extracted tree. The unpacked files must match the zip's central
+        directory (same paths, same sizes) before the usual swap publishes the
+        folder, and their server mtimes replace those in ``manifest_files`` so
+        the manifest matches a later remote scan. Returns False, with the temp
+        folder removed, when the server could not unpack the archive
+        faithfully; the caller then uploads the extracted folder instead.
+        """
+        folder_name = folder_path.name
+        temp_path = f"{self.scp_path}/{folder_name}.uploading"
+        archive_path = f"{temp_path}.zip"
+
+        self.transport.upload_file(zip_path, archive_path)
+        self.metrics.add_bytes("upload", folder_name, zip_path.stat().st_size)
+        result = self.transport.run(remote_unzip_command(temp_path, archive_path), capture_output=True, check=False)
+
+        expected = zip_member_sizes(zip_path)
+        unpacked = parse_file_listing(result.stdout) if result.returncode == 0 else {}
+        problem = None
+        if result.returncode == 127:
+            problem = "the server has neither unzip nor python3"
+            self._remote_extract_unavailable = True
+        elif result.returncode != 0:
+            problem = result.stderr.decode("utf-8", errors="replace").strip() or f"exit status {result.returncode}"
+        elif len(unpacked) != len(expected):
+            problem = f"{len(unpacked)} files unpacked, {len(expected)} in the archive"
+        elif any(unpacked.get(path, (None,))[0] != size for path, size in expected.items()):
+            problem = "unpacked files do not match the archive's names and sizes"
+        if problem is not None:
+            self._print(f"Server-side extraction of {folder_name} failed ({problem}), uploading the extracted folder instead")
+            self.metrics.count("remote_extract_failures")
+            self.transport.run(f'rm -rf "{temp_path}" "{archive_path}"', check=False, capture_output=True)
+            return False
 
-        self._print(f"\033[1;32mGame {folder_name} successfully uploaded\033[0m")
+        if manifest_files is not None:
+            for path, record in manifest_files.items():
+                if path in unpacked:
+                    record[1] = unpacked[path][1]
+        self.transport.swap(temp_path, f"{self.scp_path}/{folder_name}")
+        self._print(f"\033[1;32mGame {folder_name} successfully uploaded and extracted on the server ({len(unpacked)} files)\033[0m")
         return True
 
-    def build_http_index(self) -> None:
-        if not self.scp_server or not self.scp_path:
+    def _extracts_remotely(self, job: SyncJob) -> bool:
+        """Whether ``job`` is published by unpacking its zip on the server (see upload_archive)."""
+        if not self.remote_extract or self._remote_extract_unavailable or job.archive_path is None or not job.archive_path.exists():
+            return False
+        # Sidecars and bundles only exist in the local folder, not in the zip.
+        return job.folder_path.name not in self._sidecars and job.folder_path.name not in self._bundles
+
+    def _swap_command(self, folder_name: str, replace: bool = False) -> str:
+        """Remote command that publishes ``<name>.uploading`` as ``<name>``."""
+        return swap_command(f"{self.scp_path}/{folder_name}.uploading", f"{self.scp_path}/{folder_name}", replace)
+
+    def _remote_hashes(self, folder_name: str, paths: Sequence[str]) -> Dict[str, str]:
+        """sha256 of the given files inside a remote game folder, in one round trip."""
+        if not paths:
+            return {}
+        payload = "\0".join(paths).encode("utf-8")
+        result = self.transport.run(f'cd "{self.scp_path}/{folder_name}" && xargs -0 sha256sum --', input=payload, capture_output=True, check=False)
+        hashes: Dict[str, str] = {}
+        for line in result.stdout.decode("utf-8", errors="replace").splitlines():
+            digest, _, path = line.partition("  ")
+            if path and len(digest) == 64:
+                hashes[path] = digest
+        return hashes
+
+    def _stream_tar_upload(self, remote_command: str, folder_path: Path, dirs: Sequence[str], paths: Sequence[str], control: Dict[str, bytes]) -> None:
+        """Pipe the given directories, files and in-memory control files into ``remote_command``."""
+        process = self.transport.popen(remote_command)
+        try:
+            with tarfile.open(fileobj=process.stdin, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+                for directory in dirs:
+                    tar.add(str(folder_path / directory), arcname=directory, recursive=False)
+                for path in paths:
+                    tar.add(str(folder_path / path), arcname=path, recursive=False)
+                for name, payload in control.items():
+                    info = tarfile.TarInfo(name)
+                    info.size = len(payload)
+                    tar.addfile(info, io.BytesIO(payload))
+            process.stdin.close()
+        except BaseException as error:
+            process.kill()
+            returncode = process.wait()
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+            if isinstance(error, OSError):
+                # Usually a broken pipe because the remote command failed; callers fall back on CalledProcessError.
+                raise subprocess.CalledProcessError(returncode, process.args) from error
+            raise
+        returncode = process.wait()
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, process.args)
+        self.metrics.add_bytes("upload", folder_path.name, sum((folder_path / path).stat().st_size for path in paths))
+
+    # --- Content store ---------------------------------------------------
+
+    def _plan_dedup(self, folder_name: str, files: Dict[str, list], paths: Sequence[str]) -> DedupPlan:
+        """Decide which of ``paths`` can be hard-linked from the server content store."""
+        with self._manifest_lock:
+            if self.remote_manifest is None:
+                return DedupPlan()
+            if self._hash_locations is None:
+                # Until a scan confirmed the tree, only blobs stored this run are trusted.
+                self._hash_locations = {} if self._manifest_needs_scan else self.remote_manifest.hash_locations()
+            return plan_dedup(files, paths, self.remote_manifest.store, self._hash_locations)
+
+    def _commit_dedup(self, plan: DedupPlan, files: Dict[str, list]) -> None:
+        with self._manifest_lock:
+            if self.remote_manifest is None:
+                return
+            for path, digest in list(plan.adds.items()) + [(path, digest) for path, digest in plan.links.items()]:
+                self.remote_manifest.store[digest] = int(files[path][0])
+            self.dedup_saved_bytes += plan.saved_bytes
+
+    def _forget_store(self) -> None:
+        """Drop what we believed about the store after a link failed; the next upload re-seeds it."""
+        with self._manifest_lock:
+            if self.remote_manifest is not None:
+                self.remote_manifest.store.clear()
+            self._hash_locations = {}
+
+    def collect_store_garbage(self) -> None:
+        """Delete store blobs no game links to any more (link count 1)."""
+        if not self.dedup or self.transport is None or self.remote_manifest is None:
             return
-
-        self._temp_print("Getting remote directory listing...")
-        ssh_cmd = self._build_controlpath_ssh_command()
-        env = os.environ.copy()
-        find_command = f'cd "{self.scp_path}" && find . -printf "%y %s %p\\n" 2>/dev/null'
-        ssh_cmd.extend([self.scp_server, find_command])
-        result = subprocess.run(ssh_cmd, capture_output=True, check=False, env=env, text=True)
+        command = f'cd "{self.scp_path}" && if [ -d "{STORE_NAME}" ]; then find "{STORE_NAME}" -type f -links 1 -print -delete; fi'
+        result = self.transport.run(command, capture_output=True, check=False, text=True)
         if result.returncode != 0:
-            self._print(f"Warning: Could not get remote directory listing: {result.stderr}")
+            self._print(f"Warning: Could not clean the content store: {result.stderr.strip()}")
             return
+        removed = [line.rsplit("/", 1)[-1] for line in result.stdout.splitlines() if line.strip()]
+        with self._manifest_lock:
+            for digest in removed:
+                self.remote_manifest.store.pop(digest, None)
+        if removed:
+            self._print(f"Removed {len(removed)} unreferenced blobs from the content store")
+            self._manifest_changed()
+
+    def dedup_upload(self, folder_path: Path, files: Dict[str, list], dirs: Optional[Set[str]], source: Optional[Dict[str, object]] = None) -> bool:
+        """Upload a new game, hard-linking content the server already has instead of sending it.
+
+        Like upload_folder the game is assembled in ``<name>.uploading`` and
+        moved into place; files whose sha256 is in the server content store
+        (or in another game the manifest knows) are linked from the store, and
+        every file that was sent is added to the store for later games.
+        """
+        if self.transport is None:
+            self._print("No SCP server configured, skipping upload")
+            return False
 
-        directories: Set[str] = set()
-        existing_index_dirs: Set[str] = set()
-        files_with_size: List[Tuple[str, int]] = []
+        folder_path = Path(folder_path)
+        folder_name = folder_path.name
+        temp_name = f"{folder_name}.uploading"
+        all_dirs = sorted(dirs or ())
+        plan = self._plan_dedup(folder_name, files, sorted(files))
+        remote_command = (
+            f'cd "{self.scp_path}" && rm -rf "{temp_name}" && mkdir "{temp_name}" && cd "{temp_name}" && tar -x -f - '
+            f'&& {dedup_script()} && cd .. && {self._swap_command(folder_name)}'
+        )
+        try:
+            self._stream_tar_upload(remote_command, folder_path, all_dirs, [path for path in sorted(files) if path not in plan.links], dedup_control(plan))
+        except subprocess.CalledProcessError:
+            if not plan.links:
+                raise
+            self._print(f"Warning: linking {folder_name} from the content store failed, uploading it in full")
+            self._forget_store()
+            plan = self._plan_dedup(folder_name, files, sorted(files))
+            self._stream_tar_upload(remote_command, folder_path, all_dirs, [path for path in sorted(files) if path not in plan.links], dedup_control(plan))
+        self._commit_dedup(plan, files)
+        self._record_remote_folder(folder_name, files, dirs, source)
+        self._note_hash_locations(folder_name, files)
+
+        message = f"Game {folder_name} successfully uploaded"
+        if plan.links:
+            message += f" ({len(plan.links)} files, {format_size(plan.saved_bytes)} linked from the content store)"
+        self._print(f"\033[1;32m{message}\033[0m")
+        return True
 
-        for raw_line in result.stdout.strip().splitlines():
-            line = raw_line.strip()
-            if not line:
-                continue
-            try:
-                entry_type, size_str, path_value = line.split(" ", 2)
-            except ValueError:
-                continue
+    def _note_hash_locations(self, folder_name: str, files: Dict[str, list]) -> None:
+        with self._manifest_lock:
+            if self._hash_locations is None:
+                return
+            self._hash_locations = {digest: location for digest, location in self._hash_locations.items() if not location.startswith(f"{folder_name}/")}
+            for path, record in files.items():
+                if record[2]:
+                    self._hash_locations.setdefault(str(record[2]), f"{folder_name}/{path}")
+
+    def delta_upload(self, folder_path: Path, files: Optional[Dict[str, list]], dirs: Optional[Set[str]], source: Optional[Dict[str, object]] = None) -> bool:
+        """Replace a game that already exists on the remote, transferring only changed files.
+
+        The new hashes are compared with the manifest (hashes it does not know
+        are computed remotely with ``sha256sum``). The live folder is hard-link
+        copied to ``<name>.uploading``, the changed files are unpacked over it
+        from a tar stream (``tar -U`` unlinks first, so the live copy is never
+        written through a shared link), removed paths are deleted and the
+        result is swapped in like a regular upload. Without a usable manifest
+        the whole folder is uploaded instead.
+        """
+        if self.transport is None:
+            self._print("No SCP server configured, skipping upload")
+            return False
 
-            if path_value.startswith("./"):
-                path_value = path_value[2:]
+        folder_path = Path(folder_path)
+        folder_name = folder_path.name
+        with self._manifest_lock:
+            usable = self.remote_manifest is not None and not self._manifest_needs_scan and folder_name in self.remote_manifest.folders
+            old_files = self.remote_manifest.folder_files(folder_name) if usable else {}
+            old_dirs = set(self.remote_manifest.folders[folder_name]["dirs"]) if usable else set()
+        if not usable or files is None:
+            return self.upload_folder(folder_path, replace=True)
+
+        unknown = [path for path, record in old_files.items() if record[2] is None and path in files and files[path][0] == record[0]]
+        for path, digest in self._remote_hashes(folder_name, unknown).items():
+            old_files[path] = [old_files[path][0], old_files[path][1], digest]
+
+        changed = sorted(path for path, record in files.items() if path not in old_files or old_files[path][0] != record[0] or old_files[path][2] != record[2])
+        new_dirs = set(dirs or ())
+        removed = sorted(set(old_files) - set(files)) + sorted(old_dirs - new_dirs, reverse=True)
+        # Unchanged files keep their remote mtime, so a later scan still matches the manifest.
+        merged = {path: (list(old_files[path]) if path not in changed else record) for path, record in files.items()}
+        plan = self._plan_dedup(folder_name, files, changed) if self.dedup else DedupPlan()
+
+        if changed or removed:
+            temp_name = f"{folder_name}.uploading"
+            dedup_step = f"&& {dedup_script()} " if self.dedup else ""
+            remote_command = (
+                f'cd "{self.scp_path}" && rm -rf "{temp_name}" && cp -al "{folder_name}" "{temp_name}" && cd "{temp_name}" '
+                f'&& tar -x -U -f - && xargs -0 -r rm -rf -- < .sync-delete && rm -f .sync-delete {dedup_step}&& cd .. '
+                f'&& {self._swap_command(folder_name, replace=True)}'
+            )
+            for attempt in (1, 2):
+                control = {".sync-delete": "\0".join(removed).encode("utf-8")}
+                if self.dedup:
+                    control.update(dedup_control(plan))
+                try:
+                    self._stream_tar_upload(remote_command, folder_path, sorted(new_dirs - old_dirs), [path for path in changed if path not in plan.links], control)
+                    break
+                except subprocess.CalledProcessError:
+                    if not plan.links or attempt == 2:
+                        raise
+                    self._print(f"Warning: linking {folder_name} from the content store failed, sending every changed file")
+                    self._forget_store()
+                    plan = self._plan_dedup(folder_name, files, changed)
+            if self.dedup:
+                self._commit_dedup(plan, files)
+
+        self._record_remote_folder(folder_name, merged, new_dirs, source)
+        if self.dedup:
+            self._note_hash_locations(folder_name, files)
+        changed_bytes = sum(int(files[path][0]) for path in changed if path not in plan.links)
+        total_bytes = sum(int(record[0]) for record in files.values())
+        self._print(
+            f"\033[1;32mGame {folder_name} delta-synced: {len(changed)} changed, {len(removed)} removed "
+            f"({format_size(changed_bytes)} of {format_size(total_bytes)})\033[0m"
+        )
+        return True
 
-            normalized_path = path_value
-            if normalized_path == ".":
-                normalized_path = ""
+    def upload_folders_batch(self, folder_paths: Sequence[Path]) -> bool:
+        """Upload several game folders through a single ssh session.
 
-            path_parts = [part for part in normalized_path.split("/") if part]
-            if any(part.startswith(".") for part in path_parts):
-                continue
+        The folders are packed into one tar stream as ``<name>.uploading`` and
+        a single remote command clears stale temp folders, unpacks the stream
+        and performs every ``mv`` swap, replacing three process spawns per game
+        (plus scp's per-file round trips) with one session per batch. The
+        renames only run once the whole archive was extracted successfully.
+        """
+        if self.transport is None:
+            self._print("No SCP server configured, skipping upload")
+            return False
 
-            if entry_type == "d":
-                directories.add(normalized_path)
-            elif entry_type == "f":
-                try:
-                    size = int(size_str)
-                except ValueError:
-                    continue
+        folder_paths = [Path(path) for path in folder_paths]
+        names = [path.name for path in folder_paths]
+        cleanup = " ".join(f'"{name}.uploading"' for name in names)
+        renames = " && ".join(f'mv "{name}.uploading" "{name}"' for name in names)
+        remote_command = f'cd "{self.scp_path}" && rm -rf {cleanup} && tar -x -f - && {renames}'
 
-                parent_dir = normalized_path.rsplit("/", 1)[0] if "/" in normalized_path else ""
-                filename = normalized_path.rsplit("/", 1)[-1]
-                if filename == "index.json":
-                    existing_index_dirs.add(parent_dir)
-                    continue
+        process = self.transport.popen(remote_command)
+        try:
+            with tarfile.open(fileobj=process.stdin, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+                for folder_path in folder_paths:
+                    tar.add(str(folder_path), arcname=f"{folder_path.name}.uploading")
+        except BaseException:
+            process.kill()
+            process.wait()
+            raise
+        finally:
+            if process.stdin and not process.stdin.closed:
+                process.stdin.close()
+        returncode = process.wait()
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, process.args)
+
+        for folder_path in folder_paths:
+            self.metrics.add_bytes("upload", folder_path.name, _folder_size(folder_path))
+        self._print(f"\033[1;32mGames {', '.join(names)} successfully uploaded in one batch\033[0m")
+        return True
+
+    def stream_upload(self, url: str, folder_name: str) -> bool:
+        """Stream a zip from ``url`` into the remote game folder without local staging.
+
+        The HTTP body is decoded member by member and re-emitted as a tar stream
+        piped into ``ssh ... tar -x`` in the same ``.uploading`` temp folder that
+        upload_folder uses, followed by the same ``mv`` swap. Raises
+        ZipStreamUnsupported when the zip cannot be decoded sequentially.
+        """
+        if self.transport is None:
+            self._print("No SCP server configured, skipping upload")
+            return False
+
+        temp_name = f"{folder_name}.uploading"
+        temp_path = f"{self.scp_path}/{temp_name}"
+        encoded_url = self._encode_url(url)
+
+        attempts = max(1, self.download_retries)
+        for attempt in range(1, attempts + 1):
+            tar_command = f'rm -rf "{temp_path}" && mkdir -p "{temp_path}" && tar -x -f - -C "{temp_path}"'
+            self._temp_print(f"Streaming {encoded_url}")
+            process = None
+            try:
+                request = urllib.request.Request(encoded_url, headers={"User-Agent": USER_AGENT})
+                with urllib.request.urlopen(request, timeout=60) as response:
+                    length_header = response.headers.get("Content-Length")
+                    source = _source_record(encoded_url, DownloadResult(
+                        size=int(length_header) if length_header and length_header.isdigit() else -1,
+                        etag=response.headers.get("ETag"),
+                        last_modified=response.headers.get("Last-Modified"),
+                    ))
+                    process = self.transport.popen(tar_command)
+                    try:
+                        stats = zip_stream_to_tar(response, process.stdin)
+                    finally:
+                        process.stdin.close()
+                returncode = process.wait()
+                if returncode != 0:
+                    raise subprocess.CalledProcessError(returncode, process.args)
+                break
+            except BaseException as exc:
+                if process is not None and process.poll() is None:
+                    process.kill()
+                    process.wait()
+                self.transport.remove(temp_path)
+                if not isinstance(exc, TRANSIENT_ERRORS) or attempt == attempts:
+                    raise
+                delay = min(60, 2 ** attempt)
+                self._print(f"Stream of {folder_name} interrupted ({exc}); retry {attempt}/{attempts - 1} in {delay}s")
+                time.sleep(delay)
+
+        self.transport.rename(temp_path, f"{self.scp_path}/{folder_name}")
+        self._record_remote_folder(folder_name, stats.members, stats.member_dirs, source)
+
+        self.metrics.add_bytes("stream", folder_name, stats.bytes_uncompressed)
+        self._print(f"\033[1;32mGame {folder_name} successfully streamed ({stats.files} files, {stats.bytes_uncompressed} bytes)\033[0m")
+        return True
+
+    def build_http_index(self) -> None:
+        if self.transport is None:
+            return
 
-                if normalized_path:
-                    files_with_size.append((normalized_path, size))
+        if self.remote_manifest is None:
+            self.load_remote_manifest()
+        manifest = self.remote_manifest
+        if self._manifest_needs_scan:
+            self._temp_print("Getting remote directory listing...")
+            listing = self._scan_remote()
+            if listing is None:
+                return
+            scanned_dirs, scanned_files, scanned_index_dirs = parse_find_listing(listing)
+            with self._manifest_lock:
+                manifest.merge_scan(scanned_dirs, scanned_files, scanned_index_dirs)
+                self._manifest_needs_scan = False
+            if self.rescan_remote:
+                # An explicit rescan also checks every index we did not write ourselves.
+                self.verify_indexes = True
+        else:
+            self._temp_print("Using remote manifest instead of a directory scan...")
 
-        directories.add("")  # Ensure root is tracked
+        # The manifest mirrors the remote tree, so no O(total files) listing is needed.
+        directories: Set[str] = manifest.directories()
+        files_with_size: List[Tuple[str, int]] = list(manifest.iter_files(include_derived=False))
 
         file_tree: Dict[str, object] = {}
         for filepath, size in files_with_size:
@@ -430,59 +974,639 @@ class GameDownloader:
             for part in directory.split("/"):
                 current = current.setdefault(part, {})  # type: ignore[assignment]
 
-        dirs_to_update = {directory for directory in directories if directory not in existing_index_dirs}
-
-        if not dirs_to_update:
-            self._print("All index.json files already present")
+        expected: Dict[str, bytes] = dict(self._render_index_files(file_tree))
+        with self._manifest_lock:
+            # Indexes of directories that no longer exist are simply forgotten.
+            for directory in [path for path in manifest.indexes if path not in expected]:
+                del manifest.indexes[directory]
+            recorded = dict(manifest.indexes)
+
+        missing = {directory for directory in expected if directory not in recorded}
+        stale: Set[str] = set()
+        unverified: List[str] = []
+        for directory, digest in sorted(recorded.items()):
+            # Indexes we did not write ourselves (digest unknown) are compared by content,
+            # but only inside the subtrees this run touched unless --verify-indexes is set.
+            if self.verify_indexes or (digest is None and self._index_in_scope(directory)):
+                unverified.append(directory)
+            elif digest is not None and digest != hashlib.sha256(expected[directory]).hexdigest():
+                stale.add(directory)
+        verified: Set[str] = set()
+        if unverified:
+            remote_indexes = self._fetch_remote_index_files(unverified)
+            for directory in unverified:
+                content = remote_indexes.get(directory)
+                try:
+                    matches = content is not None and json.loads(content) == json.loads(expected[directory])
+                except ValueError:
+                    matches = False
+                if matches:
+                    verified.add(directory)
+                else:
+                    stale.add(directory)
+
+        to_write = {directory: expected[directory] for directory in sorted(missing | stale)}
+        if to_write:
+            self._upload_index_files(to_write)
+        with self._manifest_lock:
+            for directory in set(to_write) | verified:
+                manifest.indexes[directory] = hashlib.sha256(expected[directory]).hexdigest()
+        self.save_remote_manifest()
+
+        if not to_write:
+            self._print("All index.json files up to date")
             return
-
-        self._generate_index_files(file_tree, self.scp_path, dirs_to_update)
+        self._print(f"Wrote {len(missing)} new and {len(stale)} stale index.json files")
         self._temp_print("HTTP index built successfully")
 
-    def _generate_index_files(
-        self,
-        tree: Dict[str, object],
-        remote_path: str,
-        dirs_to_update: Set[str],
-        current_path: str = "",
-    ) -> None:
-        remote_index_path = f"{remote_path}/{current_path}/index.json" if current_path else f"{remote_path}/index.json"
-        if current_path in dirs_to_update:
-            simplified_tree = {key: {} if isinstance(value, dict) else value for key, value in tree.items()}
-            temp_index_file = self.download_dir / "temp_index.json"
-            with open(temp_index_file, "w", encoding="utf-8") as handle:
-                json.dump(simplified_tree, handle, indent=2, ensure_ascii=False)
-            scp_cmd = self._build_controlpath_ssh_command("scp")
-            env = os.environ.copy()
-            scp_cmd.extend([str(temp_index_file), f"{self.scp_server}:{remote_index_path}"])
-            subprocess.run(scp_cmd, check=True, env=env)
-            temp_index_file.unlink()
-            printable_path = current_path or "."
-            self._print(f"Created index.json in {printable_path}")
-            dirs_to_update.discard(current_path)
+    def _index_in_scope(self, directory: str) -> bool:
+        return directory == "" or directory.split("/", 1)[0] in self._touched_folders
 
+    def _render_index_files(self, tree: Dict[str, object], current_path: str = "") -> Iterator[Tuple[str, bytes]]:
+        """Yield ``(directory, index.json bytes)`` for every directory of the tree."""
+        simplified_tree = {key: {} if isinstance(value, dict) else value for key, value in tree.items()}
+        yield current_path, json.dumps(simplified_tree, indent=2, ensure_ascii=False, sort_keys=True).encode("utf-8")
         for key, value in tree.items():
             if isinstance(value, dict):
                 subdir_path = f"{current_path}/{key}" if current_path else key
-                self._generate_index_files(value, remote_path, dirs_to_update, subdir_path)
+                yield from self._render_index_files(value, subdir_path)
+
+    @staticmethod
+    def _index_member_name(directory: str) -> str:
+        return f"{directory}/index.json" if directory else "index.json"
+
+    def _fetch_remote_index_files(self, directories: Sequence[str]) -> Dict[str, bytes]:
+        """Download the given directories' index.json files as one tar stream."""
+        names = "\n".join(self._index_member_name(directory) for directory in directories) + "\n"
+        command = f'cd "{self.scp_path}" && tar -c -f - --ignore-failed-read -T - 2>/dev/null'
+        result = self.transport.run(command, input=names.encode("utf-8"), capture_output=True, check=False)
+        contents: Dict[str, bytes] = {}
+        if not result.stdout:
+            return contents
+        by_member = {self._index_member_name(directory): directory for directory in directories}
+        try:
+            with tarfile.open(fileobj=io.BytesIO(result.stdout), mode="r:") as tar:
+                for member in tar:
+                    directory = by_member.get(member.name)
+                    handle = tar.extractfile(member) if directory is not None and member.isfile() else None
+                    if handle is not None:
+                        contents[directory] = handle.read()
+        except tarfile.TarError as exc:
+            self._print(f"Warning: Could not read remote index files: {exc}")
+        return contents
+
+    def _upload_index_files(self, index_files: Dict[str, bytes]) -> None:
+        """Write every given index.json through a single ssh session."""
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w", format=tarfile.PAX_FORMAT) as tar:
+            now = time.time()
+            for directory, content in index_files.items():
+                info = tarfile.TarInfo(self._index_member_name(directory))
+                info.size = len(content)
+                info.mode = 0o644
+                info.mtime = now
+                tar.addfile(info, io.BytesIO(content))
+        self.transport.run(f'cd "{self.scp_path}" && tar -x -f -', input=buffer.getvalue(), check=True)
+        for directory in index_files:
+            self._temp_print(f"Updated index.json in {directory or '.'}")
+
+    # --- Pipeline stages -------------------------------------------------
+
+    def _sample_throughput(self, kind: str, size: int, seconds: float) -> None:
+        with self._throughput_lock:
+            self._throughput_samples[kind][0] += size
+            self._throughput_samples[kind][1] += seconds
+
+    def _record_throughput(self) -> None:
+        """Fold this run's per-stream download/upload rates into the manifest for later plans."""
+        if self.remote_manifest is None:
+            return
+        with self._manifest_lock:
+            history = self.remote_manifest.stats.setdefault("throughput", {})
+            for kind, (size, seconds) in self._throughput_samples.items():
+                update_throughput(history, kind, int(size), seconds)
+
+    def _remove_local_path(self, path: Path) -> None:
+        if path.is_dir():
+            shutil.rmtree(path)
+        elif path.exists():
+            path.unlink()
+
+    def _release_job(self, job: SyncJob, committed: bool) -> None:
+        """Hand back a game's transfer and staging reservations (only the first call counts)."""
+        if job.released:
+            return
+        job.released = True
+        self._transfer_budget.release(committed, job.expected_bytes)
+        self._staging.release(job.relative_path)
+
+    def _drop_job(self, job: SyncJob) -> None:
+        """Pipeline ``on_drop`` callback for a game that failed in a stage or was skipped after an abort."""
+        self._release_job(job, False)
+        if self.disk_budget is not None:
+            # Staged copies would otherwise count against the next run's budget; without one
+            # they stay for --resume like any other finished download or extraction.
+            for path in (job.folder_path, job.archive_path):
+                if path is not None:
+                    self._remove_local_path(path)
+
+    def _leased(self, func):
+        """Wrap a stage so every ssh/scp it runs goes through one pooled connection."""
+        def run(item):
+            if self.transport is None:
+                return func(item)
+            with self.transport.lease():
+                return func(item)
+        return run
+
+    def _update_staging(self, job: SyncJob) -> None:
+        """Replace a staged game's estimate with what its local folder really takes."""
+        if self.disk_budget is not None and job.folder_path is not None and job.folder_path.exists():
+            self._staging.adjust(job.relative_path, _folder_size(job.folder_path))
+
+    def _timed(self, name: str, func):
+        """Wrap a stage so its busy time is attributed to the game (or batch of games) it handled."""
+        def run(item):
+            jobs = item if isinstance(item, list) else [item]
+            with self.metrics.stage(name, [job.relative_path for job in jobs]):
+                return func(item)
+        return run
+
+    def _stage_download(self, job: SyncJob) -> Optional[SyncJob]:
+        if job.folder_path is not None:
+            return job
+        file_path = self.download_dir / job.filename
+        if file_path.exists():
+            job.archive_path = file_path
+        else:
+            started = time.monotonic()
+            job.archive_path = self.download_file(job.url, job.filename)
+            self.metrics.add_bytes("download", job.relative_path, job.archive_path.stat().st_size)
+            if self.download_cache is None:
+                # A cache hit says nothing about the link speed.
+                self._sample_throughput("download", job.archive_path.stat().st_size, time.monotonic() - started)
+        if not job.filename.endswith(".zip"):
+            # Nothing to extract or upload, but the game still counts as processed.
+            job.process_metadata = True
+            self._release_job(job, False)
+            return None
+        self.journal.record("downloaded", job.relative_path, size=job.archive_path.stat().st_size)
+        if self.disk_budget is not None:
+            # The local central directory is exact even when the remote probe was not possible.
+            with zipfile.ZipFile(job.archive_path) as archive:
+                extracted = sum(info.file_size for info in archive.infolist())
+            self._staging.adjust(job.relative_path, job.archive_path.stat().st_size + extracted)
+        return job
+
+    def _stage_extract(self, job: SyncJob) -> SyncJob:
+        if job.folder_path is None:
+            with self.metrics.stage("unzip", [job.relative_path]):
+                job.folder_path = self.extract_zip(job.archive_path, keep_archive=self.remote_extract and self.transport is not None)
+            self.journal.record("extracted", job.relative_path)
+            self.metrics.add_bytes("extract", job.relative_path, _folder_size(job.folder_path))
+        if self.remote_manifest is not None:
+            job.manifest_files, job.manifest_dirs = scan_local_folder(job.folder_path)
+        self._update_staging(job)
+        return job
+
+    def _stage_bundle(self, job: SyncJob) -> SyncJob:
+        paths = list(job.manifest_files) if job.manifest_files is not None else [
+            os.path.relpath(os.path.join(root, name), job.folder_path).replace(os.sep, "/")
+            for root, _, names in os.walk(job.folder_path)
+            for name in names
+        ]
+        bundle = write_bundle(job.folder_path, paths, min_files=self.bundle_min_files, max_file_size=self.bundle_max_file_size)
+        if job.manifest_files is not None:
+            # A bundle of an earlier run may have been scanned along with the game files.
+            for path in (BUNDLE_DATA_NAME, BUNDLE_TABLE_NAME):
+                job.manifest_files.pop(path, None)
+        if bundle is None:
+            return job
+        if job.manifest_files is not None:
+            for path in bundle_paths(bundle):
+                stat = (job.folder_path / path).stat()
+                job.manifest_files[path] = [stat.st_size, int(stat.st_mtime), hash_file(job.folder_path / path)]
+        self._bundles[job.folder_path.name] = bundle
+        self._update_staging(job)
+        self._temp_print(f"Bundled {bundle['files']} files of {job.folder_path.name} ({format_size(int(bundle['size']))})")  # type: ignore[call-overload]
+        return job
+
+    def _stage_compress(self, job: SyncJob) -> SyncJob:
+        # Sidecars of an earlier run are rebuilt, since the game files may have changed since.
+        for path in remove_compressed(job.folder_path):
+            if job.manifest_files is not None:
+                job.manifest_files.pop(path, None)
+        compressed = precompress_folder(
+            job.folder_path,
+            list(job.manifest_files) if job.manifest_files is not None else None,
+            self._compress_pool,
+            min_size=self.precompress_min_size,
+            # Range requests into the bundle must hit the raw bytes, never an encoded sidecar.
+            exclude=bundle_paths(self._bundles.get(job.folder_path.name)),
+        )
+        if not compressed:
+            return job
+        table = write_compressed_table(job.folder_path, compressed)
+        if job.manifest_files is not None:
+            for sidecar in [*sidecar_paths(compressed), table]:
+                path = job.folder_path / sidecar
+                stat = path.stat()
+                job.manifest_files[sidecar] = [stat.st_size, int(stat.st_mtime), hash_file(path)]
+        self._sidecars[job.folder_path.name] = compressed
+        self._update_staging(job)
+        original = sum(int((job.folder_path / path).stat().st_size) for path in compressed)
+        smallest = sum(min(variants.values()) for variants in compressed.values())
+        self._temp_print(f"Precompressed {len(compressed)} files of {job.folder_path.name}: {format_size(original)} -> {format_size(smallest)}")
+        return job
+
+    def _stage_upload(self, job: SyncJob) -> None:
+        uploaded = False
+        try:
+            if job.delta:
+                uploaded = self.delta_upload(job.folder_path, job.manifest_files, job.manifest_dirs, self._sources.get(job.url))
+            elif self.dedup and job.manifest_files is not None:
+                uploaded = self.dedup_upload(job.folder_path, job.manifest_files, job.manifest_dirs, self._sources.get(job.url))
+            else:
+                started = time.monotonic()
+                if self._extracts_remotely(job) and self.upload_archive(job.archive_path, job.folder_path, job.manifest_files):
+                    uploaded, sent = True, job.archive_path.stat().st_size
+                else:
+                    uploaded, sent = self.upload_folder(job.folder_path), _folder_size(job.folder_path)
+                if uploaded:
+                    self._sample_throughput("upload", sent, time.monotonic() - started)
+        finally:
+            self._release_job(job, uploaded)
+        job.uploaded = uploaded
+        job.process_metadata = True
+        if uploaded:
+            self.journal.record("uploaded", job.relative_path)
+        if uploaded and not job.delta and not (self.dedup and job.manifest_files is not None):
+            self._record_remote_folder(job.folder_path.name, job.manifest_files, job.manifest_dirs, self._sources.get(job.url))
+        if uploaded:
+            # Delta and deduplicated uploads record the manifest themselves.
+            self.journal.record("committed", job.relative_path)
+        if job.reused_local_folder or (uploaded and self.disk_budget is not None):
+            self._remove_local_path(job.folder_path)
+        if uploaded and self.remote_extract and job.archive_path is not None and job.archive_path.exists():
+            # Kept by extract_zip for upload_archive.
+            self._remove_local_path(job.archive_path)
+        return None
+
+    def _stage_upload_batch(self, jobs: List[SyncJob]) -> None:
+        small_jobs: List[SyncJob] = []
+        for job in jobs:
+            if job.delta or self.dedup or self._extracts_remotely(job) or (self.upload_batch_max_bytes and _folder_size(job.folder_path) > self.upload_batch_max_bytes):
+                # Delta syncs, deduplicated uploads, zips unpacked on the server and large games go on their own; batching would delay the small ones.
+                self._stage_upload(job)
+            else:
+                small_jobs.append(job)
+        if len(small_jobs) == 1:
+            self._stage_upload(small_jobs[0])
+            return None
+        if not small_jobs:
+            return None
+
+        uploaded = False
+        try:
+            started = time.monotonic()
+            uploaded = self.upload_folders_batch([job.folder_path for job in small_jobs])
+            if uploaded:
+                self._sample_throughput("upload", sum(_folder_size(job.folder_path) for job in small_jobs), time.monotonic() - started)
+        finally:
+            for job in small_jobs:
+                self._release_job(job, uploaded)
+        if uploaded:
+            for job in small_jobs:
+                self.journal.record("uploaded", job.relative_path)
+        if uploaded and self.remote_manifest is not None:
+            with self._manifest_lock:
+                for job in small_jobs:
+                    if job.manifest_files is not None:
+                        self.remote_manifest.set_folder(
+                            job.folder_path.name,
+                            job.manifest_files,
+                            job.manifest_dirs or (),
+                            self._sources.get(job.url),
+                            self._sidecars.pop(job.folder_path.name, None),
+                            self._bundles.pop(job.folder_path.name, None),
+                        )
+                        self._touched_folders.add(job.folder_path.name)
+            self._manifest_changed()
+        for job in small_jobs:
+            if uploaded:
+                self.journal.record("committed", job.relative_path)
+            job.uploaded = uploaded
+            job.process_metadata = True
+            if job.reused_local_folder or (uploaded and self.disk_budget is not None):
+                self._remove_local_path(job.folder_path)
+        return None
+
+    def _stage_stream(self, job: SyncJob) -> None:
+        if job.folder_path is None and job.filename.endswith(".zip") and not job.delta:
+            uploaded = False
+            try:
+                uploaded = self.stream_upload(job.url, Path(job.filename).stem)
+            except ZipStreamUnsupported as exc:
+                self._print(f"Cannot stream {job.filename} ({exc}), falling back to download and extract")
+            else:
+                self._release_job(job, uploaded)
+                if uploaded:
+                    # stream_upload records the manifest as part of the upload.
+                    self.journal.record("uploaded", job.relative_path)
+                    self.journal.record("committed", job.relative_path)
+                job.uploaded = uploaded
+                job.process_metadata = True
+                return None
+
+        next_job: Optional[SyncJob] = job
+        for stage in (self._stage_download, self._stage_extract, self._stage_upload):
+            next_job = stage(next_job)
+            if next_job is None:
+                break
+        return None
+
+    # --- Scheduling ------------------------------------------------------
+
+    def _schedule_targets(self, targets: Sequence[str], remote_folders: Set[str], known_sizes: Optional[Dict[str, int]] = None) -> List[str]:
+        """Probe the size of every pending transfer and order them by ``transfer_order``.
+
+        Games already on the remote cost nothing and keep their place at the
+        front; only the games that will be transferred are reordered.
+        ``known_sizes`` maps download URLs whose size an earlier probe already
+        found, so they are not requested again.
+        """
+        settled: List[str] = []
+        pending: List[TransferCandidate] = []
+        for relative_path in targets:
+            entry = self.catalog.get(relative_path)
+            download_url = self._select_download_url(entry) if entry else None
+            if not entry or relative_path in remote_folders or not (download_url or "").startswith("https://downloads.scummvm.org/frs/"):
+                settled.append(relative_path)
+                continue
+            candidate = TransferCandidate(relative_path, self._encode_url(download_url), featured=bool(entry.metadata and entry.metadata.get("featured")))
+            local_folder_path = self.download_dir / relative_path
+            if download_url.endswith(".zip") and local_folder_path.exists():
+                candidate.size = _folder_size(local_folder_path)
+            elif known_sizes:
+                candidate.size = known_sizes.get(candidate.url)
+            pending.append(candidate)
+
+        self._temp_print(f"Probing the size of {len(pending)} pending transfers...")
+        probe_sizes(pending, probe_content_length)
+        ordered = order_candidates(pending, self.transfer_order)
+        self._expected_sizes = {candidate.relative_path: candidate.size or 0 for candidate in ordered}
+
+        total = sum(candidate.size or 0 for candidate in ordered)
+        unknown = sum(1 for candidate in ordered if candidate.size is None)
+        message = f"Scheduled {len(ordered)} transfers ({format_size(total)}) in {self.transfer_order} order"
+        if unknown:
+            message += f", {unknown} of unknown size"
+        self._print(message)
+        return settled + [candidate.relative_path for candidate in ordered]
+
+    def _estimate_staging(self, targets: Sequence[str], remote_folders: Set[str], stale: Set[str]) -> None:
+        """Estimate the local disk every pending game will need while it is staged.
+
+        Zips are sized from their central directory, read with two small range
+        requests per archive in parallel, so the extracted size is known before
+        anything is downloaded. Games whose server ignores ranges fall back to
+        the archive size and are corrected after the download.
+        """
+        urls: Dict[str, str] = {}
+        for relative_path in targets:
+            entry = self.catalog.get(relative_path)
+            download_url = self._select_download_url(entry) if entry else None
+            if not entry or (relative_path in remote_folders and relative_path not in stale):
+                continue
+            if not (download_url or "").startswith("https://downloads.scummvm.org/frs/"):
+                continue
+            local_folder_path = self.download_dir / relative_path
+            if download_url.endswith(".zip") and local_folder_path.exists() and relative_path not in stale:
+                self._staging_estimates[relative_path] = _folder_size(local_folder_path)
+            else:
+                urls[relative_path] = self._encode_url(download_url)
+
+        self._temp_print(f"Reading the central directory of {len(urls)} pending downloads...")
+        sizes = probe_urls(urls.values(), probe_zip_sizes)
+        unsized = [url for relative_path, url in urls.items() if sizes[url] is None and relative_path not in self._expected_sizes]
+        archive_sizes = probe_urls(unsized, probe_content_length)
+        unknown = 0
+        for relative_path, url in urls.items():
+            probed = sizes[url]
+            if probed is None:
+                unknown += 1
+                self._staging_estimates[relative_path] = self._expected_sizes.get(relative_path) or archive_sizes.get(url) or 0
+            else:
+                self._staging_estimates[relative_path] = sum(probed)
+        total = sum(self._staging_estimates.values())
+        message = f"Staging {len(self._staging_estimates)} games needs up to {format_size(total)} of local disk (budget {format_size(self.disk_budget or 0)})"
+        if unknown:
+            message += f", {unknown} estimated from the archive size only"
+        self._print(message)
+
+    def _find_stale_games(self, targets: Sequence[str], remote_folders: Set[str], forced: bool) -> Set[str]:
+        """Return the remote games whose upstream archive changed since they were uploaded.
+
+        Every candidate is probed with a parallel ``HEAD`` and compared with the
+        ``source`` the manifest recorded for it. A game uploaded before sources
+        were recorded adopts the current validators as its baseline. With
+        ``forced`` (games named on the command line) every candidate is stale.
+        """
+        manifest = self.remote_manifest
+        if manifest is None or self._manifest_needs_scan:
+            self._print("Delta sync needs the remote manifest, no existing games will be refreshed")
+            return set()
+        candidates: Dict[str, str] = {}
+        for relative_path in targets:
+            entry = self.catalog.get(relative_path)
+            download_url = self._select_download_url(entry) if entry else None
+            if relative_path in remote_folders and (download_url or "").startswith("https://downloads.scummvm.org/frs/"):
+                candidates[relative_path] = self._encode_url(download_url)
+        if forced:
+            return set(candidates)
+
+        self._temp_print(f"Checking {len(candidates)} remote games for upstream changes...")
+        probes = probe_urls(candidates.values(), probe_url)
+        stale: Set[str] = set()
+        adopted = 0
+        with self._manifest_lock:
+            for relative_path, url in candidates.items():
+                current = probes.get(url)
+                if current is None:
+                    continue
+                recorded = manifest.source(relative_path)
+                if recorded is None:
+                    manifest.set_source(relative_path, _source_record(url, current))
+                    adopted += 1
+                elif _source_changed(recorded, current):
+                    stale.add(relative_path)
+        if adopted:
+            self._manifest_changed()
+        self._print(f"Delta sync: {len(stale)} of {len(candidates)} remote games changed upstream")
+        return stale
 
     # --- Processing ------------------------------------------------------
 
-    def download_and_process_games(self, requested_ids: Sequence[str], max_transfers: Optional[int] = None, featured_only: bool = False) -> None:
+    def _select_targets(self, requested_ids: Sequence[str], featured_only: bool) -> List[str]:
         targets = self.resolve_requested_targets(requested_ids)
         if featured_only:
             # Limited/scummvm.org deployment: only sync the curated featured set.
             targets = [rp for rp in targets
                        if (e := self.catalog.get(rp)) and e.metadata and e.metadata.get('featured')]
             self._print(f"--featured-only: restricted to {len(targets)} featured games")
-        self.processed_games_metadata = []
-
+        return targets
+
+    def _removal_candidates(self, requested_ids: Sequence[str], featured_only: bool, remote_folders: Set[str]) -> List[str]:
+        """Remote games marked skip=true that the removal pass deletes (see download_and_process_games)."""
+        if requested_ids or featured_only or self.transport is None:
+            return []
+        return [
+            relative_path
+            for relative_path, entry in self.catalog.items()
+            if not entry.should_include_in_json and relative_path in remote_folders
+        ]
+
+    def plan_sync(self, requested_ids: Sequence[str], max_transfers: Optional[int] = None, featured_only: bool = False) -> Dict[str, object]:
+        """Work out what ``download_and_process_games`` would do, without transferring or changing anything.
+
+        Reads the remote inventory and manifest, probes every pending download
+        (central directory for the extracted size, ``Content-Length`` otherwise)
+        and prices each action with the throughput recorded by earlier runs.
+        Budgets (``--max-transfers``, ``--max-bytes``, ``--time-budget``) are
+        applied to the estimates to show which transfers would be deferred.
+        When the remote cannot be listed the plan is still built, with the
+        remote state marked unknown: every target is priced as a transfer and
+        no removals are proposed.
+        """
+        self.dry_run = True
+        targets = self._select_targets(requested_ids, featured_only)
+        remote_known = True
         try:
-            remote_folders_snapshot = self.get_remote_folders()
-            self._print(f"Found {len(remote_folders_snapshot)} folders on remote server")
+            remote_folders = self.get_remote_folders()
+            self._print(f"Found {len(remote_folders)} folders on remote server")
         except RuntimeError as exc:
-            self._print(f"Error getting remote folders: {exc}")
-            return
+            self._print(f"Error getting remote folders: {exc}; planning with the remote state unknown")
+            remote_folders, remote_known = set(), False
+        if self.transport is not None and remote_known:
+            self.load_remote_manifest()
+        manifest = self.remote_manifest
+
+        history = dict(manifest.stats.get("throughput", {})) if manifest is not None else {}
+        throughput = {kind: float(history.get(kind) or default) for kind, default in DEFAULT_THROUGHPUT.items()}
+        throughput_source = "history" if all(history.get(kind) for kind in DEFAULT_THROUGHPUT) else "default"
+
+        actions: List[PlanAction] = []
+        removals = self._removal_candidates(requested_ids, featured_only, remote_folders) if remote_known else []
+        for relative_path in removals:
+            files = manifest.folder_files(relative_path) if manifest is not None else {}
+            reason = "marked skip"
+            if files:
+                reason += f" ({len(files)} files, {format_size(sum(int(record[0]) for record in files.values()))})"
+            actions.append(PlanAction("remove", relative_path, reason=reason, estimated_seconds=ROUND_TRIP_SECONDS, destructive=True))
+        remaining = set(remote_folders) - set(removals)
+
+        stale = self._find_stale_games(targets, remaining, forced=bool(requested_ids)) if self.delta_sync else set()
+
+        pending: Dict[str, str] = {}
+        for relative_path in targets:
+            entry = self.catalog.get(relative_path)
+            if not entry or (relative_path in remaining and relative_path not in stale):
+                continue
+            download_url = self._select_download_url(entry) or ""
+            if not download_url.startswith("https://downloads.scummvm.org/frs/"):
+                actions.append(PlanAction("error", relative_path, reason="missing on remote and lacks ScummVM download URL"))
+                continue
+            pending[relative_path] = self._encode_url(download_url)
+
+        self._temp_print(f"Probing {len(pending)} pending downloads...")
+        zip_sizes = probe_urls((url for url in pending.values() if url.endswith(".zip")), probe_zip_sizes)
+        if self.transfer_order != "name" or self.max_bytes is not None or self.time_budget is not None:
+            # The central directory probe already gave the archive sizes; only the rest is probed again.
+            archive_sizes = {url: probed[0] for url, probed in zip_sizes.items() if probed}
+            targets = self._schedule_targets(targets, remaining, archive_sizes)
+            pending = {relative_path: pending[relative_path] for relative_path in targets if relative_path in pending}
+            # A local folder's size stands in for the archive only when scheduling; keep probing those.
+            archive_sizes.update({
+                pending[relative_path]: size
+                for relative_path, size in self._expected_sizes.items()
+                if size and relative_path in pending and not (self.download_dir / relative_path).exists()
+            })
+        else:
+            archive_sizes = {}
+        unsized = [url for url in pending.values() if zip_sizes.get(url) is None and url not in archive_sizes]
+        archive_sizes.update(probe_urls(unsized, probe_content_length))
+
+        transfers = 0
+        committed_bytes = 0
+        elapsed = 0.0
+        for relative_path, url in pending.items():
+            probed = zip_sizes.get(url)
+            download_bytes = probed[0] if probed else archive_sizes.get(url)
+            # Without the central directory the archive size is the best guess for the upload.
+            upload_bytes = (probed[1] if probed else download_bytes) if url.endswith(".zip") else 0
+            seconds = transfer_seconds(download_bytes, upload_bytes, throughput)
+            action = PlanAction(
+                "refresh" if relative_path in stale else "transfer",
+                relative_path,
+                url=url,
+                download_bytes=download_bytes,
+                upload_bytes=upload_bytes,
+                estimated_seconds=seconds,
+                reason="changed upstream" if relative_path in stale else "missing on remote" if remote_known else "remote state unknown",
+                destructive=relative_path in stale,
+            )
+            over_transfers = max_transfers is not None and transfers >= max_transfers
+            over_bytes = self.max_bytes is not None and committed_bytes + (download_bytes or 0) > self.max_bytes
+            over_time = self.time_budget is not None and elapsed + (seconds or 0.0) > self.time_budget
+            if over_transfers or over_bytes or over_time:
+                action.action = "defer"
+                action.reason = "transfer limit" if over_transfers else "byte budget" if over_bytes else "time budget"
+                action.destructive = False
+            else:
+                transfers += 1
+                committed_bytes += download_bytes or 0
+                elapsed += seconds or 0.0
+            actions.append(action)
+
+        touched = [action.game for action in actions if action.action in ("transfer", "refresh", "remove")]
+        if touched:
+            actions.append(PlanAction("rebuild_index", reason=f"{len(touched)} folders changed", estimated_seconds=ROUND_TRIP_SECONDS))
+
+        settings = {
+            "requested": list(requested_ids),
+            "featured_only": featured_only,
+            "max_transfers": max_transfers,
+            "max_bytes": self.max_bytes,
+            "time_budget": self.time_budget,
+            "order": self.transfer_order,
+            "delta_sync": self.delta_sync,
+            "remote_state": "listed" if remote_known else "unknown",
+        }
+        return build_plan(actions, throughput, throughput_source, self.download_workers, self.upload_workers, settings)
+
+    def download_and_process_games(self, requested_ids: Sequence[str], max_transfers: Optional[int] = None, featured_only: bool = False) -> None:
+        targets = self._select_targets(requested_ids, featured_only)
+        self.processed_games_metadata = []
+
+        resumed = self._load_resume_state()
+        self.journal.start(resume=resumed is not None)
+        remote_folders_snapshot = resumed.remote_folders() if resumed is not None else None
+        if remote_folders_snapshot is not None:
+            self._print(f"Using the journaled inventory of {len(remote_folders_snapshot)} remote folders instead of a new listing")
+        else:
+            try:
+                with self.metrics.phase("remote_listing"):
+                    remote_folders_snapshot = self.get_remote_folders()
+                self._print(f"Found {len(remote_folders_snapshot)} folders on remote server")
+            except RuntimeError as exc:
+                self._print(f"Error getting remote folders: {exc}")
+                return
+            self.journal.record_inventory(remote_folders_snapshot)
+
+        if self.transport is not None:
+            with self.metrics.phase("manifest"):
+                self.load_remote_manifest()
+                self._reconcile_remote_manifest(remote_folders_snapshot)
 
         remote_folders_remaining = set(remote_folders_snapshot)
         remote_folders_for_validation = set(remote_folders_snapshot)
@@ -494,91 +1618,150 @@ class GameDownloader:
         # validation. Remove them so they leave both games.json and the host.
         # Never run the removal pass in featured-only mode: against the full
         # host it would treat every non-featured game as removable.
-        if not requested_ids and not featured_only and self.scp_server and self.scp_path:
-            for relative_path, entry in self.catalog.items():
-                if entry.should_include_in_json:
+        for relative_path in self._removal_candidates(requested_ids, featured_only, remote_folders_snapshot):
+            with self.metrics.phase("removal"):
+                removed = self.remove_from_remote(relative_path)
+            if removed:
+                self.metrics.count("games_removed")
+                self.journal.record("removed", relative_path)
+                remote_folders_remaining.discard(relative_path)
+                remote_folders_for_validation.discard(relative_path)
+
+        # Downloads, extraction and uploads run as a pipeline so the HTTP link and
+        # the ssh link are busy at the same time. Decisions (remote existence,
+        # --max-transfers admission) stay on this thread in target order; the
+        # stages only move bytes and record their outcome on the job.
+        with self.metrics.phase("planning"):
+            stale = self._find_stale_games(targets, remote_folders_remaining, forced=bool(requested_ids)) if self.delta_sync else set()
+            if self.transfer_order != "name" or self.max_bytes is not None or self.time_budget is not None:
+                targets = self._schedule_targets(targets, remote_folders_remaining)
+        deadline = self._started + self.time_budget if self.time_budget is not None else None
+        self._transfer_budget = TransferBudget(max_transfers, max_bytes=self.max_bytes, deadline=deadline)
+        # Streaming needs no local staging; its download fallback is not worth throttling.
+        self._staging = StagingBudget(self.disk_budget if not self.stream_uploads else None)
+        if self.disk_budget is not None and not self.stream_uploads:
+            with self.metrics.phase("planning"):
+                self._estimate_staging(targets, remote_folders_remaining, stale)
+        jobs: List[SyncJob] = []
+        deferred: Set[str] = set()
+        # Refreshes held back by --max-bytes/--time-budget; their older copy stays published.
+        deferred_refreshes: Set[str] = set()
+        if self.stream_uploads:
+            # Zero-disk mode: every game is a single HTTP -> tar -> ssh stream.
+            stages = [("stream", self._leased(self._timed("stream", self._stage_stream)), self.upload_workers)]
+        else:
+            stages = [
+                ("download", self._timed("download", self._stage_download), self.download_workers),
+                ("extract", self._timed("extract", self._stage_extract), self.extract_workers),
+                *([("bundle", self._timed("bundle", self._stage_bundle), 1)] if self.bundle else []),
+                *([("compress", self._timed("compress", self._stage_compress), 1)] if self.precompress else []),
+                ("upload", self._leased(self._timed("upload", self._stage_upload)), self.upload_workers),
+            ]
+            if self.upload_batch > 1:
+                stages[-1] = ("upload", self._leased(self._timed("upload", self._stage_upload_batch)), self.upload_workers, self.upload_batch, UPLOAD_BATCH_LINGER)
+        if self.precompress and not self.stream_uploads and self._compress_pool is None:
+            if not brotli_available():
+                self._print("brotli module not installed, only .gz sidecars will be produced")
+            self._compress_pool = ProcessPoolExecutor(max_workers=self.precompress_workers)
+        pipeline_started = time.monotonic()
+        with Pipeline(stages, queue_size=self.queue_size, on_drop=self._drop_job) as pipeline:
+            for relative_path in targets:
+                entry = self.catalog.get(relative_path)
+                if not entry:
+                    self._print(f"Warning: {relative_path} missing from catalog, skipping")
                     continue
-                if relative_path in remote_folders_snapshot and self.remove_from_remote(relative_path):
-                    remote_folders_remaining.discard(relative_path)
-                    remote_folders_for_validation.discard(relative_path)
-
-        transfer_count = 0
-        for relative_path in targets:
-            entry = self.catalog.get(relative_path)
-            if not entry:
-                self._print(f"Warning: {relative_path} missing from catalog, skipping")
-                continue
 
-            download_url = self._select_download_url(entry)
-            normalized_url = download_url or ""
-            has_scummvm_download = normalized_url.startswith("https://downloads.scummvm.org/frs/")
-            filename = normalized_url.rsplit("/", 1)[-1] if normalized_url else relative_path
+                download_url = self._select_download_url(entry)
+                normalized_url = download_url or ""
+                has_scummvm_download = normalized_url.startswith("https://downloads.scummvm.org/frs/")
+                filename = normalized_url.rsplit("/", 1)[-1] if normalized_url else relative_path
+                job = SyncJob(relative_path=relative_path, url=normalized_url, filename=filename,
+                              expected_bytes=self._expected_sizes.get(relative_path, 0))
+                jobs.append(job)
+
+                if self.folder_exists_on_remote(relative_path, remote_folders_remaining):
+                    if relative_path not in stale:
+                        self._print(f"\033[92mGame {relative_path} already exists on remote server, skipping\033[0m")
+                        job.process_metadata = True
+                        self.metrics.count("games_unchanged")
+                        continue
+                    job.delta = True
 
-            exists_on_remote = self.folder_exists_on_remote(relative_path, remote_folders_remaining)
-            should_process_metadata = False
-            if exists_on_remote:
-                self._print(f"\033[92mGame {relative_path} already exists on remote server, skipping\033[0m")
-                should_process_metadata = True
-            else:
                 if not has_scummvm_download:
                     raise FileNotFoundError(f"Game {relative_path} missing on remote and lacks ScummVM download URL")
 
                 local_folder_path = self.download_dir / relative_path
                 local_zip_path = self.download_dir / filename if filename.endswith(".zip") else None
-                allow_transfers = max_transfers is None or transfer_count < max_transfers
-
-                if filename.endswith(".zip") and local_folder_path.exists():
-                    upload_succeeded = False
-                    if allow_transfers and self.upload_folder(local_folder_path):
-                        transfer_count += 1
-                        upload_succeeded = True
-                    should_process_metadata = True
-                    if local_folder_path.exists():
-                        if local_folder_path.is_dir():
-                            shutil.rmtree(local_folder_path)
-                        else:
-                            local_folder_path.unlink()
-                    if upload_succeeded:
-                        remote_folders_for_validation.add(relative_path)
-                else:
-                    file_path = self.download_dir / filename
-                    temp_file_path = self.download_dir / f"{filename}.downloading"
-                    if temp_file_path.exists():
-                        temp_file_path.unlink()
-                        self._print(f"Cleaned up stale temp download: {temp_file_path}")
-
-                    if allow_transfers:
-                        if not file_path.exists():
-                            downloaded_file = self.download_file(normalized_url, filename)
-                        else:
-                            downloaded_file = file_path
-
-                        if filename.endswith(".zip"):
-                            extracted_folder = self.extract_zip(downloaded_file)
-                            if self.upload_folder(extracted_folder):
-                                transfer_count += 1
-                                remote_folders_for_validation.add(relative_path)
-                        should_process_metadata = True
+                if job.delta:
+                    # Local leftovers predate the upstream change that triggered the refresh.
+                    self._remove_local_path(local_folder_path)
+                    if local_zip_path:
+                        self._remove_local_path(local_zip_path)
+                reuse_local_folder = filename.endswith(".zip") and local_folder_path.exists()
+
+                if not self._transfer_budget.acquire(lambda: pipeline.aborted, job.expected_bytes):
+                    if pipeline.aborted:
+                        break
+                    deferred.add(relative_path)
+                    # A deferred refresh still leaves the old copy published.
+                    job.process_metadata = job.delta
+                    if job.delta and self._transfer_budget.refused_by_budget:
+                        deferred_refreshes.add(relative_path)
+                    if reuse_local_folder:
+                        job.process_metadata = True
+                        self._remove_local_path(local_folder_path)
                     else:
-                        if file_path.exists():
-                            file_path.unlink()
-                        if local_folder_path.exists():
-                            if local_folder_path.is_dir():
-                                shutil.rmtree(local_folder_path)
-                            else:
-                                local_folder_path.unlink()
-                        if local_zip_path and local_zip_path.exists():
-                            local_zip_path.unlink()
-
-            if should_process_metadata:
-                merged_entry = self.merged_metadata_by_path.get(relative_path)
+                        self._remove_local_path(self.download_dir / filename)
+                        self._remove_local_path(local_folder_path)
+                        if local_zip_path:
+                            self._remove_local_path(local_zip_path)
+                    continue
+
+                if reuse_local_folder:
+                    job.folder_path = local_folder_path
+                    job.reused_local_folder = True
+                    job.process_metadata = True
+
+                # Blocks until staged games have been uploaded and their local copies removed.
+                if not self._staging.acquire(relative_path, self._staging_estimates.get(relative_path, 0), lambda: pipeline.aborted):
+                    self._transfer_budget.release(False, job.expected_bytes)
+                    break
+
+                if not pipeline.submit(job):
+                    self._release_job(job, False)
+                    break
+
+        if self._compress_pool is not None:
+            self._compress_pool.shutdown()
+            self._compress_pool = None
+        self.metrics.record_phase("pipeline", time.monotonic() - pipeline_started)
+        if self._staging.max_bytes is not None:
+            self._print(f"Peak local staging: {format_size(self._staging.peak)} of {format_size(self._staging.max_bytes)} budget")
+        if deferred:
+            self._print(f"Deferred {len(deferred)} transfers to a later run (transfer, byte or time budget reached)")
+
+        for job in jobs:
+            if job.uploaded:
+                self.metrics.count("games_refreshed" if job.delta else "games_added")
+        self.metrics.count("games_deferred", len(deferred))
+
+        for job in jobs:
+            if job.uploaded:
+                remote_folders_for_validation.add(job.relative_path)
+            if job.process_metadata:
+                merged_entry = self.merged_metadata_by_path.get(job.relative_path)
                 if merged_entry:
                     self.processed_games_metadata.append(merged_entry)
                 else:
-                    self._print(f"Warning: No metadata found for {relative_path}")
-
-        if not requested_ids and self.scp_server and self.scp_path:
-            errors, warnings = validate_remote_folders(remote_folders_for_validation, self.catalog)
+                    self._print(f"Warning: No metadata found for {job.relative_path}")
+
+        if not requested_ids and self.transport is not None:
+            # Games deferred by --max-transfers, or new games over the byte or time budget,
+            # still count as missing, as they always did.
+            errors, warnings = validate_remote_folders(remote_folders_for_validation | deferred_refreshes, self.catalog)
+            self.metrics.set_gauge("remote_folders", len(remote_folders_for_validation))
+            self.metrics.set_gauge("orphaned_folders", len(errors))
+            self.metrics.set_gauge("missing_folders", len(warnings))
             if errors:
                 self._print("\033[91mError: Orphaned folders on remote server:\033[0m")
                 for message in errors:
@@ -591,12 +1774,46 @@ class GameDownloader:
                 raise RuntimeError("Remote server is missing folders that should have been synced")
 
         if self.processed_games_metadata:
-            self.generate_processed_games_json()
+            with self.metrics.phase("games_json"):
+                self.generate_processed_games_json()
         else:
             self._print("No games were processed, skipping games.json generation")
 
+        if self.dedup:
+            with self.metrics.phase("store_gc"):
+                self.collect_store_garbage()
+            self._print(f"Content store saved {format_size(self.dedup_saved_bytes)} of uploads this run")
+
+        self._record_throughput()
         self._print("Building HTTP index after all uploads...")
-        self.build_http_index()
+        with self.metrics.phase("index"):
+            self.build_http_index()
+        self.journal.record("indexed")
+        self.journal.finish()
+
+    def _load_resume_state(self) -> Optional[JournalState]:
+        """With ``--resume``, read the journal of an interrupted run and drop its half-done local work.
+
+        Completed downloads and extractions are reused by the normal local-file
+        checks, and games the journal saw uploaded count as present on the
+        remote. Only a folder whose extraction was cut off is removed, since it
+        would otherwise be uploaded incomplete.
+        """
+        if not self.resume:
+            return None
+        state = self.journal.load()
+        if state is None or state.finished:
+            self._print("No interrupted sync to resume, starting a new run")
+            return None
+        for relative_path in incomplete_extractions(state):
+            folder_path = self.download_dir / relative_path
+            if folder_path.exists():
+                self._print(f"Removing partial extraction of {relative_path}")
+                self._remove_local_path(folder_path)
+        started = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(state.started))
+        pending = state.games("extracted") - state.games("uploaded")
+        self._print(f"Resuming sync started {started}: {len(state.games('committed'))} games committed, {len(pending)} extracted and waiting for upload")
+        return state
 
 
 def main():
@@ -608,6 +1825,8 @@ Environment Variables:
                   (e.g., ~/.ssh/id_rsa)
   SSH_PASSWORD    SSH password for authentication (requires sshpass)
                   Note: SSH keys are preferred over passwords for security
+  SYNC_CACHE_DIR  Persistent download cache directory (same as --cache-dir)
+  SYNC_CACHE_MAX_GB  Download cache size limit (same as --cache-max-gb)
         ''',
         formatter_class=argparse.RawDescriptionHelpFormatter
     )
@@ -616,8 +1835,43 @@ Environment Variables:
     parser.add_argument('--scp-server', help='SCP server for uploading (user@host)')
     parser.add_argument('--scp-path', help='Remote path for uploading games')
     parser.add_argument('--scp-port', type=int, help='SSH/SCP port (default: 22)')
+    parser.add_argument('--no-persistent-shell', action='store_true', help='Fork one ssh process per remote command instead of sending them through a long-lived remote shell per SSH connection')
+    parser.add_argument('--transport', choices=['ssh', 'local'], default='ssh', help='How to reach --scp-path: over ssh/scp to --scp-server, or as a local or mounted directory (e.g. NFS) with reflink/copy_file_range copies and renames, no ssh at all (default: ssh)')
     parser.add_argument('--max-transfers', type=int, help='Maximum number of games to transfer (excluding skipped ones)')
+    parser.add_argument('--max-bytes', type=parse_size, help='Stop admitting transfers once this many bytes (e.g. 2G, 750M) are committed or in flight')
+    parser.add_argument('--time-budget', type=parse_duration, help='Stop admitting transfers that would not finish within this wall-clock budget (e.g. 45m, 1.5h)')
+    parser.add_argument('--order', choices=ORDER_POLICIES, default='name', help='Transfer order for games missing on the remote; sizes are probed with HEAD first (default: name)')
+    parser.add_argument('--delta-sync', action='store_true', help='Refresh games already on the remote whose upstream archive changed (or that are named on the command line), transferring only changed files')
+    parser.add_argument('--dedup', action='store_true', help='Keep a content-addressed store on the server and hard-link files it already has instead of uploading them (implies no --upload-batch; not used with --stream)')
+    parser.add_argument('--precompress', action='store_true', help='Create .br/.gz sidecars for compressible files before upload (brotli needs the optional brotli module; not used with --stream)')
+    parser.add_argument('--precompress-workers', type=int, default=None, help='Processes used for precompression (default: CPU count)')
+    parser.add_argument('--precompress-min-kb', type=int, default=DEFAULT_MIN_SIZE // 1024, help='Only precompress files at least this large (default: 16)')
+    parser.add_argument('--bundle', action='store_true', help='Also publish each game\'s small files concatenated into one bundle with an offset table, for range requests from the web client (not used with --stream)')
+    parser.add_argument('--bundle-min-files', type=int, default=DEFAULT_BUNDLE_MIN_FILES, help='Only bundle games with at least this many small files (default: 16)')
+    parser.add_argument('--bundle-max-file-kb', type=int, default=DEFAULT_BUNDLE_MAX_FILE_SIZE // 1024, help='Files larger than this stay loose only (default: 1024)')
+    parser.add_argument('--disk-budget', type=parse_size, default=None, help='Cap the local disk used by downloaded and extracted games, e.g. 10G; new downloads wait for staged games to be uploaded and removed (default: unlimited)')
+    parser.add_argument('--plan', nargs='?', const='-', metavar='FILE', help='Do not transfer anything: write the planned actions with estimated bytes and durations as JSON to FILE (default: stdout)')
+    parser.add_argument('--resume', action='store_true', help='Continue an interrupted run from its journal (.sync-journal.jsonl in the download directory): keep finished downloads and extractions and skip the remote listing')
+    parser.add_argument('--metrics-json', metavar='FILE', help='Write per-phase, per-stage and per-game timings, byte counts and ssh round trips as JSON to FILE at the end of the run')
+    parser.add_argument('--metrics-textfile', metavar='FILE', help='Write an OpenMetrics textfile (for node_exporter\'s textfile collector) with run duration, bytes, games added/removed and per-stage histograms')
     parser.add_argument('--featured-only', action='store_true', help='Sync only games whose metadata carries featured (limited/scummvm.org deployment). Disables the server-side removal pass.')
+    parser.add_argument('--download-retries', type=int, default=5, help='Attempts per download; interrupted downloads resume from the partial file (default: 5)')
+    parser.add_argument('--cache-dir', default=os.environ.get('SYNC_CACHE_DIR'), help='Persistent download cache, revalidated with conditional GETs (default: $SYNC_CACHE_DIR, disabled if unset)')
+    parser.add_argument('--cache-max-gb', type=float, default=float(os.environ.get('SYNC_CACHE_MAX_GB', 4.0)), help='Evict least recently used cache entries above this size (default: $SYNC_CACHE_MAX_GB or 4)')
+    parser.add_argument('--download-workers', type=int, default=2, help='Number of concurrent downloads (default: 2)')
+    parser.add_argument('--download-connections', type=int, default=1, help='Range requests per download for files of 8 MiB and more, on servers that advertise Accept-Ranges (default: 1, a single stream)')
+    parser.add_argument('--mirror', dest='mirrors', action='append', default=[], metavar='URL', help='Base URL of a mirror serving the same /frs/ tree as downloads.scummvm.org; mirrors and the main host are raced and large files come from the fastest (repeatable)')
+    parser.add_argument('--extract-workers', type=int, default=1, help='Number of concurrent zip extractions (default: 1)')
+    parser.add_argument('--extract-threads', type=int, default=None, help='Threads inflating the members of each zip, every one with its own handle on the archive (default: CPU count, at most 4)')
+    parser.add_argument('--upload-workers', type=int, default=1, help='Number of concurrent uploads; the shared host caps SSH sessions (default: 1)')
+    parser.add_argument('--ssh-connections', type=int, default=None, help='Number of parallel SSH master connections uploads are spread over (default: same as --upload-workers)')
+    parser.add_argument('--stream', action='store_true', help='Stream each zip from HTTP straight into the remote folder as tar over ssh, without local staging')
+    parser.add_argument('--remote-extract', action='store_true', help='Upload each downloaded zip as a single file and unpack it on the server (unzip, or python3 if missing) instead of copying the extracted tree; the unpacked files are checked against the archive before the swap')
+    parser.add_argument('--upload-batch', type=int, default=1, help='Upload up to N ready games through one ssh session as a single tar stream (default: 1, no batching)')
+    parser.add_argument('--upload-batch-max-mb', type=int, default=50, help='Games larger than this are uploaded on their own even when batching (default: 50)')
+    parser.add_argument('--rescan-remote', action='store_true', help='Ignore the server manifest and rebuild it from a full remote scan')
+    parser.add_argument('--verify-indexes', action='store_true', help='Check every index.json against the listing, not only those in folders touched by this run')
+    parser.add_argument('--queue-size', type=int, default=2, help='Games allowed to wait between pipeline stages (default: 2)')
     
     args = parser.parse_args()
     
@@ -628,17 +1882,65 @@ Environment Variables:
     scp_server = args.scp_server or (os.environ.get('SSH_USER') + '@' + os.environ.get('SSH_HOST') if os.environ.get('SSH_USER') and os.environ.get('SSH_HOST') else None)
     scp_path = args.scp_path or os.environ.get('SSH_PATH')
     scp_port = args.scp_port or (int(os.environ.get('SSH_PORT')) if os.environ.get('SSH_PORT') else None)
-    downloader = GameDownloader(download_dir=args.download_dir, scp_server=scp_server, scp_path=scp_path, scp_port=scp_port)
+    download_cache = DownloadCache(Path(args.cache_dir), max_bytes=int(args.cache_max_gb * 1024 ** 3)) if args.cache_dir else None
+    downloader = GameDownloader(
+        download_dir=args.download_dir,
+        scp_server=scp_server,
+        scp_path=scp_path,
+        scp_port=scp_port,
+        download_retries=args.download_retries,
+        download_cache=download_cache,
+        download_workers=args.download_workers,
+        download_connections=args.download_connections,
+        mirrors=args.mirrors,
+        extract_workers=args.extract_workers,
+        extract_threads=args.extract_threads,
+        upload_workers=args.upload_workers,
+        queue_size=args.queue_size,
+        stream_uploads=args.stream,
+        remote_extract=args.remote_extract,
+        upload_batch=args.upload_batch,
+        upload_batch_max_bytes=args.upload_batch_max_mb * 1024 * 1024 if args.upload_batch_max_mb else None,
+        rescan_remote=args.rescan_remote,
+        verify_indexes=args.verify_indexes,
+        ssh_connections=args.ssh_connections or args.upload_workers,
+        transfer_order=args.order,
+        max_bytes=args.max_bytes,
+        time_budget=args.time_budget,
+        delta_sync=args.delta_sync,
+        dedup=args.dedup,
+        precompress=args.precompress,
+        precompress_workers=args.precompress_workers,
+        precompress_min_size=args.precompress_min_kb * 1024,
+        bundle=args.bundle,
+        bundle_min_files=args.bundle_min_files,
+        bundle_max_file_size=args.bundle_max_file_kb * 1024,
+        disk_budget=args.disk_budget,
+        resume=args.resume,
+        transport=args.transport,
+        persistent_shell=not args.no_persistent_shell,
+    )
 
     connection_opened = False
-    if scp_server and scp_path:
+    if downloader.transport is not None:
         downloader.open_connection()
         connection_opened = True
 
+    success = False
     try:
         metadata_path = Path(__file__).parent.parent / "assets" / "metadata.json"
-        downloader.refresh_catalog(metadata_path)
-        downloader.download_and_process_games(game_ids, args.max_transfers, featured_only=args.featured_only)
+        with downloader.metrics.phase("catalog"):
+            downloader.refresh_catalog(metadata_path)
+        if args.plan:
+            plan = json.dumps(downloader.plan_sync(game_ids, args.max_transfers, featured_only=args.featured_only), indent=2)
+            if args.plan == '-':
+                print(plan)
+            else:
+                Path(args.plan).write_text(plan + "\n", encoding="utf-8")
+                print(f"Wrote sync plan to {args.plan}")
+        else:
+            downloader.download_and_process_games(game_ids, args.max_transfers, featured_only=args.featured_only)
+        success = True
     except KeyboardInterrupt:
         print("\nInterrupted by user")
         sys.exit(1)
@@ -648,6 +1950,13 @@ Environment Variables:
                 downloader.close_connection()
             except RuntimeError:
                 pass
+        if download_cache is not None:
+            download_cache.flush()
+        if args.metrics_json:
+            # Also written for failed or interrupted runs, where the timings matter most.
+            downloader.metrics.write_json(Path(args.metrics_json))
+        if args.metrics_textfile:
+            write_openmetrics(downloader.metrics, Path(args.metrics_textfile), success)
 
 
 if __name__ == "__main__":
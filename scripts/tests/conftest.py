@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The helpers are plain modules next to the scripts, not a package.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,145 @@
+import io
+import struct
+import tarfile
+import zipfile
+
+import pytest
+
+from helper_archive import ZipStreamCorrupt, ZipStreamUnsupported, extract_zip_parallel, safe_member_name, zip_stream_to_tar
+
+
+class _Unseekable(io.RawIOBase):
+    """Write-only sink, so zipfile falls back to data descriptors like a streaming zipper."""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.data += data
+        return len(data)
+
+
+def _zip(members, *, streamed=False, compression=zipfile.ZIP_DEFLATED, force_zip64=False):
+    sink = _Unseekable() if streamed else io.BytesIO()
+    with zipfile.ZipFile(sink, "w", compression=compression) as archive:
+        for name, payload in members.items():
+            info = zipfile.ZipInfo(name, date_time=(2020, 1, 2, 3, 4, 6))
+            info.compress_type = compression
+            with archive.open(info, "w", force_zip64=force_zip64) as handle:
+                handle.write(payload)
+    return bytes(sink.data) if streamed else sink.getvalue()
+
+
+def _convert(data, prefix=""):
+    output = io.BytesIO()
+    stats = zip_stream_to_tar(io.BytesIO(data), output, prefix)
+    output.seek(0)
+    with tarfile.open(fileobj=output, mode="r") as tar:
+        files = {member.name: tar.extractfile(member).read() for member in tar.getmembers() if member.isfile()}
+    return stats, files
+
+
+MEMBERS = {"GAME/DATA.001": b"scumm" * 5000, "GAME/README.TXT": b"hello\n", "empty": b""}
+
+
+@pytest.mark.parametrize("compression", [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED])
+def test_sizes_in_local_header(compression):
+    stats, files = _convert(_zip(MEMBERS, compression=compression), prefix="game.uploading/")
+    assert files == {f"game.uploading/{name}": payload for name, payload in MEMBERS.items()}
+    assert stats.files == 3
+    assert stats.bytes_uncompressed == sum(len(payload) for payload in MEMBERS.values())
+    assert stats.members["GAME/README.TXT"][0] == 6
+
+
+def test_deflated_member_with_data_descriptor():
+    data = _zip(MEMBERS, streamed=True)
+    flags = struct.unpack_from("<H", data, 6)[0]
+    assert flags & 0x08
+    stats, files = _convert(data)
+    assert files == MEMBERS
+    assert 0 < stats.bytes_compressed <= len(data)
+
+
+def test_stored_member_with_data_descriptor_is_unsupported():
+    data = _zip(MEMBERS, streamed=True, compression=zipfile.ZIP_STORED)
+    with pytest.raises(ZipStreamUnsupported):
+        _convert(data)
+
+
+@pytest.mark.parametrize("streamed", [False, True])
+def test_zip64_sizes(streamed):
+    data = _zip(MEMBERS, streamed=streamed, force_zip64=True)
+    # The local header carries the 0xFFFFFFFF markers and the real sizes in the zip64 extra field.
+    assert struct.unpack_from("<II", data, 18) == (0xFFFFFFFF, 0xFFFFFFFF)
+    _, files = _convert(data)
+    assert files == MEMBERS
+
+
+def test_crc_mismatch():
+    payload = b"abcdefgh" * 64
+    data = bytearray(_zip({"FILE": payload}, compression=zipfile.ZIP_STORED))
+    data[data.index(payload) + 10] ^= 0xFF
+    with pytest.raises(ZipStreamCorrupt, match="CRC mismatch"):
+        _convert(bytes(data))
+
+
+def test_crc_mismatch_with_data_descriptor():
+    data = bytearray(_zip({"FILE": b"payload" * 100}, streamed=True))
+    descriptor = data.index(b"PK\x07\x08")
+    crc = struct.unpack_from("<I", data, descriptor + 4)[0]
+    struct.pack_into("<I", data, descriptor + 4, crc ^ 1)
+    with pytest.raises(ZipStreamCorrupt, match="CRC mismatch"):
+        _convert(bytes(data))
+
+
+def test_truncated_stream():
+    data = _zip({"FILE": bytes(range(256)) * 100}, compression=zipfile.ZIP_STORED)
+    with pytest.raises(ZipStreamCorrupt, match="ended inside"):
+        _convert(data[:1000])
+
+
+def test_unsafe_members_are_sanitized_like_extractall():
+    members = {"GAME/OK": b"ok", "../evil": b"evil", "/abs/x": b"abs", "GAME/../../up": b"up", "C:/drive": b"drive", "../": b""}
+    _, files = _convert(_zip(members), prefix="game.uploading/")
+    assert files == {
+        "game.uploading/GAME/OK": b"ok",
+        "game.uploading/evil": b"evil",
+        "game.uploading/abs/x": b"abs",
+        "game.uploading/GAME/up": b"up",
+        "game.uploading/drive": b"drive",
+    }
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_extract_zip_parallel_keeps_unsafe_members_inside(tmp_path, workers):
+    archive = tmp_path / "game.zip"
+    archive.write_bytes(_zip({"GAME/OK": b"ok", "../evil": b"evil", "/abs/x": b"abs"}))
+    destination = tmp_path / "out" / "game"
+    stats = extract_zip_parallel(archive, destination, workers=workers)
+    assert stats.files == 3
+    assert (destination / "evil").read_bytes() == b"evil"
+    assert (destination / "abs" / "x").read_bytes() == b"abs"
+    assert not (tmp_path / "out" / "evil").exists()
+
+
+@pytest.mark.parametrize(
+    "name, expected",
+    [
+        ("GAME\\DATA.001", "GAME/DATA.001"),
+        ("./GAME//A", "GAME/A"),
+        ("GAME/", "GAME/"),
+        ("DISK:1/A", "DISK:1/A"),
+        ("../evil", "evil"),
+        ("GAME/../../evil", "GAME/evil"),
+        ("..\\evil", "evil"),
+        ("/etc/passwd", "etc/passwd"),
+        ("C:/evil", "evil"),
+        ("c:", ""),
+        ("../", ""),
+    ],
+)
+def test_safe_member_name_normalizes(name, expected):
+    assert safe_member_name(name) == expected
@@ -0,0 +1,155 @@
+import http.server
+import os
+import re
+import threading
+
+import pytest
+
+import helper_download
+from helper_download import DownloadError, _split_segments, download_segmented, download_with_resume
+
+# Large enough for several segments (each at least two CHUNK_SIZEs).
+PAYLOAD = os.urandom(9 * 1024 * 1024 + 123)
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """Serves PAYLOAD with an ETag, 304 revalidation and single-range support; ``cut`` truncates the next N GET bodies."""
+
+    payload = PAYLOAD
+    etag = '"v1"'
+    cut = 0
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self._respond(body=False)
+
+    def do_GET(self):
+        self._respond(body=True)
+
+    def _respond(self, body):
+        server = type(self)
+        if self.headers.get("If-None-Match") == server.etag:
+            self.send_response(304)
+            self.send_header("ETag", server.etag)
+            self.end_headers()
+            return
+        start, end = 0, len(server.payload) - 1
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        partial = match is not None and self.headers.get("If-Range") in (None, server.etag)
+        if partial:
+            start = int(match.group(1))
+            end = min(int(match.group(2)) if match.group(2) else end, end)
+        if body:
+            server.requests.append((start, end) if partial else None)
+        self.send_response(206 if partial else 200)
+        self.send_header("ETag", server.etag)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end + 1 - start))
+        if partial:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(server.payload)}")
+        self.end_headers()
+        if not body:
+            return
+        data = server.payload[start:end + 1]
+        if server.cut:
+            server.cut -= 1
+            data = data[: len(data) // 2]
+            self.wfile.write(data)
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def server():
+    handler = type("Handler", (_Handler,), {"requests": [], "cut": 0, "etag": '"v1"', "payload": PAYLOAD})
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    handler.url = f"http://127.0.0.1:{httpd.server_address[1]}/game.zip"
+    yield handler
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(helper_download.time, "sleep", lambda seconds: None)
+
+
+@pytest.mark.parametrize("size, connections", [(1, 4), (10, 1), (5 * 1024 * 1024, 2), (64 * 1024 * 1024 + 1, 4)])
+def test_split_segments_cover_the_file(size, connections):
+    segments = _split_segments(size, connections)
+    assert segments[0].start == 0 and segments[-1].end == size - 1
+    assert all(a.end + 1 == b.start for a, b in zip(segments, segments[1:]))
+    assert all(segment.offset == segment.start for segment in segments)
+    assert len(segments) <= connections * helper_download.SEGMENTS_PER_CONNECTION
+
+
+def test_segmented_download(server, tmp_path):
+    destination = tmp_path / "game.zip"
+    result = download_segmented(server.url, destination, connections=3, min_size=1)
+    assert destination.read_bytes() == PAYLOAD
+    assert result.etag == '"v1"' and result.size == len(PAYLOAD)
+    assert len(server.requests) > 1 and None not in server.requests
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["game.zip"]
+
+
+def test_segmented_download_resumes_missing_ranges(server, tmp_path):
+    destination = tmp_path / "game.zip"
+    server.cut = 1
+    with pytest.raises(DownloadError):
+        download_segmented(server.url, destination, connections=2, min_size=1, attempts=1)
+    assert (tmp_path / "game.zip.segments").exists() and (tmp_path / "game.zip.segments.json").exists()
+
+    server.requests.clear()
+    download_segmented(server.url, destination, connections=2, min_size=1, attempts=1)
+    assert destination.read_bytes() == PAYLOAD
+    assert sum(end + 1 - start for start, end in server.requests) < len(PAYLOAD)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["game.zip"]
+
+
+def test_segmented_download_starts_over_when_the_file_changed(server, tmp_path):
+    destination = tmp_path / "game.zip"
+    server.cut = 1
+    with pytest.raises(DownloadError):
+        download_segmented(server.url, destination, connections=2, min_size=1, attempts=1)
+
+    server.payload = PAYLOAD[::-1]
+    server.etag = '"v2"'
+    server.requests.clear()
+    download_segmented(server.url, destination, connections=2, min_size=1, attempts=1)
+    assert destination.read_bytes() == PAYLOAD[::-1]
+    assert sum(end + 1 - start for start, end in server.requests) == len(PAYLOAD)
+
+
+def test_single_stream_resume_requests_only_the_tail(server, tmp_path):
+    destination = tmp_path / "game.zip"
+    server.cut = 1
+    with pytest.raises(DownloadError):
+        download_with_resume(server.url, destination, attempts=1)
+    partial_size = (tmp_path / "game.zip.downloading").stat().st_size
+    assert 0 < partial_size < len(PAYLOAD)
+
+    server.requests.clear()
+    download_with_resume(server.url, destination, attempts=1)
+    assert destination.read_bytes() == PAYLOAD
+    assert server.requests == [(partial_size, len(PAYLOAD) - 1)]
+
+
+def test_cache_hits_record_recency_outside_the_index(server, tmp_path):
+    cache = helper_download.DownloadCache(tmp_path / "cache")
+    cache.fetch(server.url, tmp_path / "first.zip")
+    index = (tmp_path / "cache" / "index.json").read_bytes()
+    first_used = helper_download.json.loads((tmp_path / "cache" / "usage.json").read_text())[server.url]
+
+    cache = helper_download.DownloadCache(tmp_path / "cache")
+    cache.fetch(server.url, tmp_path / "second.zip")
+    cache.flush()
+    assert cache.hits == 1 and (tmp_path / "second.zip").read_bytes() == PAYLOAD
+    assert (tmp_path / "cache" / "index.json").read_bytes() == index
+    assert helper_download.json.loads((tmp_path / "cache" / "usage.json").read_text())[server.url] >= first_used
@@ -0,0 +1,69 @@
+import json
+
+from helper_journal import JOURNAL_VERSION, SyncJournal, incomplete_extractions
+
+
+def _interrupted_run(path):
+    journal = SyncJournal(path)
+    journal.start()
+    journal.record_inventory(["kept", "skipped"])
+    journal.record("removed", "skipped")
+    for stage in ("downloaded", "extracted", "uploaded", "committed"):
+        journal.record(stage, "done")
+    journal.record("downloaded", "half", size=10)
+    journal.record("downloaded", "waiting")
+    journal.record("extracted", "waiting")
+    journal.close()
+    return journal
+
+
+def test_replay_of_an_interrupted_run(tmp_path):
+    state = _interrupted_run(tmp_path / "journal.jsonl").load()
+    assert not state.finished and state.started > 0
+    assert state.games("committed") == {"done"}
+    assert state.games("extracted") - state.games("uploaded") == {"waiting"}
+    assert incomplete_extractions(state) == ["half"]
+    assert state.remote_folders() == {"kept", "done"}
+
+
+def test_torn_last_line_is_ignored_and_terminated_on_resume(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    journal = _interrupted_run(path)
+    with open(path, "a", encoding="utf-8") as handle:
+        handle.write('{"event":"uploaded","ga')
+    assert journal.load().games("uploaded") == {"done"}
+
+    journal.start(resume=True)
+    journal.record("uploaded", "waiting")
+    journal.close()
+    state = journal.load()
+    assert state.games("uploaded") == {"done", "waiting"}
+    assert path.read_text().splitlines()[-3] == '{"event":"uploaded","ga'
+
+
+def test_a_new_download_invalidates_the_earlier_extraction(tmp_path):
+    journal = _interrupted_run(tmp_path / "journal.jsonl")
+    journal.start(resume=True)
+    journal.record("downloaded", "waiting")
+    journal.close()
+    assert incomplete_extractions(journal.load()) == ["half", "waiting"]
+
+
+def test_finished_run_and_fresh_start(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    journal = _interrupted_run(path)
+    journal.start(resume=True)
+    journal.finish()
+    assert journal.load().finished
+
+    journal.start()
+    journal.close()
+    state = journal.load()
+    assert state.stages == {} and state.inventory is None and state.remote_folders() is None
+
+
+def test_foreign_version_or_missing_journal(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    assert SyncJournal(path).load() is None
+    path.write_text(json.dumps({"event": "run", "version": JOURNAL_VERSION + 1}) + "\n")
+    assert SyncJournal(path).load() is None
@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+from helper_compress import COMPRESSED_TABLE_NAME
+from helper_manifest import MANIFEST_VERSION, SyncManifest, parse_find_listing
+
+
+def _manifest():
+    manifest = SyncManifest()
+    manifest.set_folder(
+        "game",
+        {"DATA.001": [10, 100, "aa"], "sub/README.TXT": [3, 100, "bb"], "DATA.001.br": [4, 100, "cc"], COMPRESSED_TABLE_NAME: [20, 100, "dd"]},
+        source={"url": "https://example.org/game.zip", "etag": '"v1"'},
+        compressed={"DATA.001": {"br": 4}},
+    )
+    manifest.indexes = {"": None, "game": "ee", "game/sub": "ff"}
+    return manifest
+
+
+def test_round_trip_keeps_every_section():
+    manifest = _manifest()
+    manifest.store = {"aa": 10}
+    manifest.stats = {"throughput": {"download": 1000.0}}
+    data = json.loads(manifest.to_json())
+    assert data["version"] == MANIFEST_VERSION
+    loaded = SyncManifest.from_json(manifest.to_json())
+    assert loaded.folders == manifest.folders
+    assert loaded.indexes == manifest.indexes and loaded.store == manifest.store and loaded.stats == manifest.stats
+    assert loaded.folder_files("game")["sub/README.TXT"] == [3, 100, "bb"]
+    assert loaded.directories() == {"", "game", "game/sub"}
+
+
+@pytest.mark.parametrize("text", ["", "  ", "{not json", json.dumps({"version": 99, "folders": {}}), json.dumps([1, 2])])
+def test_unreadable_or_foreign_manifests_are_ignored(text):
+    assert SyncManifest.from_json(text) is None
+
+
+def test_version_1_manifest_with_index_list_is_read():
+    text = json.dumps({"version": 1, "folders": {"game": {"dirs": [], "files": {"A": [1, 2, None]}}}, "indexes": ["", "game"]})
+    manifest = SyncManifest.from_json(text)
+    assert manifest.indexes == {"": None, "game": None}
+    assert manifest.store == {} and manifest.stats == {}
+
+
+def test_set_folder_drops_the_folders_indexes_only():
+    manifest = _manifest()
+    manifest.set_folder("game", {"NEW": [1, 1, "11"]})
+    assert manifest.indexes == {"": None}
+    assert "source" not in manifest.folders["game"]
+
+
+def test_merge_scan_keeps_hashes_of_unchanged_files():
+    manifest = _manifest()
+    directories, files, index_dirs = parse_find_listing(
+        "d 0 1.0 .\nd 0 1.0 ./game\nd 0 1.0 ./game/sub\n"
+        "f 10 100.5 ./game/DATA.001\nf 5 200.0 ./game/sub/README.TXT\nf 4 100.0 ./game/DATA.001.br\n"
+        f"f 20 100.0 ./game/{COMPRESSED_TABLE_NAME}\nf 9 100.0 ./game/index.json\nf 7 100.0 ./loose.txt\nf 1 1.0 ./.sync-manifest.json\n"
+    )
+    assert index_dirs == {"game"} and "game/index.json" not in files and ".sync-manifest.json" not in files
+    manifest.merge_scan(directories, files, index_dirs)
+    folder_files = manifest.folder_files("game")
+    assert folder_files["DATA.001"] == [10, 100, "aa"]
+    # Size changed on the server: the hash is no longer known.
+    assert folder_files["sub/README.TXT"] == [5, 200, None]
+    assert manifest.folders["game"]["compressed"] == {"DATA.001": {"br": 4}}
+    assert manifest.source("game")["etag"] == '"v1"'
+    assert manifest.root_files == {"loose.txt": [7, 100, None]}
+    # Indexes follow the scan: game keeps its digest, the vanished ones are gone.
+    assert manifest.indexes == {"game": "ee"}
+
+
+def test_merge_scan_of_selected_folders_leaves_the_rest():
+    manifest = _manifest()
+    manifest.set_folder("other", {"X": [1, 1, "xx"]})
+    manifest.merge_scan({"other"}, {"other/Y": (2, 2)}, set(), folders=["other", "gone"])
+    assert manifest.folder_files("other") == {"Y": [2, 2, None]}
+    assert manifest.folder_files("game")["DATA.001"] == [10, 100, "aa"]
+    assert "gone" not in manifest.folders
+
+
+def test_merge_scan_drops_sidecar_records_whose_files_vanished():
+    manifest = _manifest()
+    manifest.merge_scan({"game"}, {"game/DATA.001": (10, 100), f"game/{COMPRESSED_TABLE_NAME}": (20, 100)}, set())
+    assert "compressed" not in manifest.folders["game"]
+
+
+def test_iter_files_can_leave_out_derived_files():
+    manifest = _manifest()
+    assert sorted(path for path, _ in manifest.iter_files(include_derived=False)) == ["game/DATA.001", "game/sub/README.TXT"]
+    assert len(list(manifest.iter_files())) == 4
+    assert manifest.hash_locations()["aa"] == "game/DATA.001"
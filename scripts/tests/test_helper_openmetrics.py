@@ -0,0 +1,37 @@
+import re
+
+from helper_openmetrics import OpenMetricsWriter
+
+
+def _families(text):
+    """Map each declared family to its TYPE and the sample names under it, like a Prometheus text parser."""
+    families = {}
+    current = None
+    for line in text.splitlines():
+        match = re.match(r"# TYPE (\S+) (\S+)$", line)
+        if match:
+            current = match.group(1)
+            families[current] = {"type": match.group(2), "samples": set()}
+        elif line and not line.startswith("#"):
+            families[current]["samples"].add(re.match(r"[^{ ]+", line).group(0))
+    return families
+
+
+def test_counter_family_is_named_like_its_samples():
+    writer = OpenMetricsWriter()
+    writer.counter("sync_stage_bytes", "Bytes per stage", 10, {"stage": "download"})
+    writer.counter("sync_stage_bytes", "Bytes per stage", 20, {"stage": "upload"})
+    text = writer.render()
+    assert "# HELP sync_stage_bytes_total Bytes per stage" in text
+    assert _families(text) == {"sync_stage_bytes_total": {"type": "counter", "samples": {"sync_stage_bytes_total"}}}
+
+
+def test_gauge_and_histogram_samples_stay_in_their_family():
+    writer = OpenMetricsWriter()
+    writer.gauge("sync_success", "Whether the run succeeded", 1)
+    writer.histogram("sync_stage_seconds", "Stage durations", [0.2, 3.0], buckets=(1, 5), labels={"stage": "upload"})
+    families = _families(writer.render())
+    assert families["sync_success"] == {"type": "gauge", "samples": {"sync_success"}}
+    assert families["sync_stage_seconds"]["samples"] == {"sync_stage_seconds_bucket", "sync_stage_seconds_sum", "sync_stage_seconds_count"}
+    assert 'sync_stage_seconds_bucket{stage="upload",le="1"} 1' in writer.render()
+    assert writer.render().endswith("# EOF\n")
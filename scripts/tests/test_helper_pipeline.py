@@ -0,0 +1,110 @@
+import threading
+
+import pytest
+
+from helper_pipeline import Pipeline, StagingBudget, TransferBudget
+
+
+def test_items_pass_every_stage_in_order():
+    seen = []
+    with Pipeline([("double", lambda item: item * 2), ("collect", seen.append)]) as pipeline:
+        for item in range(5):
+            assert pipeline.submit(item)
+    assert seen == [0, 2, 4, 6, 8]
+
+
+def test_failure_drops_the_item_and_everything_queued_behind_it():
+    dropped = []
+    processed = []
+
+    def extract(item):
+        if item == 1:
+            raise ValueError("bad archive")
+        return item
+
+    submitted = []
+    pipeline = Pipeline([("download", lambda item: item), ("extract", extract), ("upload", processed.append)], queue_size=1, on_drop=dropped.append)
+    with pytest.raises(ValueError, match="bad archive"):
+        with pipeline:
+            for item in range(20):
+                if not pipeline.submit(item):
+                    break
+                submitted.append(item)
+    # Every item is either finished or handed to on_drop, exactly once.
+    assert sorted(processed + dropped) == submitted
+    assert 1 in dropped
+
+
+def test_failed_batch_drops_each_member():
+    dropped = []
+
+    def upload(batch):
+        raise OSError("connection lost")
+
+    pipeline = Pipeline([("prepare", lambda item: item), ("upload", upload, 1, 3, 0.2)], on_drop=dropped.append)
+    with pytest.raises(OSError):
+        with pipeline:
+            for item in range(3):
+                pipeline.submit(item)
+    assert sorted(dropped) == [0, 1, 2]
+
+
+def test_failing_drop_callback_is_reported():
+    def on_drop(item):
+        raise RuntimeError("cleanup failed")
+
+    pipeline = Pipeline([("stage", lambda item: 1 / 0)], on_drop=on_drop)
+    with pytest.raises(ZeroDivisionError):
+        with pipeline:
+            pipeline.submit(1)
+
+
+def test_transfer_budget_hands_back_uncommitted_slots():
+    budget = TransferBudget(2)
+    assert budget.acquire() and budget.acquire()
+    budget.release(False)
+    assert budget.acquire()
+    budget.release(True)
+    budget.release(True)
+    assert budget.committed == 2
+    assert not budget.acquire()
+    assert not budget.refused_by_budget
+
+
+def test_transfer_budget_refuses_what_overshoots_max_bytes():
+    budget = TransferBudget(None, max_bytes=100)
+    assert budget.acquire(size=60)
+    assert not budget.acquire(size=50)
+    assert budget.refused_by_budget
+    assert budget.acquire(size=40)
+    budget.release(True, 60)
+    budget.release(False, 40)
+    assert budget.committed_bytes == 60
+    assert budget.acquire(size=40)
+
+
+def test_transfer_budget_refuses_after_the_deadline():
+    budget = TransferBudget(None, deadline=0.0)
+    assert not budget.acquire(size=1)
+    assert budget.refused_by_budget
+
+
+def test_staging_budget_waits_for_released_games():
+    budget = StagingBudget(100)
+    assert budget.acquire("a", 70)
+    admitted = threading.Event()
+    thread = threading.Thread(target=lambda: budget.acquire("b", 50) and admitted.set())
+    thread.start()
+    assert not admitted.wait(0.2)
+    budget.release("a")
+    assert admitted.wait(2)
+    thread.join()
+    assert budget.in_use == 50 and budget.peak == 70
+
+
+def test_staging_budget_admits_an_oversized_game_alone():
+    budget = StagingBudget(100)
+    assert budget.acquire("huge", 500)
+    budget.release("huge")
+    budget.release("huge")  # a second release of the same game is a no-op
+    assert budget.in_use == 0 and budget.peak == 500
@@ -0,0 +1,52 @@
+import subprocess
+
+import pytest
+
+from helper_ssh import RemoteShell
+
+
+@pytest.fixture
+def shell():
+    session = RemoteShell(["sh"])
+    assert session.start(timeout=10), session.error
+    yield session
+    session.close()
+
+
+def test_commands_run_in_turn_with_their_own_status(shell):
+    assert shell.run("echo hello; echo oops >&2; exit 3") == (3, b"hello\n", b"oops\n")
+    assert shell.run("cd /; x=1") == (0, b"", b"")
+    # Each request gets its own sh -c: state does not leak into the next one.
+    assert shell.run('echo "x=$x"') == (0, b"x=\n", b"")
+    assert shell.run("if then")[0] != 0
+    assert shell.alive
+
+
+def test_binary_input_and_output_survive(shell):
+    payload = bytes(range(256)) * 64 + b"\nno trailing newline"
+    assert shell.run("cat", input=payload) == (0, payload, b"")
+    assert shell.run("cat", input=b"") == (0, b"", b"")
+
+
+def test_output_cannot_fake_a_header(shell):
+    forged = f"{shell._token} 0 0 0\n{shell._token}_IN\n".encode()
+    assert shell.run("cat", input=forged) == (0, forged, b"")
+    assert shell.run(f"printf '%s 0 0 0\\n' {shell._token}") == (0, f"{shell._token} 0 0 0\n".encode(), b"")
+    assert shell.run("echo still in sync") == (0, b"still in sync\n", b"")
+
+
+def test_timeout_kills_the_session(shell):
+    with pytest.raises(subprocess.TimeoutExpired):
+        shell.run("sleep 10", timeout=0.5)
+    assert not shell.alive
+    with pytest.raises(OSError):
+        shell.run("true")
+
+
+def test_a_session_that_never_answers_reports_why():
+    session = RemoteShell(["sh", "-c", "echo 'Password:' >&2; exec sleep 10"])
+    assert not session.start(timeout=0.5)
+    assert "no handshake" in session.error and "Password:" in session.error
+    session = RemoteShell(["sh", "-c", "echo 'Permission denied' >&2; exit 255"])
+    assert not session.start(timeout=5)
+    assert "Permission denied" in session.error
@@ -0,0 +1,52 @@
+import subprocess
+
+from helper_store import STORE_NAME, DedupPlan, dedup_control, dedup_script, plan_dedup
+
+FILES = {
+    "DATA.001": [100, 1, "aa"],
+    "DATA.002": [200, 1, "bb"],
+    "COPY.002": [200, 1, "bb"],
+    "NEW.BIN": [50, 1, "cc"],
+    "index.json": [10, 1, "aa"],
+    "UNHASHED": [5, 1, None],
+    "odd\nname": [7, 1, "aa"],
+}
+
+
+def test_plan_links_stored_and_seeded_content_and_stores_the_rest():
+    plan = plan_dedup(FILES, list(FILES), store={"aa": 100}, hash_locations={"bb": "other/DATA.002"})
+    assert plan.links == {"DATA.001": "aa", "DATA.002": "bb", "COPY.002": "bb"}
+    assert plan.seed == {"bb": "other/DATA.002"}
+    assert plan.adds == {"NEW.BIN": "cc"}
+    assert plan.saved_bytes == 500
+
+
+def test_second_copy_within_a_game_is_linked_to_the_first():
+    plan = plan_dedup(FILES, ["DATA.002", "COPY.002"], store={}, hash_locations={})
+    assert plan.adds == {"DATA.002": "bb"}
+    assert plan.links == {"COPY.002": "bb"}
+    assert plan.saved_bytes == 200
+
+
+def test_nothing_to_share():
+    plan = plan_dedup(FILES, ["NEW.BIN", "UNHASHED"], store={}, hash_locations={"cc": "bad\npath"})
+    assert plan == DedupPlan(adds={"NEW.BIN": "cc"})
+
+
+def test_control_files_and_script_link_through_the_store(tmp_path):
+    root = tmp_path / "data"
+    (root / "other").mkdir(parents=True)
+    (root / "other" / "DATA.002").write_bytes(b"b" * 200)
+    upload = root / "game.uploading"
+    (upload / "sub").mkdir(parents=True)
+    (upload / "NEW.BIN").write_bytes(b"c" * 50)
+    plan = DedupPlan(links={"sub/DATA.002": "bb", "COPY.BIN": "cc"}, seed={"bb": "other/DATA.002"}, adds={"NEW.BIN": "cc"})
+    for name, content in dedup_control(plan).items():
+        (upload / name).write_bytes(content)
+
+    subprocess.run(["sh", "-c", dedup_script()], cwd=upload, check=True)
+    store = root / STORE_NAME
+    assert sorted(path.name for path in store.iterdir()) == ["bb", "cc"]
+    assert (upload / "sub" / "DATA.002").stat().st_ino == (root / "other" / "DATA.002").stat().st_ino == (store / "bb").stat().st_ino
+    assert (upload / "COPY.BIN").stat().st_ino == (upload / "NEW.BIN").stat().st_ino
+    assert sorted(path.name for path in upload.iterdir()) == ["COPY.BIN", "NEW.BIN", "sub"]